@@ -1,18 +1,141 @@
 from django.contrib import admin
 """
 Configuration de l'interface d'administration Django
+
+Produits, commandes, lignes et paiements se comptent en millions de lignes :
+leurs listes doivent rester en temps constant (cf. AdminGrandeTable).
 """
 
+import json
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.contrib import messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+
+from .models import Utilisateur, Categorie, Produit, Commande, LigneCommande, Paiement, NotificationPaiement
+from .services_produit import ServiceProduit
+from .services_panier import ServiceCommande
+
+# Objets modifiés par transaction dans les actions en masse
+TAILLE_LOT_ACTIONS = 1000
+
+
+def estimer_nombre(queryset):
+    """
+    Nombre de lignes estimé par le planificateur (PostgreSQL), sans parcourir la table
+
+    Returns:
+        int ou None si la base ne fournit pas d'estimation
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PaginateurEstime(Paginator):
+    """
+    Paginateur des grandes tables : au-delà de SEUIL_ESTIMATION lignes
+    estimées, le nombre affiché est l'estimation au lieu d'un COUNT(*)
+    """
 
-from .models import Utilisateur, Categorie, Produit, Commande, LigneCommande, Paiement
+    SEUIL_ESTIMATION = 10000
+
+    @cached_property
+    def count(self):
+        estimation = estimer_nombre(self.object_list)
+        if estimation is None or estimation < self.SEUIL_ESTIMATION:
+            return super().count
+        return estimation
+
+
+def executer_par_lots(modeladmin, request, queryset, modifier, libelle):
+    """
+    Appliquer une action en masse aux objets sélectionnés, lot par lot, puis afficher son bilan
+
+    Les ids sont parcourus par clé croissante (pas d'OFFSET, mémoire constante)
+    et chaque lot est une transaction : une sélection de centaines de milliers
+    de lignes ne verrouille pas toute la table d'un coup.
+
+    Args:
+        modifier: Fonction (liste d'ids) -> nombre de lignes modifiées, un UPDATE
+        libelle: Nom de l'action dans le bilan
+
+    Raises:
+        ValidationError: Levée par ``modifier`` (au premier lot, rien n'est modifié)
+    """
+    debut = time.perf_counter()
+    selectionnes = modifies = lots = 0
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    dernier = None
+    while True:
+        lot = list((ids if dernier is None else ids.filter(pk__gt=dernier))[:TAILLE_LOT_ACTIONS])
+        if not lot:
+            break
+        with transaction.atomic():
+            modifies += modifier(lot)
+        selectionnes += len(lot)
+        lots += 1
+        dernier = lot[-1]
+
+    duree = time.perf_counter() - debut
+    bilan = f"{libelle} : {modifies} ligne(s) modifiée(s) sur {selectionnes} sélectionnée(s)"
+    ignores = selectionnes - modifies
+    if ignores:
+        bilan += f", {ignores} ignorée(s) (statut ou rôle incompatible)"
+    modeladmin.message_user(
+        request,
+        f"{bilan} — {lots} lot(s) en {duree:.2f}s",
+        messages.WARNING if ignores else messages.SUCCESS,
+    )
+
+
+class AdminGrandeTable(admin.ModelAdmin):
+    """
+    Base des ModelAdmin des tables volumineuses
+
+    - nombre de résultats estimé et pas de second COUNT(*) de la table entière ;
+    - clés étrangères saisies par autocomplétion (autocomplete_fields) plutôt
+      que par une liste déroulante de toute la table liée ;
+    - recherche servie par des index : un terme numérique est cherché par
+      égalité sur ``champ_recherche_id``, les autres par préfixe (sensible à la
+      casse) sur des colonnes indexées (search_fields en ``__startswith``).
+    """
+
+    paginator = PaginateurEstime
+    show_full_result_count = False
+    champ_recherche_id = 'pk'
+
+    def get_search_results(self, request, queryset, search_term):
+        terme = search_term.strip()
+        # isdigit() accepte '²' et int() ne borne rien : on s'en tient aux ids possibles
+        if re.fullmatch(r'\d{1,18}', terme, re.ASCII):
+            return queryset.filter(**{self.champ_recherche_id: int(terme)}), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 @admin.register(Utilisateur)
-class UtilisateurAdmin(admin.ModelAdmin):
+class UtilisateurAdmin(AdminGrandeTable):
     list_display = ('username', 'email', 'role', 'first_name', 'last_name', 'nom_boutique')
     list_filter = ('role', 'is_active', 'is_staff')
-    search_fields = ('username', 'email', 'first_name', 'last_name', 'nom_boutique')
+    # Sert aussi l'autocomplétion des vendeurs et des clients
+    search_fields = ('username__startswith', 'email__startswith', 'nom_boutique__startswith')
     ordering = ('-date_joined',)
+    actions = ('desactiver_vendeurs',)
+
+    @admin.action(description="Désactiver les vendeurs sélectionnés", permissions=('change',))
+    def desactiver_vendeurs(self, request, queryset):
+        # Les comptes d'administration ne sont jamais désactivés par lot
+        executer_par_lots(self, request, queryset, lambda ids: Utilisateur.objects.filter(
+            id__in=ids, role='VENDEUR', is_active=True, is_staff=False, is_superuser=False
+        ).update(is_active=False), "Désactivation")
 
 
 @admin.register(Categorie)
@@ -22,13 +145,25 @@ class CategorieAdmin(admin.ModelAdmin):
     ordering = ('nom',)
 
 
+class RevisionPrixForm(ActionForm):
+    pourcentage = forms.DecimalField(
+        label="Variation (%)", required=False, max_digits=5, decimal_places=2,
+        help_text="Révision des prix : 10 pour +10 %, -5 pour -5 %"
+    )
+
+
 @admin.register(Produit)
-class ProduitAdmin(admin.ModelAdmin):
-    list_display = ('nom', 'vendeur', 'categorie', 'prix', 'quantite', 'date_ajout')
+class ProduitAdmin(AdminGrandeTable):
+    list_display = ('nom', 'vendeur', 'categorie', 'prix', 'quantite', 'vues', 'date_ajout')
+    list_select_related = ('vendeur', 'categorie')
     list_filter = ('categorie', 'date_ajout')
-    search_fields = ('nom', 'description', 'vendeur__username')
-    readonly_fields = ('date_ajout',)
+    search_fields = ('nom__startswith',)
+    autocomplete_fields = ('vendeur',)
+    readonly_fields = ('date_ajout', 'vues')
     ordering = ('-date_ajout',)
+    # Révision d'une catégorie : filtrer par catégorie, « tout sélectionner », puis l'action
+    actions = ('reviser_prix',)
+    action_form = RevisionPrixForm
     
     fieldsets = (
         ('Informations générales', {
@@ -40,36 +175,91 @@ class ProduitAdmin(admin.ModelAdmin):
         ('Prix et stock', {
             'fields': ('prix', 'quantite')
         }),
-        ('Dates', {
-            'fields': ('date_ajout',)
+        ('Dates et audience', {
+            'fields': ('date_ajout', 'vues')
         }),
     )
 
+    @admin.action(description="Réviser les prix (variation en %%)", permissions=('change',))
+    def reviser_prix(self, request, queryset):
+        try:
+            pourcentage = Decimal(request.POST.get('pourcentage') or '0')
+            executer_par_lots(
+                self, request, queryset,
+                lambda ids: ServiceProduit.reviser_prix(ids, pourcentage),
+                f"Prix révisés de {pourcentage:+} %"
+            )
+        except InvalidOperation:
+            self.message_user(request, "Variation invalide", messages.ERROR)
+        except ValidationError as e:
+            self.message_user(request, " ".join(e.messages), messages.ERROR)
+
 
 @admin.register(Commande)
-class CommandeAdmin(admin.ModelAdmin):
+class CommandeAdmin(AdminGrandeTable):
     list_display = ('id', 'client', 'statut', 'montant_total', 'date_commande')
     list_filter = ('statut', 'date_commande')
-    search_fields = ('client__username', 'client__email')
+    search_fields = ('client__username__startswith',)
+    autocomplete_fields = ('client',)
     readonly_fields = ('date_commande',)
     ordering = ('-date_commande',)
+    actions = ('marquer_payees', 'marquer_livrees')
+
+    @admin.action(description="Marquer payées (commandes en attente, hors paiement en ligne)", permissions=('change',))
+    def marquer_payees(self, request, queryset):
+        executer_par_lots(
+            self, request, queryset,
+            lambda ids: ServiceCommande.changer_statut_en_masse(ids, 'PAYEE'), "Commandes payées"
+        )
+
+    @admin.action(description="Marquer livrées (commandes expédiées)", permissions=('change',))
+    def marquer_livrees(self, request, queryset):
+        executer_par_lots(
+            self, request, queryset,
+            lambda ids: ServiceCommande.changer_statut_en_masse(ids, 'LIVREE'), "Commandes livrées"
+        )
+
+    def get_queryset(self, request):
+        # __str__ affiche le client : la liste, l'autocomplétion et les confirmations
+        # en ont besoin (list_select_related est ignoré quand get_queryset joint déjà)
+        return super().get_queryset(request).select_related('client')
 
 
 @admin.register(LigneCommande)
-class LigneCommandeAdmin(admin.ModelAdmin):
+class LigneCommandeAdmin(AdminGrandeTable):
     list_display = ('commande', 'produit', 'quantite', 'prix_unitaire')
-    search_fields = ('produit__nom', 'commande__client__username')
+    search_fields = ('produit__nom__startswith',)
+    autocomplete_fields = ('commande', 'produit')
+    # Un numéro recherché est celui de la commande
+    champ_recherche_id = 'commande_id'
+
+    def get_queryset(self, request):
+        # __str__ de la ligne (produit) et de sa commande (client), partout dans l'admin
+        return super().get_queryset(request).select_related('commande__client', 'produit')
 
 
 @admin.register(Paiement)
-class PaiementAdmin(admin.ModelAdmin):
+class PaiementAdmin(AdminGrandeTable):
     list_display = ('reference', 'commande', 'client', 'montant', 'mode_paiement', 'statut', 'date_paiement')
+    list_select_related = ('commande__client', 'client')
     list_filter = ('statut', 'mode_paiement', 'date_paiement')
-    search_fields = ('reference', 'client__username')
-    readonly_fields = ('date_paiement',)
+    search_fields = ('reference__startswith', 'reference_passerelle__startswith')
+    autocomplete_fields = ('commande', 'client')
+    champ_recherche_id = 'commande_id'
+    readonly_fields = ('date_paiement', 'date_mise_a_jour')
     ordering = ('-date_paiement',)
 
 
+@admin.register(NotificationPaiement)
+class NotificationPaiementAdmin(AdminGrandeTable):
+    list_display = ('identifiant', 'passerelle', 'reference', 'statut', 'resultat', 'date_reception')
+    list_filter = ('resultat', 'passerelle', 'statut')
+    search_fields = ('reference__startswith',)
+    autocomplete_fields = ('paiement',)
+    readonly_fields = ('date_reception',)
+    ordering = ('-date_reception',)
+
+
 # Personnalisation de l'interface admin
 admin.site.site_header = "Administration e_agri"
 admin.site.site_title = "e_agri Admin"
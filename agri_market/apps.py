@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AgriMarketConfig(AppConfig):
     name = 'agri_market'
+
+    def ready(self):
+        from . import signals  # noqa: F401
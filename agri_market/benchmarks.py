@@ -0,0 +1,297 @@
+"""
+Outils de mesure partagés par les commandes bench_*
+
+Une mesure exécute une opération plusieurs fois et relève, pour chaque
+itération, la durée et le nombre de requêtes SQL. Les allocations mémoire
+(tracemalloc) sont mesurées dans une passe séparée et plus courte, pour ne
+pas fausser les durées. Les résultats peuvent être enregistrés comme
+référence JSON puis comparés à une exécution ultérieure.
+"""
+
+import json
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from statistics import mean, median
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from . import metriques
+from .budget_requetes import RapportRequetes
+
+
+class _Annulation(Exception):
+    """Annule la transaction d'un bloc de mesure"""
+
+
+@contextmanager
+def donnees_temporaires():
+    """Bloc transactionnel dont toutes les écritures sont annulées à la sortie"""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Annulation
+    except _Annulation:
+        pass
+
+
+@contextmanager
+def environnement_de_mesure():
+    """
+    Préparer l'exécution de requêtes hors serveur (hôte 'testserver', DEBUG désactivé)
+
+    La vérification des budgets de requêtes est désactivée, comme en production,
+    et les métriques des requêtes mesurées restent hors du répertoire de production.
+    """
+    try:
+        setup_test_environment(debug=False)
+        prepare = True
+    except RuntimeError:
+        # Déjà préparé : exécution depuis la suite de tests
+        prepare = False
+
+    try:
+        with override_settings(BUDGET_REQUETES_MODE=''), metriques.isoler():
+            yield
+    finally:
+        if prepare:
+            teardown_test_environment()
+
+
+def percentile(valeurs, p):
+    """
+    Percentile par interpolation linéaire
+
+    Args:
+        valeurs: Liste de nombres (non vide)
+        p: Percentile entre 0 et 100
+
+    Returns:
+        float: Valeur du percentile
+    """
+    triees = sorted(valeurs)
+    if len(triees) == 1:
+        return float(triees[0])
+    position = (len(triees) - 1) * p / 100
+    bas = int(position)
+    haut = min(bas + 1, len(triees) - 1)
+    return triees[bas] + (triees[haut] - triees[bas]) * (position - bas)
+
+
+class Mesure:
+    """Relevés d'une opération mesurée"""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.durees = []
+        self.requetes = []
+        self.allocations = []
+
+    def resume(self):
+        """
+        Synthèse sérialisable de la mesure
+
+        Returns:
+            dict: iterations, p50_ms, p95_ms, p99_ms, moyenne_ms, requetes, allocations_ko
+        """
+        durees_ms = [duree * 1000 for duree in self.durees]
+        return {
+            'iterations': len(durees_ms),
+            'p50_ms': round(percentile(durees_ms, 50), 3),
+            'p95_ms': round(percentile(durees_ms, 95), 3),
+            'p99_ms': round(percentile(durees_ms, 99), 3),
+            'moyenne_ms': round(mean(durees_ms), 3),
+            'requetes': max(self.requetes),
+            'allocations_ko': round(median(self.allocations) / 1024, 1) if self.allocations else None,
+        }
+
+
+def _executer(operation, preparer, isoler):
+    """Exécuter une itération ; renvoie (durée, nombre de requêtes, résultat)"""
+    rapport = RapportRequetes()
+    try:
+        with transaction.atomic():
+            if preparer:
+                preparer()
+            with rapport.capturer():
+                debut = time.perf_counter()
+                resultat = operation()
+                duree = time.perf_counter() - debut
+            if isoler:
+                raise _Annulation
+    except _Annulation:
+        pass
+    return duree, rapport.total, resultat
+
+
+def mesurer(nom, operation, iterations=30, echauffement=3, allocations=5, preparer=None, isoler=True):
+    """
+    Mesurer une opération
+
+    Args:
+        nom: Nom de la mesure
+        operation: Fonction sans argument à mesurer
+        iterations: Nombre d'itérations chronométrées
+        echauffement: Itérations préalables non comptées (caches, connexions)
+        allocations: Itérations supplémentaires sous tracemalloc (0 pour désactiver)
+        preparer: Fonction appelée avant chaque itération, hors chronométrage
+        isoler: Annuler les écritures de chaque itération (transaction annulée)
+
+    Returns:
+        Mesure: Les relevés
+    """
+    mesure = Mesure(nom)
+
+    for _ in range(echauffement):
+        _executer(operation, preparer, isoler)
+
+    for _ in range(iterations):
+        duree, nb_requetes, _ = _executer(operation, preparer, isoler)
+        mesure.durees.append(duree)
+        mesure.requetes.append(nb_requetes)
+
+    if allocations:
+        deja_actif = tracemalloc.is_tracing()
+        if not deja_actif:
+            tracemalloc.start()
+        try:
+            for _ in range(allocations):
+                tracemalloc.reset_peak()
+                depart = tracemalloc.get_traced_memory()[0]
+                _executer(operation, preparer, isoler)
+                mesure.allocations.append(tracemalloc.get_traced_memory()[1] - depart)
+        finally:
+            if not deja_actif:
+                tracemalloc.stop()
+
+    return mesure
+
+
+def contexte_execution(**extra):
+    """Informations d'environnement enregistrées avec une référence"""
+    return dict({
+        'date': timezone.now().isoformat(),
+        'moteur': connection.vendor,
+        'python': platform.python_version(),
+        'machine': platform.node(),
+    }, **extra)
+
+
+def enregistrer_reference(chemin, resultats, contexte):
+    """Écrire les résultats dans un fichier JSON de référence"""
+    with open(chemin, 'w', encoding='utf-8') as fichier:
+        json.dump({'contexte': contexte, 'resultats': resultats}, fichier, indent=2, ensure_ascii=False)
+
+
+def charger_reference(chemin):
+    """Lire un fichier JSON de référence"""
+    with open(chemin, encoding='utf-8') as fichier:
+        return json.load(fichier)
+
+
+def comparer(resultats, reference, tolerance=0.25, plancher_ms=1.0):
+    """
+    Comparer des résultats à une référence
+
+    Une mesure régresse si son p50 ou son p95 dépasse la référence de plus
+    de ``tolerance`` (et d'au moins ``plancher_ms``, pour ignorer le bruit des
+    opérations très rapides), ou si elle exécute davantage de requêtes SQL.
+
+    Args:
+        resultats: dict nom -> résumé (cf. Mesure.resume)
+        reference: dict nom -> résumé de référence
+        tolerance: Dégradation relative tolérée (0.25 = 25 %)
+        plancher_ms: Écart absolu minimal pour signaler une régression de durée
+
+    Returns:
+        list: Descriptions des régressions (vide si aucune)
+    """
+    regressions = []
+    for nom, actuel in resultats.items():
+        ancien = reference.get(nom)
+        if ancien is None:
+            continue
+
+        for cle in ('p50_ms', 'p95_ms'):
+            limite = ancien[cle] * (1 + tolerance)
+            if actuel[cle] > limite and actuel[cle] - ancien[cle] >= plancher_ms:
+                regressions.append(
+                    f"{nom} : {cle} {actuel[cle]:.1f} > {ancien[cle]:.1f} (+{tolerance:.0%} toléré)"
+                )
+
+        if actuel['requetes'] > ancien['requetes']:
+            regressions.append(f"{nom} : {actuel['requetes']} requêtes SQL au lieu de {ancien['requetes']}")
+
+    return regressions
+
+
+def tableau(resultats, reference=None):
+    """
+    Mise en forme texte des résultats
+
+    Returns:
+        str: Tableau aligné, avec la variation du p95 si une référence est fournie
+    """
+    lignes = [
+        f"{'mesure':<32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'SQL':>5} {'alloc Ko':>9}"
+        + ('   p95 réf.' if reference else '')
+    ]
+    for nom, r in resultats.items():
+        allocations = '-' if r['allocations_ko'] is None else f"{r['allocations_ko']:.1f}"
+        ligne = (
+            f"{nom:<32} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+            f"{r['requetes']:>5} {allocations:>9}"
+        )
+        if reference and nom in reference and reference[nom]['p95_ms']:
+            variation = r['p95_ms'] / reference[nom]['p95_ms'] - 1
+            ligne += f"   {variation:+.0%}"
+        lignes.append(ligne)
+    return '\n'.join(lignes)
+
+
+def ajouter_arguments(parser):
+    """Options communes aux commandes bench_* (itérations, référence JSON)"""
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--echauffement', type=int, default=3)
+    parser.add_argument(
+        '--allocations', type=int, default=5,
+        help="Itérations mesurées sous tracemalloc (0 pour désactiver)",
+    )
+    parser.add_argument('--sortie', help="Enregistrer les résultats comme référence JSON")
+    parser.add_argument('--reference', help="Référence JSON à laquelle comparer les résultats")
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help="Dégradation relative tolérée avant d'échouer (0.25 = 25 %%)",
+    )
+
+
+def conclure(commande, resultats, contexte, options):
+    """
+    Afficher les résultats, enregistrer la référence et comparer à l'ancienne
+
+    Raises:
+        CommandError: Si une régression est détectée par rapport à --reference
+    """
+    reference = charger_reference(options['reference']) if options['reference'] else None
+    anciens = reference['resultats'] if reference else None
+    commande.stdout.write(tableau(resultats, anciens))
+
+    if options['sortie']:
+        enregistrer_reference(options['sortie'], resultats, contexte)
+        commande.stdout.write(commande.style.SUCCESS(f"Référence enregistrée dans {options['sortie']}"))
+
+    if reference:
+        if reference['contexte'].get('moteur') != contexte['moteur']:
+            commande.stdout.write(commande.style.WARNING(
+                f"Référence mesurée sur {reference['contexte'].get('moteur')}, "
+                f"exécution sur {contexte['moteur']}"
+            ))
+        regressions = comparer(resultats, anciens, options['tolerance'])
+        if regressions:
+            raise CommandError("Régressions détectées :\n  " + "\n  ".join(regressions))
+        commande.stdout.write(commande.style.SUCCESS("Aucune régression par rapport à la référence"))
@@ -0,0 +1,168 @@
+"""
+Budgets de requêtes SQL par vue
+
+Chaque vue (nom d'URL) déclare un nombre maximum de requêtes et de
+requêtes dupliquées (même SQL exécuté plusieurs fois, signature typique
+d'un N+1). Les budgets sont vérifiés :
+- à l'exécution par BudgetRequetesMiddleware (mode 'log' ou 'raise') ;
+- dans les tests par BudgetRequetesMixin.
+
+Les budgets comptent la session et l'utilisateur connecté. Ils peuvent
+être surchargés par vue via le réglage BUDGETS_REQUETES.
+"""
+
+import logging
+import sys
+from contextlib import ExitStack, contextmanager
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+# Nom d'URL -> (requêtes maximum, doublons maximum)
+BUDGETS_PAR_DEFAUT = {
+    'home': (5, 0),
+    'liste_produits': (6, 0),
+    'detail_produit': (4, 0),
+    'voir_panier': (7, 0),
+    'ajouter_au_panier': (11, 1),
+    'valider_commande': (12, 1),
+    'mes_commandes': (7, 0),
+    'mes_produits': (4, 0),
+    'commandes_vendeur': (8, 0),
+    'statistiques_vendeur': (6, 0),
+    # Le COUNT(*) de pagination des vendeurs et celui des clients ne diffèrent que par le rôle
+    'dashboard_admin': (14, 1),
+    'ajuster_stocks_ajax': (4, 0),
+    'notification_paiement': (4, 0),
+}
+
+# Instructions de gestion de transaction, exclues des décomptes
+_PREFIXES_IGNORES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class DepassementBudget(AssertionError):
+    """Une vue a dépassé son budget de requêtes"""
+
+
+def obtenir_budget(vue):
+    """
+    Budget déclaré pour une vue
+
+    Args:
+        vue: Nom d'URL
+
+    Returns:
+        tuple: (requêtes maximum, doublons maximum) ou None si la vue n'a pas de budget
+    """
+    budgets = dict(BUDGETS_PAR_DEFAUT)
+    budgets.update(getattr(settings, 'BUDGETS_REQUETES', {}))
+    return budgets.get(vue)
+
+
+class RapportRequetes:
+    """Requêtes SQL exécutées pendant une capture (toutes connexions)"""
+
+    def __init__(self):
+        self.requetes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(_PREFIXES_IGNORES):
+            self.requetes.append(sql)
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def capturer(self):
+        """Enregistrer les requêtes exécutées dans le bloc"""
+        with ExitStack() as pile:
+            for connexion in connections.all():
+                pile.enter_context(connexion.execute_wrapper(self))
+            yield self
+
+    @property
+    def total(self):
+        return len(self.requetes)
+
+    @property
+    def doublons(self):
+        """Nombre d'exécutions répétées d'un même SQL (paramètres exclus)"""
+        return sum(n - 1 for n in Counter(self.requetes).values() if n > 1)
+
+    def plus_repetees(self, limite=3):
+        """Requêtes les plus répétées, pour le diagnostic"""
+        return [(sql, n) for sql, n in Counter(self.requetes).most_common(limite) if n > 1]
+
+
+def verifier_budget(vue, rapport):
+    """
+    Comparer un rapport au budget de la vue
+
+    Returns:
+        str: Description du dépassement, ou '' si le budget est respecté
+    """
+    budget = obtenir_budget(vue)
+    if budget is None:
+        return ''
+
+    max_requetes, max_doublons = budget
+    if rapport.total <= max_requetes and rapport.doublons <= max_doublons:
+        return ''
+
+    details = ''.join(f"\n  x{n} {sql[:200]}" for sql, n in rapport.plus_repetees())
+    return (
+        f"Budget de requêtes dépassé pour '{vue}' : "
+        f"{rapport.total} requête(s) (max {max_requetes}), "
+        f"{rapport.doublons} doublon(s) (max {max_doublons}){details}"
+    )
+
+
+class BudgetRequetesMixin:
+    """
+    Mixin de TestCase pour vérifier les budgets de requêtes des vues
+
+    Un récapitulatif des vues mesurées est affiché à la fin de chaque classe de tests.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._mesures_budget = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._mesures_budget:
+            lignes = [f"\nBudgets de requêtes ({cls.__name__}) :"]
+            for vue, total, doublons, budget in cls._mesures_budget:
+                lignes.append(
+                    f"  {vue:<24} {total:>3} requête(s) / {budget[0]:<3} "
+                    f"{doublons:>2} doublon(s) / {budget[1]}"
+                )
+            sys.stderr.write('\n'.join(lignes) + '\n')
+        super().tearDownClass()
+
+    def assertBudgetRequetes(self, vue, appel):
+        """
+        Exécuter ``appel`` et vérifier que la vue respecte son budget
+
+        Args:
+            vue: Nom d'URL dont le budget s'applique
+            appel: Fonction sans argument (typiquement un appel au client de test)
+
+        Returns:
+            Le résultat de ``appel``
+        """
+        budget = obtenir_budget(vue)
+        self.assertIsNotNone(budget, f"Aucun budget déclaré pour '{vue}'")
+
+        rapport = RapportRequetes()
+        with rapport.capturer():
+            resultat = appel()
+
+        self._mesures_budget.append((vue, rapport.total, rapport.doublons, budget))
+        message = verifier_budget(vue, rapport)
+        if message:
+            self.fail(message)
+        return resultat
@@ -0,0 +1,104 @@
+"""
+Compteur de consultations des pages produit, tamponné par processus
+
+Écrire en base à chaque consultation ajouterait une écriture à la page la plus
+lue du site et ferait se disputer le verrou de ligne des produits en vogue.
+Chaque processus additionne donc ses consultations en mémoire et les écrit
+par lots (UPDATE produit SET vues = vues + n) lors de la première
+consultation qui suit VUES_INTERVALLE_VIDAGE secondes, ou plus tôt si le
+tampon dépasse VUES_TAMPON_MAX produits.
+
+Les consultations pas encore écrites d'un processus qui s'arrête sont
+perdues (quelques secondes de trafic) : ce compteur sert au classement des
+produits, pas à la facturation.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+
+from .models import Produit
+
+logger = logging.getLogger(__name__)
+
+
+class TamponVues:
+    """Consultations du processus courant non encore écrites en base"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._vues = defaultdict(int)
+        self._dernier_vidage = time.monotonic()
+
+    def enregistrer(self, produit_id):
+        """
+        Compter une consultation (mémoire seulement)
+
+        Returns:
+            bool: True si le tampon doit être vidé
+        """
+        with self._verrou:
+            self._vues[produit_id] += 1
+            return (
+                len(self._vues) >= getattr(settings, 'VUES_TAMPON_MAX', 1000)
+                or time.monotonic() - self._dernier_vidage >= getattr(settings, 'VUES_INTERVALLE_VIDAGE', 10)
+            )
+
+    def vider(self):
+        """
+        Écrire les consultations accumulées : un UPDATE par incrément distinct
+
+        Returns:
+            int: Nombre de produits mis à jour
+        """
+        with self._verrou:
+            vues, self._vues = self._vues, defaultdict(int)
+            self._dernier_vidage = time.monotonic()
+        if not vues:
+            return 0
+
+        # Le plus souvent quelques incréments distincts (1, 2, 3...) : autant de requêtes
+        par_increment = defaultdict(list)
+        for produit_id, nombre in vues.items():
+            par_increment[nombre].append(produit_id)
+
+        ecrits = 0
+        try:
+            for nombre, produit_ids in sorted(par_increment.items()):
+                Produit.objects.filter(id__in=sorted(produit_ids)).update(vues=F('vues') + nombre)
+                for produit_id in produit_ids:
+                    del vues[produit_id]
+                ecrits += len(produit_ids)
+        except DatabaseError:
+            # Base indisponible ou interblocage : ces consultations repartent au prochain vidage
+            logger.warning("Écriture de %s compteur(s) de vues reportée", len(vues), exc_info=True)
+            with self._verrou:
+                for produit_id, nombre in vues.items():
+                    self._vues[produit_id] += nombre
+        return ecrits
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._vues.clear()
+            self._dernier_vidage = time.monotonic()
+
+
+tampon = TamponVues()
+
+
+def compter_vue(produit_id):
+    """Compter une consultation ; vide le tampon quand il est temps"""
+    if tampon.enregistrer(produit_id):
+        tampon.vider()
+
+
+async def acompter_vue(produit_id):
+    """compter_vue pour les vues async : seul le vidage (SQL) passe par un thread"""
+    if tampon.enregistrer(produit_id):
+        await sync_to_async(tampon.vider)()
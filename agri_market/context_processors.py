@@ -2,7 +2,8 @@
 Context processors pour rendre des données disponibles dans tous les templates
 """
 
-from .models import Commande
+from .models import LigneCommande
+from . import mise_en_cache
 
 
 def panier_count(request):
@@ -14,13 +15,15 @@ def panier_count(request):
     if request.user.is_authenticated and hasattr(request.user, 'role'):
         if request.user.role == 'CLIENT':
             try:
-                panier = Commande.objects.filter(
-                    client=request.user,
-                    statut='PANIER'
-                ).prefetch_related('lignes').first()
-                
-                if panier:
-                    count = panier.lignes.count()
+                # Invalidé par ServicePanier à chaque modification du panier
+                count = mise_en_cache.obtenir_ou_calculer(
+                    'panier',
+                    (request.user.id,),
+                    lambda: LigneCommande.objects.filter(
+                        commande__client=request.user,
+                        commande__statut='PANIER'
+                    ).count()
+                )
             except:
                 pass
     
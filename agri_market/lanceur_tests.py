@@ -0,0 +1,33 @@
+"""
+Lanceur de la suite de tests (réglage TEST_RUNNER)
+
+Identique au lanceur de Django, si ce n'est que :
+- les métriques écrites pendant les tests vont dans un répertoire temporaire,
+  supprimé en fin d'exécution ;
+- les fichiers statiques sont servis sans manifeste : la suite ne dépend ni
+  de STATIC_MANIFESTE ni d'un collectstatic préalable.
+"""
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from . import metriques
+
+
+class LanceurTests(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolation = ExitStack()
+        self._isolation.enter_context(metriques.isoler())
+        self._isolation.enter_context(override_settings(STORAGES=dict(
+            settings.STORAGES,
+            staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        )))
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolation.close()
+        super().teardown_test_environment(**kwargs)
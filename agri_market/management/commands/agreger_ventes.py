@@ -0,0 +1,43 @@
+"""
+Mise à jour incrémentale des agrégats journaliers de ventes
+
+Usage:
+    python manage.py agreger_ventes
+    python manage.py agreger_ventes --jour 2026-01-15
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from agri_market.services_statistiques import ServiceAgregationVentes
+
+
+class Command(BaseCommand):
+    help = "Met à jour les agrégats de ventes (jour × vendeur × catégorie × statut)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jour',
+            help="Reconstruire uniquement ce jour (AAAA-MM-JJ)",
+        )
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+
+        if options['jour']:
+            jour = parse_date(options['jour'])
+            if jour is None:
+                raise CommandError("Format de date attendu : AAAA-MM-JJ")
+            nb_lignes = ServiceAgregationVentes.recalculer_jour(jour)
+            self.stdout.write(self.style.SUCCESS(
+                f"{jour} reconstruit : {nb_lignes} ligne(s) d'agrégat"
+            ))
+            return
+
+        jours = ServiceAgregationVentes.mettre_a_jour()
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(jours)} jour(s) recalculé(s) en {duree:.2f}s"
+        ))
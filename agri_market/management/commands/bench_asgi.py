@@ -0,0 +1,207 @@
+"""
+Débit des pages du catalogue : WSGI (vues synchrones) contre ASGI (vues async)
+
+Les deux déploiements sont reproduits dans le processus :
+- WSGI : WSGIHandler, URLconf e_agri.urls, un thread par requête simultanée ;
+- ASGI : ASGIHandler, URLconf e_agri.urls_async, des coroutines concurrentes
+  dans une seule boucle d'événements.
+
+La colonne « connexions » compte les connexions à la base ouvertes : sous
+ASGI, Django 4.2 exécute le SQL de chaque requête dans un thread qui lui est
+propre, ce qui empêche la réutilisation des connexions persistantes.
+
+Usage:
+    python manage.py bench_asgi
+    python manage.py bench_asgi --concurrence 32 --requetes 2000
+    python manage.py bench_asgi --chemins "/produits/?categorie=3" /produit/12/
+"""
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from agri_market import benchmarks
+from agri_market.models import Produit
+
+
+class Command(BaseCommand):
+    help = "Compare le débit des pages du catalogue sous WSGI (vues sync) et ASGI (vues async)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chemins', nargs='*', help="Pages mesurées (défaut : détail produit et recherche)")
+        parser.add_argument('--concurrence', type=int, default=8, help="Requêtes simultanées")
+        parser.add_argument('--requetes', type=int, default=400, help="Requêtes par page et par mode")
+
+    def handle(self, *args, **options):
+        chemins = options['chemins'] or self._chemins_par_defaut()
+        self.factory = RequestFactory()
+
+        lignes = []
+        with benchmarks.environnement_de_mesure():
+            for chemin in map(urlsplit, chemins):
+                with override_settings(ROOT_URLCONF='e_agri.urls'):
+                    wsgi = self._mesurer_wsgi(chemin, options['concurrence'], options['requetes'])
+                with override_settings(ROOT_URLCONF='e_agri.urls_async'):
+                    asgi = asyncio.run(self._mesurer_asgi(chemin, options['concurrence'], options['requetes']))
+                lignes.append((self._libelle(chemin), 'WSGI', *wsgi))
+                lignes.append((self._libelle(chemin), 'ASGI', *asgi))
+
+        self.stdout.write(f"{options['requetes']} requêtes par mode, {options['concurrence']} simultanées")
+        self.stdout.write(
+            f"{'page':<36} {'mode':<5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'connexions':>11}"
+        )
+        for libelle, mode, debit, p50, p95, nb_connexions in lignes:
+            self.stdout.write(
+                f"{libelle:<36} {mode:<5} {debit:>9.1f} {p50:>9.2f} {p95:>9.2f} {nb_connexions:>11}"
+            )
+
+    def _chemins_par_defaut(self):
+        produit = Produit.objects.order_by('id').first()
+        if produit is None:
+            raise CommandError(
+                "Jeu de données insuffisant : lancez d'abord 'python manage.py generer_donnees'"
+            )
+        return [
+            reverse('detail_produit', args=[produit.id]),
+            f"{reverse('liste_produits')}?recherche={produit.nom.split()[0]}",
+        ]
+
+    @staticmethod
+    def _libelle(chemin):
+        return f"{chemin.path}{'?' + chemin.query if chemin.query else ''}"[:36]
+
+    @staticmethod
+    def _resultat(durees, erreurs, duree_totale, nb_connexions):
+        """(requêtes/s, p50 ms, p95 ms, connexions ouvertes)"""
+        if erreurs:
+            raise CommandError(f"{len(erreurs)} réponse(s) en erreur (HTTP {erreurs[0]})")
+        return (
+            len(durees) / duree_totale,
+            benchmarks.percentile(durees, 50) * 1000,
+            benchmarks.percentile(durees, 95) * 1000,
+            nb_connexions,
+        )
+
+    def _compter_connexions(self):
+        compteur = [0]
+        verrou = threading.Lock()
+
+        def compter(sender, connection, **kwargs):
+            with verrou:
+                compteur[0] += 1
+
+        connection_created.connect(compter, weak=False)
+        return compteur, lambda: connection_created.disconnect(compter)
+
+    # -------- WSGI --------
+
+    def _mesurer_wsgi(self, chemin, concurrence, nb_requetes):
+        handler = WSGIHandler()
+        self._requete_wsgi(handler, chemin)  # gabarits et caches hors mesure
+
+        verrou = threading.Lock()
+        durees, erreurs = [], []
+
+        def worker(nombre):
+            try:
+                for _ in range(nombre):
+                    debut = time.perf_counter()
+                    code = self._requete_wsgi(handler, chemin)
+                    duree = time.perf_counter() - debut
+                    with verrou:
+                        durees.append(duree)
+                        if code >= 400:
+                            erreurs.append(code)
+            finally:
+                connections.close_all()
+
+        parts = [nb_requetes // concurrence + (i < nb_requetes % concurrence) for i in range(concurrence)]
+        threads = [threading.Thread(target=worker, args=(part,)) for part in parts]
+
+        compteur, deconnecter = self._compter_connexions()
+        try:
+            debut = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duree_totale = time.perf_counter() - debut
+        finally:
+            deconnecter()
+        return self._resultat(durees, erreurs, duree_totale, compteur[0])
+
+    def _requete_wsgi(self, handler, chemin):
+        environ = self.factory.get(chemin.path, QUERY_STRING=chemin.query).environ
+        statut = []
+        reponse = handler(environ, lambda status, headers, *args: statut.append(status))
+        try:
+            for _ in reponse:
+                pass
+        finally:
+            reponse.close()
+        return int(statut[0].split()[0])
+
+    # -------- ASGI --------
+
+    async def _mesurer_asgi(self, chemin, concurrence, nb_requetes):
+        handler = ASGIHandler()
+        await self._requete_asgi(handler, chemin)
+
+        durees, erreurs = [], []
+        restantes = [nb_requetes]
+
+        async def worker():
+            # Une seule boucle d'événements : le décompte partagé n'a pas besoin de verrou
+            while restantes[0] > 0:
+                restantes[0] -= 1
+                debut = time.perf_counter()
+                code = await self._requete_asgi(handler, chemin)
+                durees.append(time.perf_counter() - debut)
+                if code >= 400:
+                    erreurs.append(code)
+
+        compteur, deconnecter = self._compter_connexions()
+        try:
+            debut = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrence)))
+            duree_totale = time.perf_counter() - debut
+        finally:
+            deconnecter()
+        return self._resultat(durees, erreurs, duree_totale, compteur[0])
+
+    @staticmethod
+    async def _requete_asgi(handler, chemin):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': chemin.path,
+            'raw_path': chemin.path.encode(),
+            'query_string': chemin.query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        statut = []
+
+        async def recevoir():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def envoyer(message):
+            if message['type'] == 'http.response.start':
+                statut.append(message['status'])
+
+        await handler(scope, recevoir, envoyer)
+        return statut[0]
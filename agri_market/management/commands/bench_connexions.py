@@ -0,0 +1,134 @@
+"""
+Débit d'une page avec et sans connexions persistantes à la base
+
+Les requêtes passent par le handler WSGI de Django, comme sous un vrai
+serveur : les signaux de début et de fin de requête ferment (CONN_MAX_AGE=0)
+ou conservent (CONN_MAX_AGE>0) la connexion de chaque thread. L'écart de
+débit entre les deux modes correspond au coût d'ouverture des connexions.
+
+Usage:
+    python manage.py bench_connexions
+    python manage.py bench_connexions --threads 8 --requetes 2000
+    python manage.py bench_connexions --chemin "/produits/?categorie=3"
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.urls import reverse
+
+from agri_market import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Compare le débit d'une page avec et sans connexions persistantes (CONN_MAX_AGE)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chemin', help="Page mesurée (défaut : liste des produits)")
+        parser.add_argument('--threads', type=int, default=4, help="Workers simultanés")
+        parser.add_argument('--requetes', type=int, default=400, help="Requêtes par mode")
+        parser.add_argument(
+            '--duree-connexion', type=int, default=600,
+            help="CONN_MAX_AGE du mode persistant (secondes)",
+        )
+
+    def handle(self, *args, **options):
+        chemin = urlsplit(options['chemin'] or reverse('liste_produits'))
+        self.handler = WSGIHandler()
+        self.factory = RequestFactory()
+
+        modes = (
+            ('sans persistance', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistantes', {'CONN_MAX_AGE': options['duree_connexion'], 'CONN_HEALTH_CHECKS': True}),
+        )
+        reglages = connections.settings[DEFAULT_DB_ALIAS]
+        origine = {cle: reglages.get(cle) for cle in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+
+        lignes = []
+        with benchmarks.environnement_de_mesure():
+            # Compilation des gabarits et caches hors mesure
+            self._requete(chemin)
+            try:
+                for nom, valeurs in modes:
+                    # Partagé par toutes les connexions de l'alias, y compris celles à venir
+                    reglages.update(valeurs)
+                    lignes.append((nom, *self._mesurer(chemin, options['threads'], options['requetes'])))
+            finally:
+                reglages.update(origine)
+
+        self.stdout.write(f"{chemin.path}{'?' + chemin.query if chemin.query else ''} : "
+                          f"{options['requetes']} requêtes, {options['threads']} threads")
+        self.stdout.write(f"{'mode':<18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'connexions':>11}")
+        for nom, debit, p50, p95, nb_connexions in lignes:
+            self.stdout.write(f"{nom:<18} {debit:>9.1f} {p50:>9.2f} {p95:>9.2f} {nb_connexions:>11}")
+
+        if lignes[0][1]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Connexions persistantes : débit x{lignes[1][1] / lignes[0][1]:.2f}"
+            ))
+
+    def _requete(self, chemin):
+        """Une requête GET complète via le handler WSGI ; renvoie le code HTTP"""
+        environ = self.factory.get(chemin.path, QUERY_STRING=chemin.query).environ
+        statut = []
+        reponse = self.handler(environ, lambda status, headers, *args: statut.append(status))
+        try:
+            for _ in reponse:
+                pass
+        finally:
+            # Déclenche request_finished (fermeture des connexions périmées)
+            reponse.close()
+        return int(statut[0].split()[0])
+
+    def _mesurer(self, chemin, nb_threads, nb_requetes):
+        """(requêtes/s, p50 ms, p95 ms, connexions ouvertes)"""
+        verrou = threading.Lock()
+        durees = []
+        erreurs = []
+        connexions = [0]
+
+        def compter_connexion(sender, connection, **kwargs):
+            with verrou:
+                connexions[0] += 1
+
+        def worker(nombre):
+            try:
+                for _ in range(nombre):
+                    debut = time.perf_counter()
+                    code = self._requete(chemin)
+                    duree = time.perf_counter() - debut
+                    with verrou:
+                        durees.append(duree)
+                        if code >= 400:
+                            erreurs.append(code)
+            finally:
+                connections.close_all()
+
+        parts = [nb_requetes // nb_threads + (i < nb_requetes % nb_threads) for i in range(nb_threads)]
+        threads = [threading.Thread(target=worker, args=(part,)) for part in parts]
+
+        connection_created.connect(compter_connexion)
+        try:
+            debut = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duree_totale = time.perf_counter() - debut
+        finally:
+            connection_created.disconnect(compter_connexion)
+
+        if erreurs:
+            raise CommandError(f"{len(erreurs)} réponse(s) en erreur (HTTP {erreurs[0]})")
+        return (
+            len(durees) / duree_totale,
+            benchmarks.percentile(durees, 50) * 1000,
+            benchmarks.percentile(durees, 95) * 1000,
+            connexions[0],
+        )
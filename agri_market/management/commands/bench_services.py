@@ -0,0 +1,172 @@
+"""
+Microbenchmarks des méthodes de service les plus sollicitées
+
+Chaque méthode est mesurée pour plusieurs tailles de panier ou de catalogue
+afin de rendre visibles les coûts qui croissent avec la taille (nombre de
+requêtes SQL ou durée). Les données sont créées pour l'occasion dans une
+transaction annulée : aucun jeu de données préalable n'est nécessaire.
+
+Usage:
+    python manage.py bench_services
+    python manage.py bench_services --tailles-panier 1 20 100 --tailles-catalogue 1000 50000
+    python manage.py bench_services --sortie bench/services.json
+"""
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from agri_market import benchmarks, metriques
+from agri_market.models import Utilisateur, Categorie, Produit, Commande, LigneCommande
+from agri_market.services_panier import ServicePanier
+from agri_market.services_produit import ServiceProduit
+
+NOMS_PRODUITS = ('Tomates', 'Mangues', 'Riz', 'Manioc', 'Oignons')
+TERME_RECHERCHE = 'Tomates'
+
+
+class Command(BaseCommand):
+    help = "Mesure les méthodes de ServicePanier et ServiceProduit selon la taille du panier et du catalogue"
+
+    def add_arguments(self, parser):
+        benchmarks.ajouter_arguments(parser)
+        parser.add_argument('--tailles-panier', type=int, nargs='+', default=[1, 10, 50, 200])
+        parser.add_argument('--tailles-catalogue', type=int, nargs='+', default=[100, 1000, 10000])
+
+    def handle(self, *args, **options):
+        self.options = options
+        resultats = {}
+
+        # Métriques des services mesurés : hors du répertoire de production
+        with metriques.isoler():
+            for taille in options['tailles_panier']:
+                with benchmarks.donnees_temporaires():
+                    resultats.update(self._mesurer_panier(taille))
+
+            for taille in options['tailles_catalogue']:
+                with benchmarks.donnees_temporaires():
+                    resultats.update(self._mesurer_catalogue(taille))
+
+        # Regrouper les tailles d'une même méthode
+        resultats = dict(sorted(resultats.items(), key=lambda item: _cle_tri(item[0])))
+        contexte = benchmarks.contexte_execution(
+            tailles_panier=options['tailles_panier'],
+            tailles_catalogue=options['tailles_catalogue'],
+        )
+        benchmarks.conclure(self, resultats, contexte, options)
+        self.stdout.write(_croissances(resultats))
+
+    def _mesurer(self, nom, taille, operation, preparer=None):
+        self.stdout.write(f"  {nom} [{taille}]...")
+        mesure = benchmarks.mesurer(
+            nom, operation,
+            iterations=self.options['iterations'],
+            echauffement=self.options['echauffement'],
+            allocations=self.options['allocations'],
+            preparer=preparer,
+        )
+        return {f"{nom}[{taille}]": mesure.resume()}
+
+    def _creer_catalogue(self, taille):
+        """Un vendeur et ``taille`` produits ; renvoie (vendeur, ids des produits)"""
+        vendeur = Utilisateur.objects.create_user(
+            username='bench_vendeur', email='bench_vendeur@exemple.test',
+            role='VENDEUR', nom_boutique='Boutique bench'
+        )
+        categorie, _ = Categorie.objects.get_or_create(nom='Bench')
+        Produit.objects.bulk_create([
+            Produit(
+                vendeur=vendeur,
+                categorie=categorie,
+                nom=f"{NOMS_PRODUITS[i % len(NOMS_PRODUITS)]} {i}",
+                description="Produit de benchmark",
+                prix=Decimal(100 + i % 900),
+                quantite=1000,
+            )
+            for i in range(taille)
+        ], batch_size=2000)
+        return vendeur, list(
+            Produit.objects.filter(vendeur=vendeur).order_by('id').values_list('id', flat=True)
+        )
+
+    def _mesurer_panier(self, taille):
+        """Méthodes du panier pour un panier de ``taille`` lignes"""
+        _, produits = self._creer_catalogue(taille + 1)
+        client = Utilisateur.objects.create_user(
+            username='bench_client', email='bench_client@exemple.test', role='CLIENT'
+        )
+        panier = Commande.objects.create(client=client, statut='PANIER')
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=panier, produit_id=produit_id, quantite=1, prix_unitaire=Decimal(100))
+            for produit_id in produits[:taille]
+        ])
+        ServicePanier._recalculer_montant(panier)
+        premiere_ligne = panier.lignes.order_by('id').first()
+
+        def details():
+            resultat = ServicePanier.obtenir_panier_avec_details(client.id)
+            # Parcours des lignes comme le fait le gabarit du panier
+            for _ in resultat['lignes']:
+                pass
+            return resultat
+
+        resultats = {}
+        resultats.update(self._mesurer(
+            'ajouter_au_panier', taille,
+            lambda: ServicePanier.ajouter_au_panier(client.id, produits[-1], 1),
+        ))
+        resultats.update(self._mesurer(
+            'modifier_quantite', taille,
+            lambda: ServicePanier.modifier_quantite(client.id, premiere_ligne.id, 2),
+        ))
+        resultats.update(self._mesurer('obtenir_panier_avec_details', taille, details))
+        resultats.update(self._mesurer(
+            '_recalculer_montant', taille,
+            lambda: ServicePanier._recalculer_montant(panier),
+        ))
+        return resultats
+
+    def _mesurer_catalogue(self, taille):
+        """Méthodes du catalogue pour un catalogue de ``taille`` produits"""
+        vendeur, produits = self._creer_catalogue(taille)
+
+        resultats = {}
+        resultats.update(self._mesurer(
+            'ajuster_stock', taille,
+            lambda: ServiceProduit.ajuster_stock(produits[0], -1),
+        ))
+        resultats.update(self._mesurer(
+            'rechercher_produits', taille,
+            lambda: list(ServiceProduit.rechercher_produits(TERME_RECHERCHE)),
+        ))
+        resultats.update(self._mesurer(
+            'lister_produits_vendeur', taille,
+            lambda: list(ServiceProduit.lister_produits_vendeur(vendeur.id)),
+        ))
+        return resultats
+
+
+def _cle_tri(nom):
+    """'methode[taille]' -> ('methode', taille)"""
+    methode, _, taille = nom.rstrip(']').partition('[')
+    return methode, int(taille)
+
+
+def _croissances(resultats):
+    """Évolution du p50 et des requêtes SQL entre la plus petite et la plus grande taille"""
+    par_methode = {}
+    for nom, resume in resultats.items():
+        methode, taille = _cle_tri(nom)
+        par_methode.setdefault(methode, []).append((taille, resume))
+
+    lignes = ["\nCroissance (plus petite -> plus grande taille) :"]
+    for methode, mesures in par_methode.items():
+        if len(mesures) < 2:
+            continue
+        (petite, debut), (grande, fin) = mesures[0], mesures[-1]
+        rapport = fin['p50_ms'] / debut['p50_ms'] if debut['p50_ms'] else 0
+        lignes.append(
+            f"  {methode:<30} taille x{grande / petite:<8g} p50 x{rapport:<6.1f} "
+            f"SQL {debut['requetes']} -> {fin['requetes']}"
+        )
+    return '\n'.join(lignes)
@@ -0,0 +1,103 @@
+"""
+Coût des moteurs de session sur le parcours panier
+
+Chaque vue du parcours est mesurée avec un client connecté, pour chaque
+moteur de session : le moteur 'db' lit la table django_session à chaque
+requête, 'cached_db' ne la lit qu'en cas d'absence du cache et
+'signed_cookies' jamais. Le résumé indique les requêtes SQL économisées
+par page par rapport à 'db'.
+
+Usage:
+    python manage.py bench_sessions
+    python manage.py bench_sessions --moteurs db cached_db --iterations 50
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from agri_market import benchmarks
+from agri_market.models import Utilisateur, Produit
+
+MOTEURS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+class Command(BaseCommand):
+    help = "Compare les requêtes SQL et la latence du parcours panier selon le moteur de session"
+
+    def add_arguments(self, parser):
+        benchmarks.ajouter_arguments(parser)
+        parser.add_argument(
+            '--moteurs', nargs='*', choices=sorted(MOTEURS),
+            default=['db', 'cached_db', 'signed_cookies'],
+            help="Moteurs de session comparés (le premier sert de base)",
+        )
+
+    def handle(self, *args, **options):
+        if options['reference']:
+            benchmarks.charger_reference(options['reference'])
+
+        with benchmarks.environnement_de_mesure(), benchmarks.donnees_temporaires():
+            client = Utilisateur.objects.filter(role='CLIENT', is_active=True).order_by('id').first()
+            produit = Produit.objects.filter(quantite__gte=50).order_by('id').first()
+            if client is None or produit is None:
+                raise CommandError(
+                    "Jeu de données insuffisant : lancez d'abord 'python manage.py generer_donnees'"
+                )
+
+            parcours = [
+                ('detail_produit', 'get', reverse('detail_produit', args=[produit.id]), None),
+                ('ajouter_au_panier', 'post', reverse('ajouter_au_panier', args=[produit.id]), {'quantite': 1}),
+                ('voir_panier', 'get', reverse('voir_panier'), None),
+            ]
+
+            resultats = {}
+            for moteur in options['moteurs']:
+                with override_settings(SESSION_ENGINE=MOTEURS[moteur]):
+                    resultats.update(self._mesurer_moteur(moteur, client, parcours, options))
+
+        contexte = benchmarks.contexte_execution(iterations=options['iterations'])
+        self._economies(resultats, options['moteurs'], parcours)
+        benchmarks.conclure(self, resultats, contexte, options)
+
+    def _mesurer_moteur(self, moteur, client, parcours, options):
+        # Nouveau client : le middleware de session est chargé avec le moteur courant
+        navigateur = Client()
+        navigateur.force_login(client)
+
+        resultats = {}
+        for vue, methode, url, donnees in parcours:
+            appel = getattr(navigateur, methode)
+
+            def requete():
+                reponse = appel(url, donnees)
+                if reponse.status_code >= 400:
+                    raise CommandError(f"{vue} [{moteur}] : réponse HTTP {reponse.status_code}")
+                return reponse
+
+            nom = f'{vue}[{moteur}]'
+            self.stdout.write(f"  {nom}...")
+            resultats[nom] = benchmarks.mesurer(
+                nom, requete,
+                iterations=options['iterations'],
+                echauffement=options['echauffement'],
+                allocations=options['allocations'],
+            ).resume()
+        return resultats
+
+    def _economies(self, resultats, moteurs, parcours):
+        base = moteurs[0]
+        for moteur in moteurs[1:]:
+            economies = [
+                resultats[f'{vue}[{base}]']['requetes'] - resultats[f'{vue}[{moteur}]']['requetes']
+                for vue, *_ in parcours
+            ]
+            self.stdout.write(
+                f"{moteur} : {sum(economies) / len(economies):+.1f} requête(s) SQL économisée(s) "
+                f"par page par rapport à {base}"
+            )
@@ -0,0 +1,125 @@
+"""
+Benchmark de bout en bout des vues principales
+
+Les vues sont appelées via le client de test de Django (URLconf, middlewares
+et templates réels) sur la base configurée, PostgreSQL ou SQLite, remplie au
+préalable par generer_donnees. Chaque itération est exécutée dans une
+transaction annulée : le jeu de données n'est pas modifié.
+
+Usage:
+    python manage.py bench_vues --sortie bench/reference.json
+    python manage.py bench_vues --reference bench/reference.json --tolerance 0.2
+    python manage.py bench_vues --vues detail_produit valider_commande
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from agri_market import benchmarks
+from agri_market.models import Utilisateur, Produit, LigneCommande
+from agri_market.services_panier import ServicePanier
+
+# Articles placés dans le panier avant les mesures du tunnel de commande
+ARTICLES_PANIER = 5
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence (p50/p95/p99), les requêtes SQL et les allocations des vues principales"
+
+    def add_arguments(self, parser):
+        benchmarks.ajouter_arguments(parser)
+        parser.add_argument('--vues', nargs='*', help="Limiter le benchmark à ces mesures")
+
+    def handle(self, *args, **options):
+        if options['reference']:
+            # Échouer avant les mesures si la référence est illisible
+            benchmarks.charger_reference(options['reference'])
+
+        # Administrateur et sessions créés pour le benchmark sont annulés
+        with benchmarks.environnement_de_mesure(), benchmarks.donnees_temporaires():
+            resultats, contexte = self._executer(options)
+
+        benchmarks.conclure(self, resultats, contexte, options)
+
+    def _acteurs(self):
+        """Client, vendeur le plus fourni, administrateur et produits du jeu de données"""
+        client = Utilisateur.objects.filter(role='CLIENT', is_active=True).order_by('id').first()
+        vendeur = Utilisateur.objects.filter(role='VENDEUR').annotate(
+            nb_produits=Count('produits')
+        ).order_by('-nb_produits', 'id').first()
+        produits = list(Produit.objects.filter(quantite__gte=50).order_by('id')[:ARTICLES_PANIER])
+
+        if client is None or vendeur is None or len(produits) < ARTICLES_PANIER:
+            raise CommandError(
+                "Jeu de données insuffisant : lancez d'abord 'python manage.py generer_donnees'"
+            )
+
+        # Créé dans la transaction annulée en fin de benchmark
+        admin = Utilisateur.objects.create_user(
+            username='bench_admin', email='bench_admin@exemple.test', role='CLIENT', is_staff=True
+        )
+        return client, vendeur, admin, produits
+
+    def _scenarios(self, client, vendeur, admin, produits):
+        """(nom, utilisateur, méthode, url, données, préparation)"""
+        produit = produits[0]
+
+        def remplir_panier():
+            for article in produits:
+                ServicePanier.ajouter_au_panier(client.id, article.id, 1)
+
+        return [
+            ('liste_produits', None, 'get', reverse('liste_produits'), None, None),
+            ('liste_produits:recherche', None, 'get', reverse('liste_produits'),
+             {'recherche': produit.nom.split()[0]}, None),
+            ('detail_produit', None, 'get', reverse('detail_produit', args=[produit.id]), None, None),
+            ('ajouter_au_panier', client, 'post', reverse('ajouter_au_panier', args=[produit.id]),
+             {'quantite': 1}, None),
+            ('voir_panier', client, 'get', reverse('voir_panier'), None, remplir_panier),
+            ('valider_commande', client, 'post', reverse('valider_commande'), None, remplir_panier),
+            ('commandes_vendeur', vendeur, 'get', reverse('commandes_vendeur'), None, None),
+            ('dashboard_admin', admin, 'get', reverse('dashboard_admin'), None, None),
+        ]
+
+    def _executer(self, options):
+        client, vendeur, admin, produits = self._acteurs()
+        scenarios = self._scenarios(client, vendeur, admin, produits)
+        if options['vues']:
+            scenarios = [s for s in scenarios if s[0] in options['vues']]
+            if not scenarios:
+                raise CommandError("Aucune mesure ne correspond à --vues")
+
+        navigateurs = {}
+        resultats = {}
+        for nom, utilisateur, methode, url, donnees, preparer in scenarios:
+            cle = utilisateur.id if utilisateur else None
+            if cle not in navigateurs:
+                navigateurs[cle] = Client()
+                if utilisateur:
+                    navigateurs[cle].force_login(utilisateur)
+            appel = getattr(navigateurs[cle], methode)
+
+            def requete():
+                reponse = appel(url, donnees)
+                if reponse.status_code >= 400:
+                    raise CommandError(f"{nom} : réponse HTTP {reponse.status_code}")
+                return reponse
+
+            self.stdout.write(f"  {nom}...")
+            mesure = benchmarks.mesurer(
+                nom, requete,
+                iterations=options['iterations'],
+                echauffement=options['echauffement'],
+                allocations=options['allocations'],
+                preparer=preparer,
+            )
+            resultats[nom] = mesure.resume()
+
+        contexte = benchmarks.contexte_execution(
+            iterations=options['iterations'],
+            produits=Produit.objects.count(),
+            lignes=LigneCommande.objects.count(),
+        )
+        return resultats, contexte
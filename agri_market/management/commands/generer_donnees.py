@@ -0,0 +1,292 @@
+"""
+Génération d'un jeu de données synthétique et réaliste pour les mesures de charge
+
+Le générateur est déterministe (--graine) et insère par lots avec
+bulk_create, sans passer par save() : les dates (auto_now/auto_now_add)
+sont fixées par le générateur pour reproduire un historique.
+
+Usage:
+    python manage.py generer_donnees
+    python manage.py generer_donnees --vendeurs 1000 --clients 50000 \\
+        --produits 200000 --lignes 2000000 --graine 42
+"""
+
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from agri_market.models import Utilisateur, Categorie, Produit, Commande, LigneCommande, Paiement
+
+
+# Catégories et produits de base : (catégorie, prix de référence en FCFA, produits)
+CATALOGUE = (
+    ('Légumes', 400, ('Tomates', 'Oignons', 'Gombo', 'Aubergines', 'Piments', 'Carottes', 'Choux')),
+    ('Fruits', 600, ('Mangues', 'Ananas', 'Bananes', 'Papayes', 'Oranges', 'Avocats', 'Pastèques')),
+    ('Céréales', 800, ('Maïs', 'Riz', 'Mil', 'Sorgho', 'Fonio')),
+    ('Tubercules', 500, ('Manioc', 'Igname', 'Patate douce', 'Taro', 'Pommes de terre')),
+    ('Légumineuses', 900, ('Haricots', 'Arachides', 'Niébé', 'Soja', 'Voandzou')),
+    ('Produits laitiers', 1200, ('Lait caillé', 'Fromage peulh', 'Beurre de vache', 'Yaourt')),
+    ('Volaille', 3500, ('Poulet bicyclette', 'Pintade', 'Œufs', 'Canard')),
+    ('Épices', 700, ('Gingembre', 'Poivre de Penja', 'Ail', 'Soumbala', 'Curcuma')),
+    ('Oléagineux', 1500, ('Huile de palme', 'Beurre de karité', 'Sésame', 'Noix de cajou')),
+    ('Boissons', 1000, ('Bissap', 'Jus de gingembre', 'Café', 'Cacao')),
+)
+
+VARIETES = ('bio', 'local', 'premium', 'du jour', 'séché', 'frais', 'en gros', 'de saison')
+
+# Poids des mois (1 à 12) : pics de récolte et de fin d'année
+SAISONS = (0.8, 0.7, 0.8, 0.9, 1.1, 1.2, 1.0, 0.9, 1.1, 1.3, 1.4, 1.6)
+
+# Répartition des statuts selon l'âge de la commande
+STATUTS_RECENTS = (('EN_ATTENTE', 0.4), ('PAYEE', 0.3), ('EXPEDIEE', 0.2), ('ANNULEE', 0.1))
+STATUTS_ANCIENS = (('LIVREE', 0.85), ('ANNULEE', 0.1), ('PAYEE', 0.05))
+
+MODES_PAIEMENT = ('MOBILE_MONEY', 'MOBILE_MONEY', 'MOBILE_MONEY', 'CARTE', 'ESPECES')
+
+
+@contextmanager
+def _dates_libres():
+    """Désactiver temporairement auto_now/auto_now_add pour imposer des dates historiques"""
+    champs = [
+        Produit._meta.get_field('date_ajout'),
+        Commande._meta.get_field('date_commande'),
+        Commande._meta.get_field('date_modification'),
+        Paiement._meta.get_field('date_paiement'),
+    ]
+    etats = [(champ, champ.auto_now, champ.auto_now_add) for champ in champs]
+    for champ in champs:
+        champ.auto_now = champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ, auto_now, auto_now_add in etats:
+            champ.auto_now, champ.auto_now_add = auto_now, auto_now_add
+
+
+class _TirageZipf:
+    """Tirage pondéré en loi de Zipf : quelques éléments très demandés, une longue traîne"""
+
+    def __init__(self, elements, rng, exposant=1.1):
+        self.elements = list(elements)
+        rangs = list(range(1, len(self.elements) + 1))
+        rng.shuffle(rangs)
+        self.cumul = list(accumulate(1.0 / rang ** exposant for rang in rangs))
+        self.rng = rng
+
+    def tirer(self):
+        position = self.rng.random() * self.cumul[-1]
+        return self.elements[bisect_left(self.cumul, position)]
+
+
+class Command(BaseCommand):
+    help = "Génère des vendeurs, clients, produits, commandes, lignes et paiements synthétiques"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendeurs', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--produits', type=int, default=2000)
+        parser.add_argument('--lignes', type=int, default=20000, help="Nombre approximatif de lignes de commande")
+        parser.add_argument('--jours', type=int, default=365, help="Profondeur de l'historique")
+        parser.add_argument('--graine', type=int, default=42)
+        parser.add_argument('--taille-lot', type=int, default=5000)
+        parser.add_argument(
+            '--prefixe', default='gen',
+            help="Préfixe des noms d'utilisateur générés (doit être libre)",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['graine'])
+        self.taille_lot = options['taille_lot']
+        self.prefixe = options['prefixe']
+
+        if Utilisateur.objects.filter(username__startswith=f"{self.prefixe}_").exists():
+            raise CommandError(
+                f"Des utilisateurs '{self.prefixe}_*' existent déjà : choisissez un autre --prefixe"
+            )
+
+        debut = time.perf_counter()
+        self.maintenant = timezone.now()
+        self.jours = options['jours']
+
+        with _dates_libres():
+            vendeurs, clients = self._creer_utilisateurs(options['vendeurs'], options['clients'])
+            categories = self._creer_categories()
+            produits = self._creer_produits(options['produits'], vendeurs, categories)
+            nb_commandes, nb_lignes, nb_paiements = self._creer_commandes(options['lignes'], clients, produits)
+
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(vendeurs)} vendeurs, {len(clients)} clients, {len(produits)} produits, "
+            f"{nb_commandes} commandes, {nb_lignes} lignes, {nb_paiements} paiements "
+            f"en {duree:.1f}s (graine {options['graine']})"
+        ))
+        self.stdout.write("Pensez à lancer 'python manage.py agreger_ventes' pour les statistiques.")
+
+    def _inserer(self, modele, objets):
+        """bulk_create par lots ; renvoie les objets (avec leur pk sur PostgreSQL/SQLite)"""
+        return modele.objects.bulk_create(objets, batch_size=self.taille_lot)
+
+    def _date_aleatoire(self):
+        """Date dans l'historique, pondérée par saison et plus dense les jours de marché"""
+        while True:
+            jours = self.rng.randrange(self.jours)
+            date = self.maintenant - timedelta(
+                days=jours, seconds=self.rng.randrange(6 * 3600, 20 * 3600)
+            )
+            poids = SAISONS[date.month - 1] * (1.3 if date.weekday() in (2, 5) else 1.0)
+            if self.rng.random() * 2.1 < poids:
+                return date
+
+    def _creer_utilisateurs(self, nb_vendeurs, nb_clients):
+        mot_de_passe = make_password('password123')
+        utilisateurs = []
+
+        for i in range(nb_vendeurs):
+            utilisateurs.append(Utilisateur(
+                username=f"{self.prefixe}_v{i}",
+                email=f"{self.prefixe}_v{i}@exemple.test",
+                password=mot_de_passe,
+                first_name='Vendeur',
+                last_name=str(i),
+                role='VENDEUR',
+                nom_boutique=f"Ferme {self.prefixe.upper()} {i}",
+                telephone=f"+2376{self.rng.randrange(10**7, 10**8)}",
+                date_joined=self.maintenant - timedelta(days=self.rng.randrange(self.jours + 30)),
+            ))
+
+        for i in range(nb_clients):
+            utilisateurs.append(Utilisateur(
+                username=f"{self.prefixe}_c{i}",
+                email=f"{self.prefixe}_c{i}@exemple.test",
+                password=mot_de_passe,
+                first_name='Client',
+                last_name=str(i),
+                role='CLIENT',
+                date_joined=self.maintenant - timedelta(days=self.rng.randrange(self.jours + 30)),
+            ))
+
+        self._inserer(Utilisateur, utilisateurs)
+
+        generes = Utilisateur.objects.filter(username__startswith=f"{self.prefixe}_")
+        vendeurs = list(generes.filter(role='VENDEUR').order_by('id').values_list('id', flat=True))
+        clients = list(generes.filter(role='CLIENT').order_by('id').values_list('id', flat=True))
+        self.stdout.write(f"  utilisateurs : {len(vendeurs)} vendeurs, {len(clients)} clients")
+        return vendeurs, clients
+
+    def _creer_categories(self):
+        Categorie.objects.bulk_create(
+            [Categorie(nom=nom) for nom, _, _ in CATALOGUE],
+            ignore_conflicts=True
+        )
+        ids = dict(Categorie.objects.filter(
+            nom__in=[nom for nom, _, _ in CATALOGUE]
+        ).values_list('nom', 'id'))
+        return [(ids[nom], prix, noms) for nom, prix, noms in CATALOGUE]
+
+    def _creer_produits(self, nb_produits, vendeurs, categories):
+        # Quelques gros vendeurs, beaucoup de petits
+        tirage_vendeurs = _TirageZipf(vendeurs, self.rng, exposant=0.8)
+
+        produits = []
+        for i in range(nb_produits):
+            categorie_id, prix_reference, noms = self.rng.choice(categories)
+            prix = Decimal(max(50, int(prix_reference * self.rng.lognormvariate(0, 0.4)) // 25 * 25))
+            produits.append(Produit(
+                vendeur_id=tirage_vendeurs.tirer(),
+                categorie_id=categorie_id,
+                # Le numéro garantit l'unicité du nom chez un même vendeur
+                nom=f"{self.rng.choice(noms)} {self.rng.choice(VARIETES)} #{i}",
+                description="Produit généré pour les tests de charge",
+                prix=prix,
+                quantite=self.rng.randrange(0, 500),
+                date_ajout=self.maintenant - timedelta(days=self.rng.randrange(self.jours + 30)),
+            ))
+
+        self._inserer(Produit, produits)
+
+        produits = list(Produit.objects.filter(
+            vendeur_id__in=vendeurs
+        ).order_by('id').values_list('id', 'prix'))
+        self.stdout.write(f"  produits : {len(produits)}")
+        return produits
+
+    def _creer_commandes(self, nb_lignes_cible, clients, produits):
+        tirage_produits = _TirageZipf(produits, self.rng)
+        tirage_clients = _TirageZipf(clients, self.rng, exposant=0.6)
+        seuil_recent = self.maintenant - timedelta(days=14)
+
+        nb_commandes = nb_lignes = nb_paiements = 0
+        while nb_lignes < nb_lignes_cible:
+            # Un lot de commandes et leurs lignes, générés en mémoire
+            lot = []
+            lignes_lot = 0
+            while len(lot) < self.taille_lot and nb_lignes + lignes_lot < nb_lignes_cible:
+                nb = min(
+                    max(1, int(self.rng.expovariate(1 / 3.5))),
+                    8, len(produits), nb_lignes_cible - nb_lignes - lignes_lot
+                )
+                articles = {}
+                while len(articles) < nb:
+                    produit_id, prix = tirage_produits.tirer()
+                    articles[produit_id] = (prix, self.rng.choice((1, 1, 1, 2, 2, 3, 5, 10)))
+
+                date = self._date_aleatoire()
+                repartition = STATUTS_RECENTS if date >= seuil_recent else STATUTS_ANCIENS
+                statut = self.rng.choices(
+                    [s for s, _ in repartition], weights=[p for _, p in repartition]
+                )[0]
+                lot.append((date, statut, articles))
+                lignes_lot += nb
+
+            with transaction.atomic():
+                commandes = self._inserer(Commande, [
+                    Commande(
+                        client_id=tirage_clients.tirer(),
+                        statut=statut,
+                        montant_total=sum(prix * quantite for prix, quantite in articles.values()),
+                        date_commande=date,
+                        date_modification=date + timedelta(hours=self.rng.randrange(1, 72)),
+                    )
+                    for date, statut, articles in lot
+                ])
+
+                self._inserer(LigneCommande, [
+                    LigneCommande(
+                        commande_id=commande.id,
+                        produit_id=produit_id,
+                        quantite=quantite,
+                        prix_unitaire=prix,
+                    )
+                    for commande, (_, _, articles) in zip(commandes, lot)
+                    for produit_id, (prix, quantite) in articles.items()
+                ])
+
+                paiements = self._inserer(Paiement, [
+                    Paiement(
+                        reference=f"{self.prefixe.upper()}-{commande.id}",
+                        commande_id=commande.id,
+                        client_id=commande.client_id,
+                        montant=commande.montant_total,
+                        mode_paiement=self.rng.choice(MODES_PAIEMENT),
+                        statut='REUSSI',
+                        date_paiement=commande.date_commande + timedelta(minutes=self.rng.randrange(5, 600)),
+                    )
+                    for commande in commandes
+                    if commande.statut in ('PAYEE', 'EXPEDIEE', 'LIVREE')
+                ])
+
+            nb_commandes += len(commandes)
+            nb_lignes += lignes_lot
+            nb_paiements += len(paiements)
+            self.stdout.write(f"  commandes : {nb_commandes} ({nb_lignes} lignes)")
+
+        return nb_commandes, nb_lignes, nb_paiements
@@ -0,0 +1,55 @@
+"""
+Génération des versions redimensionnées des photos de produits
+
+Reprend les photos dont les variantes manquent (travail interrompu par un
+redémarrage, produits antérieurs à la génération automatique).
+
+Usage:
+    python manage.py generer_variantes
+    python manage.py generer_variantes --tous --workers 4
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from agri_market.models import Produit
+from agri_market.services_images import ServiceImages
+
+
+class Command(BaseCommand):
+    help = "Génère les variantes WebP/JPEG manquantes des photos de produits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tous', action='store_true', help="Régénérer aussi les variantes existantes")
+        parser.add_argument('--workers', type=int, default=ServiceImages.NB_WORKERS, help="Générations simultanées")
+
+    def handle(self, *args, **options):
+        produits = Produit.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['tous']:
+            produits = produits.filter(image_variantes={})
+        ids = list(produits.order_by('id').values_list('id', flat=True))
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            resultats = list(pool.map(self._generer, ids))
+        duree = time.perf_counter() - debut
+
+        echecs = [(produit_id, erreur) for produit_id, erreur in zip(ids, resultats) if erreur]
+        for produit_id, erreur in echecs:
+            self.stderr.write(f"Produit {produit_id} : {erreur}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(ids) - len(echecs)} photo(s) traitée(s) en {duree:.2f}s, {len(echecs)} échec(s)"
+        ))
+
+    def _generer(self, produit_id):
+        """Message d'erreur, ou None"""
+        try:
+            ServiceImages.generer_variantes(produit_id)
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+        finally:
+            connections.close_all()
+        return None
@@ -0,0 +1,59 @@
+"""
+Purge par lots des sessions expirées
+
+Contrairement à clearsessions (un seul DELETE sur toute la table), les
+sessions sont supprimées par lots courts, chacun dans sa propre transaction :
+la table reste disponible pour les connexions en cours pendant la purge.
+
+Usage:
+    python manage.py nettoyer_sessions
+    python manage.py nettoyer_sessions --taille-lot 2000 --pause 0.1
+"""
+
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Supprime les sessions expirées par lots (moteurs de session 'db' et 'cached_db')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=5000, help="Sessions supprimées par transaction")
+        parser.add_argument('--pause', type=float, default=0.0, help="Pause entre deux lots (secondes)")
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            # Cookies signés ou cache seul : l'expiration ne laisse rien en base
+            self.stdout.write(f"Moteur {settings.SESSION_ENGINE} : aucune session stockée en base")
+            return
+
+        Session = store.get_model_class()
+        limite = timezone.now()
+        debut = time.perf_counter()
+        supprimees = 0
+        lots = 0
+
+        while True:
+            with transaction.atomic():
+                # Index sur expire_date ; lot borné pour des verrous courts
+                cles = list(
+                    Session.objects.filter(expire_date__lt=limite)
+                    .values_list('pk', flat=True)[:options['taille_lot']]
+                )
+                if not cles:
+                    break
+                supprimees += Session.objects.filter(pk__in=cles).delete()[0]
+            lots += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{supprimees} session(s) expirée(s) supprimée(s) en {lots} lot(s), {duree:.2f}s"
+        ))
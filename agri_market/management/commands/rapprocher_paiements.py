@@ -0,0 +1,70 @@
+"""
+Rapprochement d'un relevé de règlement de passerelle avec les paiements
+
+Le relevé est un CSV (séparateur ';' ou ',') avec les colonnes reference,
+statut et, de préférence, montant. Une exécution interrompue reprend au
+premier lot non validé ; --recommencer relit tout le relevé (sans effet sur
+les paiements déjà rapprochés).
+
+Usage:
+    python manage.py rapprocher_paiements releve_2026-10-18.csv
+    python manage.py rapprocher_paiements releve.csv --mode CARTE --taille-lot 500 --workers 16
+"""
+
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from agri_market.services_paiement import ServiceRapprochement
+
+
+class Command(BaseCommand):
+    help = "Rapproche un relevé de règlement avec les paiements et consulte la passerelle pour les paiements en attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Relevé CSV de la passerelle")
+        parser.add_argument('--mode', default='MOBILE_MONEY', help="Mode de paiement de la passerelle")
+        parser.add_argument(
+            '--taille-lot', type=int, default=ServiceRapprochement.TAILLE_LOT, help="Lignes par transaction"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=ServiceRapprochement.NB_WORKERS,
+            help="Consultations simultanées de la passerelle"
+        )
+        parser.add_argument('--recommencer', action='store_true', help="Ignorer la position de reprise")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['fichier'], 'rb') as fichier:
+                rapport = ServiceRapprochement.rapprocher(
+                    options['mode'],
+                    fichier,
+                    os.path.basename(options['fichier']),
+                    taille_lot=options['taille_lot'],
+                    nb_workers=options['workers'],
+                    recommencer=options['recommencer'],
+                )
+        except OSError as e:
+            raise CommandError(f"Relevé illisible : {e}")
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+
+        for numero, reference, motif in rapport['ecarts']:
+            ligne = f"ligne {numero}" if numero else "passerelle"
+            self.stderr.write(f"{ligne:<12} {reference:<28} {motif}")
+
+        duree = rapport['duree']
+        debit = (rapport['lignes'] + rapport['consultees']) / duree if duree else 0
+        resultats = ", ".join(
+            f"{nombre} {resultat.lower()}" for resultat, nombre in sorted(rapport['resultats'].items())
+        ) or "aucun"
+        if rapport['reprises']:
+            self.stdout.write(f"{rapport['reprises']} ligne(s) déjà rapprochée(s) : reprise après la dernière")
+        self.stdout.write(
+            f"{rapport['lignes']} ligne(s) lue(s), {rapport['consultees']} paiement(s) consulté(s) "
+            f"en {duree:.2f}s ({debit:.0f}/s)"
+        )
+        self.stdout.write(f"Résultats : {resultats}")
+        style = self.style.WARNING if rapport['nb_ecarts'] else self.style.SUCCESS
+        self.stdout.write(style(f"{rapport['nb_ecarts']} écart(s)"))
@@ -0,0 +1,38 @@
+"""
+Reconstruction des compteurs des meilleures ventes depuis les lignes de commande
+
+À lancer une fois à la mise en service (commandes antérieures aux compteurs),
+puis au besoin pour corriger une dérive. En fonctionnement normal les
+compteurs sont tenus à jour par la validation et l'annulation des commandes.
+
+Usage:
+    python manage.py reconstruire_meilleures_ventes
+    python manage.py reconstruire_meilleures_ventes --jours 30
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from agri_market.services_statistiques import ServiceMeilleuresVentes
+
+
+class Command(BaseCommand):
+    help = "Recalcule les unités vendues par produit et par jour (classements des meilleures ventes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jours', type=int,
+            help="Ne recalculer que les N derniers jours (défaut : tout l'historique)",
+        )
+
+    def handle(self, *args, **options):
+        if options['jours'] is not None and options['jours'] < 1:
+            raise CommandError("--jours doit être positif")
+
+        debut = time.perf_counter()
+        nb_compteurs = ServiceMeilleuresVentes.reconstruire(options['jours'])
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{nb_compteurs} compteur(s) écrit(s) en {duree:.2f}s"
+        ))
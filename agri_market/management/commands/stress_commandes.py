@@ -0,0 +1,312 @@
+"""
+Test de charge concurrent du tunnel de commande (ajout au panier puis validation)
+
+Des clients simultanés (un thread et une connexion chacun) se disputent le
+stock limité de quelques produits. La commande mesure le débit de
+validations, le temps passé dans les requêtes SELECT ... FOR UPDATE (attente
+de verrous) et les interblocages, puis vérifie les invariants :
+- aucun stock négatif ;
+- aucune survente (stock initial = stock final + quantités validées) ;
+- montant_total de chaque commande égal à la somme de ses lignes.
+
+Un même panier est ensuite validé depuis plusieurs threads à la fois (double
+clic, onglets) : une seule validation doit aboutir, le stock et les compteurs
+des meilleures ventes ne sont pris qu'une fois.
+
+Les données sont créées pour l'occasion (utilisateurs 'stress_*') puis
+supprimées. À lancer sur PostgreSQL : SQLite sérialise les écritures et ne
+reproduit pas la concurrence réelle.
+
+Usage:
+    python manage.py stress_commandes
+    python manage.py stress_commandes --clients 200 --produits 3 --stock 25
+    python manage.py stress_commandes --envois-simultanes 16
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.db.models import Sum
+
+from agri_market import metriques
+from agri_market.benchmarks import percentile
+from agri_market.models import Utilisateur, Categorie, Produit, Commande, LigneCommande, CompteurVentesJour
+from agri_market.services_panier import ServicePanier
+
+PREFIXE = 'stress_'
+
+
+def _est_interblocage(erreur):
+    """Interblocage détecté par PostgreSQL (SQLSTATE 40P01)"""
+    return getattr(erreur.__cause__, 'pgcode', None) == '40P01' or 'deadlock' in str(erreur).lower()
+
+
+class _ChronoVerrous:
+    """execute_wrapper qui chronomètre les requêtes SELECT ... FOR UPDATE"""
+
+    def __init__(self):
+        self.durees = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durees.append(time.perf_counter() - debut)
+
+
+class Command(BaseCommand):
+    help = "Lance des validations de commande concurrentes et vérifie les invariants de stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help="Clients simultanés (threads)")
+        parser.add_argument('--produits', type=int, default=1, help="Produits disputés")
+        parser.add_argument('--stock', type=int, default=10, help="Stock initial de chaque produit")
+        parser.add_argument('--quantite', type=int, default=1, help="Quantité commandée par produit")
+        parser.add_argument(
+            '--envois-simultanes', type=int, default=8,
+            help="Validations simultanées d'un même panier (0 : pas de test de double envoi)"
+        )
+        parser.add_argument('--graine', type=int, default=1)
+        parser.add_argument('--conserver', action='store_true', help="Ne pas supprimer les données créées")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f"Base {connection.vendor} : écritures sérialisées, mesures non représentatives de PostgreSQL"
+            ))
+
+        self._nettoyer()
+        clients, produits = self._preparer(options)
+        try:
+            # Commandes fictives : compteurs hors du répertoire de production
+            with metriques.isoler():
+                issues, durees, attentes, duree_totale = self._lancer(clients, produits, options)
+                envois, violations_envois = self._envoyer_en_double(options)
+            violations = self._verifier(clients, produits, options['stock']) + violations_envois
+        finally:
+            if not options['conserver']:
+                self._nettoyer()
+
+        self._rapport(issues, durees, attentes, duree_totale, options)
+        if envois:
+            self.stdout.write(
+                f"  envois simultanés      {sum(envois.values())} : "
+                + ", ".join(f"{issue} {nombre}" for issue, nombre in sorted(envois.items()))
+            )
+
+        if violations:
+            raise CommandError("Invariants violés :\n  " + "\n  ".join(violations))
+        self.stdout.write(self.style.SUCCESS("Invariants respectés"))
+
+    def _nettoyer(self):
+        # Commandes, lignes et produits suivent par cascade
+        Utilisateur.objects.filter(username__startswith=PREFIXE).delete()
+
+    def _preparer(self, options):
+        """Créer le vendeur, les produits disputés et les clients ; renvoie leurs ids"""
+        vendeur = Utilisateur.objects.create_user(
+            username=f'{PREFIXE}vendeur', email=f'{PREFIXE}vendeur@exemple.test',
+            role='VENDEUR', nom_boutique='Ferme stress'
+        )
+        categorie, _ = Categorie.objects.get_or_create(nom='Stress')
+        Produit.objects.bulk_create([
+            Produit(
+                vendeur=vendeur, categorie=categorie, nom=f'Produit disputé {i}',
+                prix=Decimal('1250.00'), quantite=options['stock'],
+            )
+            for i in range(options['produits'])
+        ])
+        Utilisateur.objects.bulk_create([
+            Utilisateur(
+                username=f'{PREFIXE}client{i}', email=f'{PREFIXE}client{i}@exemple.test',
+                password='!', role='CLIENT',
+            )
+            for i in range(options['clients'])
+        ])
+
+        produits = list(Produit.objects.filter(vendeur=vendeur).order_by('id').values_list('id', flat=True))
+        clients = list(Utilisateur.objects.filter(
+            username__startswith=f'{PREFIXE}client'
+        ).order_by('id').values_list('id', flat=True))
+        return clients, produits
+
+    def _lancer(self, clients, produits, options):
+        """Exécuter le parcours de tous les clients en parallèle"""
+        barriere = threading.Barrier(len(clients) + 1)
+        verrou = threading.Lock()
+        issues = Counter()
+        exemples = {}
+        durees = []
+        attentes = []
+
+        def parcours(client_id):
+            # Chaque client ajoute les produits dans un ordre différent
+            ordre = list(produits)
+            random.Random(options['graine'] + client_id).shuffle(ordre)
+            chrono = _ChronoVerrous()
+            try:
+                with connection.execute_wrapper(chrono):
+                    barriere.wait()
+                    debut = time.perf_counter()
+                    try:
+                        for produit_id in ordre:
+                            ServicePanier.ajouter_au_panier(client_id, produit_id, options['quantite'])
+                        ServicePanier.valider_commande(client_id)
+                        issue = 'validee'
+                    except ValidationError:
+                        issue = 'stock_insuffisant'
+                    except DatabaseError as erreur:
+                        issue = 'interblocage' if _est_interblocage(erreur) else 'erreur_base'
+                        exemples.setdefault(issue, str(erreur).strip())
+                    duree = time.perf_counter() - debut
+                with verrou:
+                    issues[issue] += 1
+                    durees.append(duree)
+                    attentes.extend(chrono.durees)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=parcours, args=(client_id,)) for client_id in clients]
+        for thread in threads:
+            thread.start()
+
+        barriere.wait()
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        duree_totale = time.perf_counter() - debut
+
+        for issue, message in exemples.items():
+            self.stdout.write(f"  exemple {issue} : {message}")
+        return issues, durees, attentes, duree_totale
+
+    def _envoyer_en_double(self, options):
+        """
+        Valider le même panier depuis plusieurs threads à la fois
+
+        Returns:
+            tuple: (Counter des issues, violations)
+        """
+        nombre = options['envois_simultanes']
+        if nombre <= 0:
+            return Counter(), []
+
+        stock_initial = options['quantite'] * nombre
+        produit = Produit.objects.create(
+            vendeur=Utilisateur.objects.get(username=f'{PREFIXE}vendeur'),
+            categorie=Categorie.objects.get(nom='Stress'),
+            nom='Produit double envoi', prix=Decimal('1250.00'), quantite=stock_initial,
+        )
+        client = Utilisateur.objects.create(
+            username=f'{PREFIXE}double_envoi', email=f'{PREFIXE}double_envoi@exemple.test',
+            password='!', role='CLIENT',
+        )
+        ServicePanier.ajouter_au_panier(client.id, produit.id, options['quantite'])
+
+        barriere = threading.Barrier(nombre)
+        verrou = threading.Lock()
+        issues = Counter()
+
+        def envoyer():
+            try:
+                barriere.wait()
+                try:
+                    ServicePanier.valider_commande(client.id)
+                    issue = 'validee'
+                except ValidationError:
+                    issue = 'refusee'
+                except DatabaseError:
+                    issue = 'erreur_base'
+                with verrou:
+                    issues[issue] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=envoyer) for _ in range(nombre)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        violations = []
+        commandes = Commande.objects.filter(client=client).exclude(statut='PANIER').count()
+        if issues['validee'] != 1 or commandes != 1:
+            violations.append(
+                f"double envoi : {issues['validee']} validation(s), {commandes} commande(s) au lieu d'une"
+            )
+        produit.refresh_from_db()
+        if produit.quantite != stock_initial - options['quantite']:
+            violations.append(
+                f"double envoi : stock final {produit.quantite} au lieu de {stock_initial - options['quantite']}"
+            )
+        vendus = CompteurVentesJour.objects.filter(produit=produit).aggregate(total=Sum('unites'))['total']
+        if vendus != options['quantite']:
+            violations.append(f"double envoi : {vendus} unité(s) comptée(s) au lieu de {options['quantite']}")
+        return issues, violations
+
+    def _verifier(self, clients, produits, stock_initial):
+        """Contrôler les invariants de stock et de montants ; renvoie les violations"""
+        violations = []
+
+        vendus = Counter()
+        for produit_id, quantite in LigneCommande.objects.filter(
+            produit_id__in=produits
+        ).exclude(commande__statut='PANIER').values_list('produit_id', 'quantite'):
+            vendus[produit_id] += quantite
+
+        for produit_id, quantite in Produit.objects.filter(id__in=produits).values_list('id', 'quantite'):
+            if quantite < 0:
+                violations.append(f"produit {produit_id} : stock négatif ({quantite})")
+            if vendus[produit_id] > stock_initial:
+                violations.append(
+                    f"produit {produit_id} : survente ({vendus[produit_id]} vendus pour {stock_initial})"
+                )
+            if stock_initial - vendus[produit_id] != quantite:
+                violations.append(
+                    f"produit {produit_id} : stock final {quantite} au lieu de "
+                    f"{stock_initial - vendus[produit_id]}"
+                )
+
+        sommes = Counter()
+        for commande_id, prix, quantite in LigneCommande.objects.filter(
+            commande__client_id__in=clients
+        ).values_list('commande_id', 'prix_unitaire', 'quantite'):
+            sommes[commande_id] += prix * quantite
+
+        for commande_id, montant in Commande.objects.filter(
+            client_id__in=clients
+        ).values_list('id', 'montant_total'):
+            if montant != sommes[commande_id]:
+                violations.append(f"commande {commande_id} : montant {montant} != somme des lignes {sommes[commande_id]}")
+
+        return violations
+
+    def _rapport(self, issues, durees, attentes, duree_totale, options):
+        validees = issues['validee']
+        self.stdout.write(
+            f"{options['clients']} clients, {options['produits']} produit(s) x {options['stock']} unités, "
+            f"{options['quantite']} unité(s) par produit et par client"
+        )
+        self.stdout.write(f"  durée totale           {duree_totale:.2f}s")
+        self.stdout.write(f"  validations            {validees} ({validees / duree_totale:.1f}/s)")
+        for issue in ('stock_insuffisant', 'interblocage', 'erreur_base'):
+            self.stdout.write(f"  {issue:<22} {issues[issue]}")
+        if durees:
+            self.stdout.write(
+                f"  parcours client        p50 {percentile(durees, 50) * 1000:.1f} ms, "
+                f"p95 {percentile(durees, 95) * 1000:.1f} ms"
+            )
+        if attentes:
+            self.stdout.write(
+                f"  SELECT FOR UPDATE      {len(attentes)} requêtes, total {sum(attentes):.2f}s, "
+                f"p95 {percentile(attentes, 95) * 1000:.1f} ms, max {max(attentes) * 1000:.1f} ms"
+            )
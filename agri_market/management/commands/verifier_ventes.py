@@ -0,0 +1,45 @@
+"""
+Vérification de cohérence des agrégats journaliers de ventes
+
+Usage:
+    python manage.py verifier_ventes --jour 2026-01-15
+    python manage.py verifier_ventes --jour 2026-01-15 --sans-correction
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from agri_market.services_statistiques import ServiceAgregationVentes
+
+
+class Command(BaseCommand):
+    help = "Compare les agrégats d'un jour aux commandes et reconstruit le jour en cas d'écart"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jour', required=True, help="Jour à vérifier (AAAA-MM-JJ)")
+        parser.add_argument(
+            '--sans-correction',
+            action='store_true',
+            help="Signaler les écarts sans reconstruire le jour",
+        )
+
+    def handle(self, *args, **options):
+        jour = parse_date(options['jour'])
+        if jour is None:
+            raise CommandError("Format de date attendu : AAAA-MM-JJ")
+
+        ecarts = ServiceAgregationVentes.verifier_jour(jour)
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS(f"{jour} : agrégats cohérents"))
+            return
+
+        for table, cle, stocke, source in ecarts:
+            self.stdout.write(f"  [{table}] {cle} : enregistré={stocke} source={source}")
+
+        if options['sans_correction']:
+            self.stdout.write(self.style.WARNING(f"{jour} : {len(ecarts)} écart(s) non corrigé(s)"))
+            return
+
+        ServiceAgregationVentes.recalculer_jour(jour)
+        self.stdout.write(self.style.SUCCESS(f"{jour} : {len(ecarts)} écart(s) corrigé(s)"))
@@ -0,0 +1,389 @@
+"""
+Métriques applicatives exposées au format texte Prometheus
+
+Chaque processus accumule ses compteurs et histogrammes en mémoire et les
+écrit périodiquement dans son propre fichier JSON (METRIQUES_REPERTOIRE).
+L'endpoint /metrics additionne les fichiers de tous les processus : aucun
+verrou inter-processus n'est nécessaire et l'enregistrement d'une mesure ne
+coûte qu'une mise à jour de dictionnaire.
+
+Au démarrage, un processus additionne les fichiers des processus terminés
+dans un fichier cumulé (FICHIER_CUMUL) puis les supprime : les compteurs ne
+redescendent pas et le répertoire ne grossit pas avec les redémarrages.
+Les tests et les commandes de mesure écrivent dans un répertoire temporaire
+(cf. ``isoler``) pour ne jamais se mêler aux métriques de production.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import override_settings
+
+
+# Bornes (secondes) de l'histogramme de durée des requêtes
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Bornes de l'histogramme du nombre de requêtes SQL par requête HTTP
+BORNES_REQUETES_SQL = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+DESCRIPTIONS = {
+    'agri_requete_duree_secondes': ('histogram', "Durée des requêtes HTTP par vue"),
+    'agri_requete_sql': ('histogram', "Nombre de requêtes SQL par requête HTTP, par vue"),
+    'agri_reponses_total': ('counter', "Réponses HTTP par vue et classe de code"),
+    'agri_panier_ajouts_total': ('counter', "Articles ajoutés au panier"),
+    'agri_commandes_validees_total': ('counter', "Paniers validés en commande"),
+    'agri_conflits_stock_total': ('counter', "Opérations refusées pour stock insuffisant"),
+    'agri_cache_total': ('counter', "Lectures de cache par espace et résultat (hit, miss, rafraichissement, attente)"),
+    'agri_paiements_notifications_total': ('counter', "Notifications des passerelles de paiement par résultat"),
+}
+
+
+# Métriques des processus terminés, déjà additionnées
+FICHIER_CUMUL = 'metriques-cumul.json'
+
+# Fichier d'un processus sans écriture depuis ce délai : considéré terminé
+# (seul critère hors POSIX, où l'existence du PID ne peut pas être testée)
+DELAI_EXPIRATION = 24 * 3600
+
+# Verrou de compactage abandonné (processus tué pendant le compactage)
+DELAI_VERROU = 60
+
+
+def _repertoire():
+    return getattr(
+        settings, 'METRIQUES_REPERTOIRE',
+        os.path.join(tempfile.gettempdir(), 'e_agri_metriques')
+    )
+
+
+def _cle(nom, labels):
+    return (nom, tuple(sorted(labels.items())))
+
+
+class RegistreMetriques:
+    """Métriques du processus courant"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._compteurs = {}
+        self._histogrammes = {}
+        self._derniere_ecriture = 0.0
+        self._fichier = None
+
+    def incrementer(self, nom, valeur=1, **labels):
+        """Incrémenter un compteur"""
+        cle = _cle(nom, labels)
+        with self._verrou:
+            self._compteurs[cle] = self._compteurs.get(cle, 0) + valeur
+        self._ecrire_si_necessaire()
+
+    def observer(self, nom, valeur, bornes, **labels):
+        """Ajouter une observation à un histogramme"""
+        cle = _cle(nom, labels)
+        with self._verrou:
+            histogramme = self._histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self._histogrammes[cle] = {
+                    'bornes': list(bornes),
+                    'comptes': [0] * (len(bornes) + 1),
+                    'somme': 0.0,
+                }
+            index = len(bornes)
+            for i, borne in enumerate(bornes):
+                if valeur <= borne:
+                    index = i
+                    break
+            histogramme['comptes'][index] += 1
+            histogramme['somme'] += valeur
+        self._ecrire_si_necessaire()
+
+    def remplacer(self, etat=None):
+        """
+        Remplacer les métriques du processus (défaut : repartir de zéro)
+
+        Returns:
+            tuple: L'état remplacé, à repasser à remplacer() pour le rétablir
+        """
+        with self._verrou:
+            precedent = (self._compteurs, self._histogrammes, self._fichier)
+            self._compteurs, self._histogrammes, self._fichier = etat or ({}, {}, None)
+        return precedent
+
+    def instantane(self):
+        """Copie sérialisable des métriques du processus"""
+        with self._verrou:
+            return {
+                'compteurs': [
+                    [nom, dict(labels), valeur]
+                    for (nom, labels), valeur in self._compteurs.items()
+                ],
+                'histogrammes': [
+                    [nom, dict(labels), dict(h, comptes=list(h['comptes']))]
+                    for (nom, labels), h in self._histogrammes.items()
+                ],
+            }
+
+    def ecrire(self):
+        """Écrire les métriques du processus dans son fichier (remplacement atomique)"""
+        repertoire = _repertoire()
+        os.makedirs(repertoire, exist_ok=True)
+        if self._fichier is None or os.path.dirname(self._fichier) != repertoire:
+            compacter(repertoire)
+            # PID + date de démarrage : un PID réutilisé n'écrase pas l'ancien fichier
+            self._fichier = os.path.join(repertoire, f'metriques-{os.getpid()}-{int(time.time())}.json')
+
+        temporaire = f'{self._fichier}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump(self.instantane(), fichier)
+        os.replace(temporaire, self._fichier)
+        self._derniere_ecriture = time.monotonic()
+
+    def _ecrire_si_necessaire(self):
+        intervalle = getattr(settings, 'METRIQUES_INTERVALLE_ECRITURE', 5)
+        if time.monotonic() - self._derniere_ecriture >= intervalle:
+            try:
+                self.ecrire()
+            except OSError:
+                # Les métriques ne doivent jamais faire échouer une requête
+                pass
+
+
+registre = RegistreMetriques()
+
+
+def incrementer(nom, valeur=1, **labels):
+    """Incrémenter un compteur du registre du processus"""
+    registre.incrementer(nom, valeur, **labels)
+
+
+def observer(nom, valeur, bornes, **labels):
+    """Ajouter une observation à un histogramme du registre du processus"""
+    registre.observer(nom, valeur, bornes, **labels)
+
+
+def _lire(chemin):
+    with open(chemin, encoding='utf-8') as fichier:
+        return json.load(fichier)
+
+
+def _additionner(compteurs, histogrammes, donnees):
+    """Ajouter les métriques d'un fichier aux totaux"""
+    for nom, labels, valeur in donnees['compteurs']:
+        cle = _cle(nom, labels)
+        compteurs[cle] = compteurs.get(cle, 0) + valeur
+
+    for nom, labels, h in donnees['histogrammes']:
+        cle = _cle(nom, labels)
+        total = histogrammes.get(cle)
+        if total is None or total['bornes'] != h['bornes']:
+            histogrammes[cle] = dict(h, comptes=list(h['comptes']))
+        else:
+            total['comptes'] = [a + b for a, b in zip(total['comptes'], h['comptes'])]
+            total['somme'] += h['somme']
+
+
+def _fichiers_processus(repertoire):
+    """{nom de fichier: PID} des fichiers écrits par les processus"""
+    fichiers = {}
+    noms = os.listdir(repertoire) if os.path.isdir(repertoire) else []
+    for nom_fichier in noms:
+        parties = nom_fichier[:-len('.json')].split('-')
+        if nom_fichier.endswith('.json') and len(parties) == 3 and parties[1].isdigit():
+            fichiers[nom_fichier] = int(parties[1])
+    return fichiers
+
+
+def _fusionner_fichiers():
+    """Additionner le fichier cumulé et les métriques écrites par tous les processus"""
+    repertoire = _repertoire()
+
+    # Un compactage peut supprimer un fichier entre la liste et sa lecture : on relit
+    for _ in range(3):
+        compteurs = {}
+        histogrammes = {}
+        # Liste avant le cumul : un fichier absorbé entre-temps figure dans cumul['fichiers']
+        fichiers = _fichiers_processus(repertoire)
+        try:
+            cumul = _lire(os.path.join(repertoire, FICHIER_CUMUL))
+        except (OSError, ValueError):
+            cumul = {'compteurs': [], 'histogrammes': [], 'fichiers': []}
+        _additionner(compteurs, histogrammes, cumul)
+
+        disparu = False
+        for nom_fichier in sorted(set(fichiers) - set(cumul.get('fichiers', ()))):
+            try:
+                donnees = _lire(os.path.join(repertoire, nom_fichier))
+            except FileNotFoundError:
+                disparu = True
+                break
+            except (OSError, ValueError):
+                continue
+            _additionner(compteurs, histogrammes, donnees)
+        if not disparu:
+            break
+
+    return compteurs, histogrammes
+
+
+def _processus_termine(chemin, pid):
+    if os.name == 'posix':
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # PID d'un autre utilisateur : processus vivant
+            return False
+    try:
+        return time.time() - os.path.getmtime(chemin) > DELAI_EXPIRATION
+    except OSError:
+        return False
+
+
+def compacter(repertoire=None):
+    """
+    Additionner dans FICHIER_CUMUL les fichiers des processus terminés, puis les supprimer
+
+    Le cumul liste les fichiers absorbés : /metrics les ignore dès son
+    écriture, même s'ils ne sont pas encore supprimés.
+
+    Returns:
+        int: Nombre de fichiers absorbés (0 si un autre processus compacte)
+    """
+    repertoire = repertoire or _repertoire()
+    verrou = os.path.join(repertoire, 'compactage.verrou')
+    try:
+        os.close(os.open(verrou, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(verrou) > DELAI_VERROU:
+                os.remove(verrou)
+        except OSError:
+            pass
+        return 0
+    except OSError:
+        return 0
+
+    try:
+        fichiers = _fichiers_processus(repertoire)
+        chemin_cumul = os.path.join(repertoire, FICHIER_CUMUL)
+        try:
+            cumul = _lire(chemin_cumul)
+        except (OSError, ValueError):
+            cumul = {'compteurs': [], 'histogrammes': [], 'fichiers': []}
+
+        # Absorbés mais pas supprimés (échec précédent) : à supprimer, pas à recompter
+        deja_absorbes = set(cumul.get('fichiers', ())) & set(fichiers)
+        termines = [
+            nom_fichier for nom_fichier, pid in sorted(fichiers.items())
+            if nom_fichier not in deja_absorbes
+            and pid != os.getpid()
+            and _processus_termine(os.path.join(repertoire, nom_fichier), pid)
+        ]
+        if not termines and not deja_absorbes:
+            return 0
+
+        compteurs, histogrammes = {}, {}
+        _additionner(compteurs, histogrammes, cumul)
+        absorbes = []
+        for nom_fichier in termines:
+            try:
+                _additionner(compteurs, histogrammes, _lire(os.path.join(repertoire, nom_fichier)))
+            except (OSError, ValueError):
+                continue
+            absorbes.append(nom_fichier)
+
+        temporaire = f'{chemin_cumul}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump({
+                'compteurs': [[nom, dict(labels), valeur] for (nom, labels), valeur in compteurs.items()],
+                'histogrammes': [[nom, dict(labels), h] for (nom, labels), h in histogrammes.items()],
+                'fichiers': sorted(deja_absorbes | set(absorbes)),
+            }, fichier)
+        os.replace(temporaire, chemin_cumul)
+
+        for nom_fichier in sorted(deja_absorbes | set(absorbes)):
+            try:
+                os.remove(os.path.join(repertoire, nom_fichier))
+            except OSError:
+                pass
+        return len(absorbes)
+    finally:
+        try:
+            os.remove(verrou)
+        except OSError:
+            pass
+
+
+@contextmanager
+def isoler():
+    """
+    Écrire les métriques d'un bloc (tests, mesures) dans un répertoire temporaire
+
+    Les métriques du processus sont mises de côté pendant le bloc puis
+    rétablies : rien de ce qui est mesuré dans le bloc n'atteint le
+    répertoire de production.
+    """
+    with tempfile.TemporaryDirectory(prefix='e_agri_metriques-') as repertoire:
+        with override_settings(METRIQUES_REPERTOIRE=repertoire):
+            etat = registre.remplacer()
+            try:
+                yield repertoire
+            finally:
+                registre.remplacer(etat)
+
+
+def _labels_texte(labels, **extra):
+    paires = list(labels) + list(extra.items())
+    if not paires:
+        return ''
+    contenu = ','.join(
+        '{}="{}"'.format(cle, str(valeur).replace('\\', '\\\\').replace('"', '\\"'))
+        for cle, valeur in paires
+    )
+    return '{' + contenu + '}'
+
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def exporter_texte():
+    """
+    Métriques de tous les processus au format d'exposition texte Prometheus
+
+    Returns:
+        str: Corps de la réponse /metrics
+    """
+    registre.ecrire()
+    compteurs, histogrammes = _fusionner_fichiers()
+
+    lignes = []
+    noms = sorted({nom for nom, _ in compteurs} | {nom for nom, _ in histogrammes})
+    for nom in noms:
+        type_metrique, description = DESCRIPTIONS.get(nom, ('untyped', nom))
+        lignes.append(f'# HELP {nom} {description}')
+        lignes.append(f'# TYPE {nom} {type_metrique}')
+
+        for (nom_c, labels), valeur in sorted(compteurs.items()):
+            if nom_c == nom:
+                lignes.append(f'{nom}{_labels_texte(labels)} {_nombre(valeur)}')
+
+        for (nom_h, labels), h in sorted(histogrammes.items()):
+            if nom_h != nom:
+                continue
+            cumul = 0
+            for borne, compte in zip(h['bornes'], h['comptes']):
+                cumul += compte
+                lignes.append(f'{nom}_bucket{_labels_texte(labels, le=borne)} {cumul}')
+            cumul += h['comptes'][-1]
+            lignes.append(f'{nom}_bucket{_labels_texte(labels, le="+Inf")} {cumul}')
+            lignes.append(f'{nom}_sum{_labels_texte(labels)} {_nombre(h["somme"])}')
+            lignes.append(f'{nom}_count{_labels_texte(labels)} {cumul}')
+
+    return '\n'.join(lignes) + '\n'
@@ -0,0 +1,269 @@
+"""
+Middlewares de l'application agri_market
+"""
+
+import mimetypes
+import os
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+
+from . import metriques
+from . import budget_requetes
+from . import routage_bdd
+
+
+class _CompteurRequetesSQL:
+    """execute_wrapper qui compte les requêtes SQL exécutées"""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class _CaptureSQL:
+    """
+    Installer des execute_wrapper sur toutes les connexions, en synchrone ou en async
+
+    Sous ASGI, le SQL d'une vue async (ORM async, sync_to_async) s'exécute
+    dans le thread synchrone dédié à la requête, et non dans la boucle
+    d'événements : les wrappers y sont installés puis retirés.
+    """
+
+    def __init__(self, *wrappers):
+        self.wrappers = wrappers
+        self.pile = ExitStack()
+
+    def _installer(self):
+        for connexion in connections.all():
+            for wrapper in self.wrappers:
+                self.pile.enter_context(connexion.execute_wrapper(wrapper))
+
+    def __enter__(self):
+        self._installer()
+        return self
+
+    def __exit__(self, *exc):
+        self.pile.close()
+
+    async def __aenter__(self):
+        await sync_to_async(self._installer)()
+        return self
+
+    async def __aexit__(self, *exc):
+        await sync_to_async(self.pile.close)()
+
+
+class MetriquesMiddleware:
+    """
+    Mesurer la durée et le nombre de requêtes SQL de chaque vue
+
+    Les mesures sont étiquetées par nom d'URL (``vue``) pour garder une
+    cardinalité bornée, quelle que soit la valeur des paramètres d'URL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        compteur = _CompteurRequetesSQL()
+        debut = time.perf_counter()
+        with _CaptureSQL(compteur):
+            response = self.get_response(request)
+        self._enregistrer(request, response, time.perf_counter() - debut, compteur.total)
+        return response
+
+    async def __acall__(self, request):
+        compteur = _CompteurRequetesSQL()
+        debut = time.perf_counter()
+        async with _CaptureSQL(compteur):
+            response = await self.get_response(request)
+        self._enregistrer(request, response, time.perf_counter() - debut, compteur.total)
+        return response
+
+    def _enregistrer(self, request, response, duree, nb_requetes):
+        match = getattr(request, 'resolver_match', None)
+        vue = (match.url_name if match else None) or 'inconnue'
+
+        metriques.observer('agri_requete_duree_secondes', duree, metriques.BORNES_DUREE, vue=vue)
+        metriques.observer('agri_requete_sql', nb_requetes, metriques.BORNES_REQUETES_SQL, vue=vue)
+        metriques.incrementer('agri_reponses_total', vue=vue, code=f'{response.status_code // 100}xx')
+
+
+class BudgetRequetesMiddleware:
+    """
+    Vérifier le budget de requêtes SQL de chaque vue (cf. budget_requetes)
+
+    Réglage BUDGET_REQUETES_MODE :
+    - '' : désactivé (production) ;
+    - 'log' : avertissement dans les logs ;
+    - 'raise' : exception DepassementBudget (tests, développement strict).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        mode = getattr(settings, 'BUDGET_REQUETES_MODE', '')
+        if not mode:
+            return self.get_response(request)
+
+        rapport = budget_requetes.RapportRequetes()
+        with _CaptureSQL(rapport):
+            response = self.get_response(request)
+        self._verifier(request, rapport, mode)
+        return response
+
+    async def __acall__(self, request):
+        mode = getattr(settings, 'BUDGET_REQUETES_MODE', '')
+        if not mode:
+            return await self.get_response(request)
+
+        rapport = budget_requetes.RapportRequetes()
+        async with _CaptureSQL(rapport):
+            response = await self.get_response(request)
+        self._verifier(request, rapport, mode)
+        return response
+
+    def _verifier(self, request, rapport, mode):
+        match = getattr(request, 'resolver_match', None)
+        message = budget_requetes.verifier_budget(match.url_name, rapport) if match and match.url_name else ''
+        if message:
+            if mode == 'raise':
+                raise budget_requetes.DepassementBudget(message)
+            budget_requetes.logger.warning(message)
+
+
+class RoutageBddMiddleware:
+    """
+    Cohérence des lectures sur répliques (cf. routage_bdd)
+
+    Après une écriture, un cookie maintient les requêtes suivantes du même
+    navigateur sur la base principale pendant DB_REPLICA_DELAI secondes, le
+    temps que la réplication rattrape l'écriture.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routage_bdd.repliques():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        jetons = routage_bdd.debut_requete(primaire=routage_bdd.COOKIE_PRIMAIRE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            self._marquer(response)
+        finally:
+            routage_bdd.fin_requete(jetons)
+        return response
+
+    async def __acall__(self, request):
+        # Les variables de contexte suivent la requête dans sync_to_async (aller et retour)
+        jetons = routage_bdd.debut_requete(primaire=routage_bdd.COOKIE_PRIMAIRE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+            self._marquer(response)
+        finally:
+            routage_bdd.fin_requete(jetons)
+        return response
+
+    def _marquer(self, response):
+        if routage_bdd.ecriture_effectuee():
+            response.set_cookie(
+                routage_bdd.COOKIE_PRIMAIRE, '1',
+                max_age=settings.DB_REPLICA_DELAI, httponly=True, samesite='Lax',
+            )
+
+
+class StatiquesMiddleware:
+    """
+    Servir STATIC_ROOT sans serveur frontal (réglage STATIC_SERVIR)
+
+    - fichier haché par collectstatic (styles.3f2a9c1b7e4d.css) : son contenu
+      ne change jamais, il est mis en cache un an sans revalidation ;
+    - variante .br ou .gz précompressée envoyée si le client l'accepte.
+
+    Placé en tête de MIDDLEWARE : un fichier statique ne passe ni par la
+    session, ni par les métriques des vues. Middleware synchrone : sous
+    ASGI, confier les fichiers statiques au serveur frontal.
+    """
+
+    DUREE_IMMUABLE = 365 * 24 * 3600
+    DUREE_NON_HACHE = 300
+    NOM_HACHE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+    ENCODAGES = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_SERVIR', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefixe = '/' + settings.STATIC_URL.lstrip('/')
+        self.racine = str(settings.STATIC_ROOT)
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefixe):
+            return self.get_response(request)
+
+        nom = request.path[len(self.prefixe):]
+        try:
+            chemin = safe_join(self.racine, nom)
+        except SuspiciousFileOperation:
+            raise Http404("Fichier statique introuvable")
+        if not os.path.isfile(chemin):
+            raise Http404("Fichier statique introuvable")
+
+        acceptes = {
+            encodage.split(';')[0].strip()
+            for encodage in request.headers.get('Accept-Encoding', '').split(',')
+        }
+        encodage_retenu = None
+        for encodage, extension in self.ENCODAGES:
+            if encodage in acceptes and os.path.isfile(chemin + extension):
+                encodage_retenu = encodage
+                chemin += extension
+                break
+
+        type_contenu = mimetypes.guess_type(nom)[0] or 'application/octet-stream'
+        response = FileResponse(open(chemin, 'rb'), content_type=type_contenu)
+        if encodage_retenu:
+            response.headers['Content-Encoding'] = encodage_retenu
+        response.headers['Vary'] = 'Accept-Encoding'
+        if self.NOM_HACHE.search(nom):
+            response.headers['Cache-Control'] = f'public, max-age={self.DUREE_IMMUABLE}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={self.DUREE_NON_HACHE}'
+        return response
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PointDeReprise",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nom", models.CharField(max_length=100, unique=True)),
+                ("date_marque", models.DateTimeField(blank=True, null=True)),
+                ("position", models.BigIntegerField(default=0)),
+                ("date_maj", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="commande",
+            name="date_modification",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="commande",
+            name="date_commande",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="VenteJournaliere",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jour", models.DateField()),
+                (
+                    "statut",
+                    models.CharField(
+                        choices=[
+                            ("PANIER", "Panier"),
+                            ("EN_ATTENTE", "En attente"),
+                            ("PAYEE", "Payée"),
+                            ("EXPEDIEE", "Expédiée"),
+                            ("LIVREE", "Livrée"),
+                            ("ANNULEE", "Annulée"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                (
+                    "chiffre_affaires",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("unites", models.PositiveIntegerField(default=0)),
+                ("nb_commandes", models.PositiveIntegerField(default=0)),
+                (
+                    "categorie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventes_journalieres",
+                        to="agri_market.categorie",
+                    ),
+                ),
+                (
+                    "vendeur",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventes_journalieres",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["vendeur", "jour"],
+                        name="agri_market_vendeur_1afde4_idx",
+                    )
+                ],
+                "unique_together": {("jour", "vendeur", "categorie", "statut")},
+            },
+        ),
+    ]
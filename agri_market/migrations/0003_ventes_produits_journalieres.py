@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0002_ventes_journalieres"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VenteProduitJournaliere",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jour", models.DateField()),
+                (
+                    "statut",
+                    models.CharField(
+                        choices=[
+                            ("PANIER", "Panier"),
+                            ("EN_ATTENTE", "En attente"),
+                            ("PAYEE", "Payée"),
+                            ("EXPEDIEE", "Expédiée"),
+                            ("LIVREE", "Livrée"),
+                            ("ANNULEE", "Annulée"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                (
+                    "chiffre_affaires",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("unites", models.PositiveIntegerField(default=0)),
+                (
+                    "produit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventes_journalieres",
+                        to="agri_market.produit",
+                    ),
+                ),
+                (
+                    "vendeur",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventes_produits_journalieres",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["vendeur", "jour"],
+                        name="agri_market_vendeur_09921e_idx",
+                    )
+                ],
+                "unique_together": {("jour", "produit", "statut")},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def renommer_doublons(apps, schema_editor):
+    """Suffixer par leur id les produits homonymes d'un même vendeur (le plus ancien garde son nom)"""
+    Produit = apps.get_model("agri_market", "Produit")
+
+    doublons = (
+        Produit.objects.values("vendeur_id", "nom")
+        .annotate(nb=Count("id"))
+        .filter(nb__gt=1)
+    )
+    for doublon in doublons:
+        produits = Produit.objects.filter(
+            vendeur_id=doublon["vendeur_id"], nom=doublon["nom"]
+        ).order_by("id")
+        for produit in produits[1:]:
+            suffixe = f" ({produit.id})"
+            produit.nom = produit.nom[: 150 - len(suffixe)] + suffixe
+            produit.save(update_fields=["nom"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0003_ventes_produits_journalieres"),
+    ]
+
+    operations = [
+        migrations.RunPython(renommer_doublons, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="produit",
+            constraint=models.UniqueConstraint(
+                fields=("vendeur", "nom"), name="produit_vendeur_nom_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0004_produit_vendeur_nom_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="produit",
+            name="image",
+            field=models.ImageField(blank=True, null=True, upload_to="produits/"),
+        ),
+        migrations.AddField(
+            model_name="produit",
+            name="image_variantes",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0005_produit_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paiement",
+            name="date_mise_a_jour",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="paiement",
+            name="reference_passerelle",
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name="NotificationPaiement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("passerelle", models.CharField(max_length=30)),
+                ("identifiant", models.CharField(max_length=100)),
+                ("reference", models.CharField(db_index=True, max_length=100)),
+                (
+                    "statut",
+                    models.CharField(
+                        choices=[
+                            ("EN_ATTENTE", "En attente"),
+                            ("REUSSI", "Réussi"),
+                            ("ECHEC", "Échec"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                (
+                    "montant",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "resultat",
+                    models.CharField(
+                        choices=[
+                            ("APPLIQUEE", "Appliquée"),
+                            ("DOUBLON", "Doublon"),
+                            ("IGNOREE", "Ignorée"),
+                            ("CONFLIT", "Conflit"),
+                            ("INCONNUE", "Référence inconnue"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("date_reception", models.DateTimeField(auto_now_add=True)),
+                (
+                    "paiement",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="notifications",
+                        to="agri_market.paiement",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("passerelle", "identifiant")},
+            },
+        ),
+    ]
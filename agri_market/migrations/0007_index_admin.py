@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0006_paiements_en_ligne"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificationpaiement",
+            name="date_reception",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="paiement",
+            name="date_paiement",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="produit",
+            name="date_ajout",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="produit",
+            name="nom",
+            field=models.CharField(db_index=True, max_length=150),
+        ),
+        migrations.AlterField(
+            model_name="utilisateur",
+            name="nom_boutique",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=150, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0007_index_admin"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="produit",
+            name="vues",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="produit",
+            index=models.Index(fields=["-vues"], name="produit_vues_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="produit",
+            index=models.Index(
+                fields=["categorie", "-vues"], name="produit_categorie_vues_idx"
+            ),
+        ),
+    ]
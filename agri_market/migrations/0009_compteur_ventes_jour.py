@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0008_produit_vues"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompteurVentesJour",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jour", models.DateField()),
+                ("unites", models.IntegerField(default=0)),
+                (
+                    "produit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="compteurs_ventes",
+                        to="agri_market.produit",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("jour", "produit")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agri_market", "0009_compteur_ventes_jour"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paiement",
+            name="url_redirection",
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
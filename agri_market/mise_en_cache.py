@@ -0,0 +1,172 @@
+"""
+Mise en cache des résultats calculés
+
+Les clés sont rangées par espace de noms (``analyse_vendeur``,
+``categories``...) et versionnées : ``invalider(espace)`` incrémente la
+version de l'espace, ce qui rend toutes ses anciennes clés inaccessibles
+sans avoir à les énumérer.
+
+``obtenir_ou_calculer`` protège contre l'effet de ruée (plusieurs workers
+recalculant la même valeur à son expiration) :
+- un verrou (``cache.add``) réserve le calcul d'une valeur absente à un seul
+  worker ; les autres attendent brièvement son résultat ;
+- une valeur proche de l'expiration est rafraîchie par anticipation, avec
+  une probabilité croissante à l'approche de l'échéance et proportionnelle à
+  la durée du calcul (algorithme « XFetch ») ; pendant ce temps, les autres
+  workers continuent de servir l'ancienne valeur.
+
+Chaque lecture est comptée dans la métrique ``agri_cache_total``.
+"""
+
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metriques
+
+
+# Durée de vie par défaut de chaque espace (secondes)
+DUREES = {
+    'analyse_vendeur': 300,
+    'categories': 3600,
+    'panier': 300,
+    'dashboard': 60,
+    'meilleures_ventes': 300,
+}
+DUREE_PAR_DEFAUT = 300
+
+# Durée maximale d'un calcul protégé par le verrou (secondes)
+DUREE_VERROU = 30
+
+# Attente du résultat calculé par un autre worker avant de calculer soi-même
+ATTENTE_MAX = 2.0
+INTERVALLE_ATTENTE = 0.05
+
+# Agressivité du rafraîchissement anticipé (1 = valeur recommandée par XFetch)
+BETA = 1.0
+
+
+def _cle_version(espace):
+    return f'version:{espace}'
+
+
+def _version_initiale():
+    # Une version évincée ne repart jamais d'une valeur déjà utilisée : les
+    # anciennes clés encore présentes dans le cache restent inaccessibles
+    return time.time_ns()
+
+
+def version(espace):
+    """Version courante d'un espace de noms"""
+    return cache.get_or_set(_cle_version(espace), _version_initiale, None)
+
+
+def cle(espace, *parties):
+    """
+    Clé versionnée d'une valeur
+
+    Args:
+        espace: Espace de noms (une clé de DUREES de préférence)
+        *parties: Éléments identifiant la valeur dans l'espace (ids, paramètres)
+
+    Returns:
+        str: Par exemple 'analyse_vendeur:v<version>:12:30'
+    """
+    return ':'.join([espace, f'v{version(espace)}', *map(str, parties)])
+
+
+def invalider(espace):
+    """Rendre obsolètes toutes les valeurs d'un espace de noms"""
+    cle_version = _cle_version(espace)
+    if cache.add(cle_version, _version_initiale(), None):
+        return
+    try:
+        cache.incr(cle_version)
+    except ValueError:
+        # Clé évincée entre add et incr
+        cache.set(cle_version, _version_initiale(), None)
+
+
+def supprimer(espace, *parties):
+    """
+    Supprimer une valeur, immédiatement et après validation de la transaction
+
+    La seconde suppression écarte une valeur remise en cache par une requête
+    concurrente qui aurait lu l'état antérieur à la transaction.
+    """
+    cle_valeur = cle(espace, *parties)
+    cache.delete(cle_valeur)
+    transaction.on_commit(lambda: cache.delete(cle_valeur))
+
+
+def _compter(espace, resultat):
+    metriques.incrementer('agri_cache_total', cache=espace, resultat=resultat)
+
+
+def _rafraichir_maintenant(entree):
+    """Tirage XFetch : vrai si la valeur doit être recalculée par anticipation"""
+    alea = random.random() or 1e-12
+    return time.time() - entree['duree_calcul'] * BETA * math.log(alea) >= entree['expiration']
+
+
+def _calculer_et_stocker(cle_valeur, calcul, duree):
+    debut = time.perf_counter()
+    valeur = calcul()
+    cache.set(cle_valeur, {
+        'valeur': valeur,
+        'expiration': time.time() + duree,
+        'duree_calcul': time.perf_counter() - debut,
+    }, duree)
+    return valeur
+
+
+def obtenir_ou_calculer(espace, parties, calcul, duree=None):
+    """
+    Valeur en cache, ou calculée puis mise en cache
+
+    Args:
+        espace: Espace de noms
+        parties: Tuple identifiant la valeur dans l'espace
+        calcul: Fonction sans argument produisant la valeur (sérialisable)
+        duree: Durée de vie en secondes (défaut : DUREES[espace])
+
+    Returns:
+        La valeur
+    """
+    duree = duree or DUREES.get(espace, DUREE_PAR_DEFAUT)
+    cle_valeur = cle(espace, *parties)
+    cle_verrou = f'{cle_valeur}:verrou'
+
+    entree = cache.get(cle_valeur)
+    if entree is not None:
+        # Un seul worker rafraîchit ; les autres servent la valeur actuelle
+        if _rafraichir_maintenant(entree) and cache.add(cle_verrou, 1, DUREE_VERROU):
+            _compter(espace, 'rafraichissement')
+            try:
+                return _calculer_et_stocker(cle_valeur, calcul, duree)
+            finally:
+                cache.delete(cle_verrou)
+        _compter(espace, 'hit')
+        return entree['valeur']
+
+    if cache.add(cle_verrou, 1, DUREE_VERROU):
+        _compter(espace, 'miss')
+        try:
+            return _calculer_et_stocker(cle_valeur, calcul, duree)
+        finally:
+            cache.delete(cle_verrou)
+
+    # Un autre worker calcule cette valeur : attendre son résultat
+    _compter(espace, 'attente')
+    fin = time.monotonic() + ATTENTE_MAX
+    while time.monotonic() < fin:
+        time.sleep(INTERVALLE_ATTENTE)
+        entree = cache.get(cle_valeur)
+        if entree is not None:
+            return entree['valeur']
+
+    # Calcul trop long ou en échec chez l'autre worker : calculer sans attendre davantage
+    return _calculer_et_stocker(cle_valeur, calcul, duree)
@@ -22,7 +22,8 @@ class Utilisateur(AbstractUser):
     nom_boutique = models.CharField(
         max_length=150,
         blank=True,
-        null=True
+        null=True,
+        db_index=True
     )
 
     # ✅ FIX DU PROBLÈME
@@ -72,12 +73,28 @@ class Produit(models.Model):
     )
     categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE, related_name='produits')
 
-    nom = models.CharField(max_length=150)
+    nom = models.CharField(max_length=150, db_index=True)
     description = models.TextField(blank=True)
     prix = models.DecimalField(max_digits=10, decimal_places=2)
     quantite = models.PositiveIntegerField()
-    #image = models.ImageField(upload_to='produits/', blank=True, null=True)
-    date_ajout = models.DateTimeField(auto_now_add=True)
+    image = models.ImageField(upload_to='produits/', blank=True, null=True)
+    # Versions redimensionnées générées en arrière-plan (cf. services_images)
+    # {"320": {"webp": "produits/variantes/...", "jpeg": "...", "hauteur": 240}, ...}
+    image_variantes = models.JSONField(default=dict, blank=True)
+    date_ajout = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Consultations de la page produit, écrites par lots (cf. compteur_vues)
+    vues = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Clé naturelle de l'import CSV (mise à jour des produits existants)
+        constraints = [
+            models.UniqueConstraint(fields=['vendeur', 'nom'], name='produit_vendeur_nom_unique'),
+        ]
+        # Produits les plus consultés, sur tout le catalogue ou par catégorie
+        indexes = [
+            models.Index(fields=['-vues'], name='produit_vues_idx'),
+            models.Index(fields=['categorie', '-vues'], name='produit_categorie_vues_idx'),
+        ]
 
     def __str__(self):
         return self.nom
@@ -104,7 +121,10 @@ class Commande(models.Model):
     )
     statut = models.CharField(max_length=30, choices=STATUT_CHOICES, default='PANIER')
     montant_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    date_commande = models.DateTimeField(auto_now_add=True)
+    date_commande = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Sert de marque de reprise aux agrégations incrémentales :
+    # toute mise à jour en masse (.update()) doit aussi la renseigner
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Commande #{self.id} - {self.client.username}"
@@ -148,7 +168,120 @@ class Paiement(models.Model):
     montant = models.DecimalField(max_digits=10, decimal_places=2)
     mode_paiement = models.CharField(max_length=30, choices=MODE_PAIEMENT_CHOICES)
     statut = models.CharField(max_length=30, choices=STATUT_CHOICES, default='EN_ATTENTE')
-    date_paiement = models.DateTimeField(auto_now_add=True)
+    # Identifiant de la transaction chez la passerelle (paiements en ligne)
+    reference_passerelle = models.CharField(max_length=100, blank=True, db_index=True)
+    # Page de la passerelle où le client confirme (carte) : reproposée tant que le paiement est en attente
+    url_redirection = models.URLField(max_length=500, blank=True)
+    date_paiement = models.DateTimeField(auto_now_add=True, db_index=True)
+    date_mise_a_jour = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Paiement {self.reference}"
+
+
+# =========================
+# NOTIFICATION DE PAIEMENT (journal des rappels des passerelles)
+# =========================
+class NotificationPaiement(models.Model):
+    RESULTAT_CHOICES = (
+        ('APPLIQUEE', 'Appliquée'),
+        ('DOUBLON', 'Doublon'),
+        ('IGNOREE', 'Ignorée'),
+        ('CONFLIT', 'Conflit'),
+        ('INCONNUE', 'Référence inconnue'),
+    )
+
+    passerelle = models.CharField(max_length=30)
+    # Identifiant de l'événement chez la passerelle : une notification rejouée est reconnue
+    identifiant = models.CharField(max_length=100)
+    reference = models.CharField(max_length=100, db_index=True)
+    paiement = models.ForeignKey(
+        Paiement, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications'
+    )
+    statut = models.CharField(max_length=30, choices=Paiement.STATUT_CHOICES)
+    montant = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    resultat = models.CharField(max_length=20, choices=RESULTAT_CHOICES)
+    date_reception = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('passerelle', 'identifiant')
+
+    def __str__(self):
+        return f"Notification {self.identifiant} ({self.reference})"
+
+
+# =========================
+# AGRÉGATS DE VENTES (jour × vendeur × catégorie × statut)
+# =========================
+class VenteJournaliere(models.Model):
+    jour = models.DateField()
+    vendeur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='ventes_journalieres')
+    categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE, related_name='ventes_journalieres')
+    statut = models.CharField(max_length=30, choices=Commande.STATUT_CHOICES)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unites = models.PositiveIntegerField(default=0)
+    nb_commandes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('jour', 'vendeur', 'categorie', 'statut')
+        indexes = [
+            models.Index(fields=['vendeur', 'jour']),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - vendeur #{self.vendeur_id} - {self.statut}"
+
+
+# =========================
+# AGRÉGATS DE VENTES PAR PRODUIT (jour × produit × statut)
+# =========================
+class VenteProduitJournaliere(models.Model):
+    jour = models.DateField()
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='ventes_journalieres')
+    # Dénormalisé pour filtrer par vendeur sans jointure
+    vendeur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='ventes_produits_journalieres')
+    statut = models.CharField(max_length=30, choices=Commande.STATUT_CHOICES)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unites = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('jour', 'produit', 'statut')
+        indexes = [
+            models.Index(fields=['vendeur', 'jour']),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - produit #{self.produit_id} - {self.statut}"
+
+
+# =========================
+# UNITÉS VENDUES PAR PRODUIT ET PAR JOUR (meilleures ventes)
+# =========================
+class CompteurVentesJour(models.Model):
+    """
+    Tenu à jour à chaque validation (+) et annulation (-) de commande,
+    jour = date de la commande (comme les agrégats journaliers)
+    """
+    jour = models.DateField()
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='compteurs_ventes')
+    unites = models.IntegerField(default=0)
+
+    class Meta:
+        # Sert aussi d'index pour lire une fenêtre de jours
+        unique_together = ('jour', 'produit')
+
+    def __str__(self):
+        return f"{self.jour} - produit #{self.produit_id} : {self.unites}"
+
+
+# =========================
+# POINT DE REPRISE DES TRAITEMENTS PAR LOTS
+# =========================
+class PointDeReprise(models.Model):
+    nom = models.CharField(max_length=100, unique=True)
+    date_marque = models.DateTimeField(blank=True, null=True)
+    position = models.BigIntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.nom
@@ -0,0 +1,225 @@
+"""
+Passerelles de paiement en ligne (Mobile Money, carte bancaire)
+
+Chaque mode de paiement en ligne est servi par une passerelle déclarée dans le
+réglage PASSERELLES_PAIEMENT (chemin de la classe et options). Une passerelle
+sait :
+- initier un paiement (référence de transaction, éventuelle page de redirection) ;
+- authentifier et décoder les notifications qu'elle envoie au site ;
+- consulter l'état d'un paiement (rapprochement, notifications perdues) ;
+- abandonner un paiement en attente que le client remplace.
+
+PasserelleSimulee ne sort pas du processus : elle sert au développement et aux
+tests. Une passerelle réelle hérite de PasserellePaiement et surcharge les
+méthodes propres à son API.
+"""
+
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.module_loading import import_string
+
+
+class ErreurPasserelle(Exception):
+    """La passerelle n'a pas pu traiter la demande (réseau, refus, indisponibilité)"""
+
+
+class Notification(NamedTuple):
+    """Notification décodée, dans le vocabulaire de Paiement"""
+    identifiant: str  # identifiant de l'événement chez la passerelle (clé d'idempotence)
+    reference: str  # Paiement.reference
+    statut: str  # EN_ATTENTE, REUSSI ou ECHEC
+    montant: Optional[Decimal]
+
+
+class PasserellePaiement:
+    """
+    Interface commune des passerelles
+
+    Le format par défaut des notifications est un corps JSON
+    {"evenement", "reference", "statut", "montant"} signé par HMAC-SHA256
+    (en-tête X-Signature, hexadécimal) avec le secret partagé.
+    """
+
+    # Statut de la passerelle -> statut de Paiement
+    STATUTS = {
+        'EN_ATTENTE': 'EN_ATTENTE',
+        'REUSSI': 'REUSSI',
+        'ECHEC': 'ECHEC',
+    }
+
+    def __init__(self, mode_paiement, secret=''):
+        self.mode_paiement = mode_paiement
+        self.secret = secret
+
+    def initier(self, paiement):
+        """
+        Déclarer un paiement auprès de la passerelle
+
+        Args:
+            paiement: Paiement EN_ATTENTE (référence et montant renseignés)
+
+        Returns:
+            dict: {'reference_passerelle': str, 'url_redirection': str ou None}
+
+        Raises:
+            ErreurPasserelle: Si la passerelle refuse ou ne répond pas
+        """
+        raise NotImplementedError
+
+    def consulter(self, reference):
+        """
+        Statut d'un paiement chez la passerelle
+
+        Returns:
+            str: Statut de Paiement, ou None si la passerelle ne connaît pas la référence
+
+        Raises:
+            ErreurPasserelle: Si la passerelle ne répond pas
+        """
+        raise NotImplementedError
+
+    def annuler(self, reference):
+        """
+        Abandonner une transaction en attente (paiement remplacé par le client)
+
+        Par défaut rien n'est demandé : la passerelle fait expirer d'elle-même
+        les transactions non confirmées.
+
+        Returns:
+            str: Statut de Paiement après l'abandon (ECHEC, ou REUSSI si le
+            paiement a abouti entre-temps)
+
+        Raises:
+            ErreurPasserelle: Si la passerelle ne répond pas
+        """
+        return 'ECHEC'
+
+    def signer(self, corps):
+        return hmac.new(self.secret.encode(), corps, hashlib.sha256).hexdigest()
+
+    def verifier_signature(self, corps, signature):
+        """Authentifier une notification (comparaison en temps constant)"""
+        if not self.secret or not signature:
+            return False
+        return hmac.compare_digest(self.signer(corps), signature)
+
+    def lire_notification(self, corps):
+        """
+        Décoder le corps d'une notification
+
+        Args:
+            corps: Corps brut de la requête (bytes)
+
+        Returns:
+            Notification
+
+        Raises:
+            ValidationError: Si le corps est illisible ou incomplet
+        """
+        try:
+            donnees = json.loads(corps)
+            identifiant = str(donnees['evenement'])
+            reference = str(donnees['reference'])
+            statut = self.STATUTS[donnees['statut']]
+            montant = donnees.get('montant')
+            montant = Decimal(str(montant)) if montant is not None else None
+        except (ValueError, TypeError, KeyError, InvalidOperation):
+            raise ValidationError("Notification illisible")
+        if not identifiant or not reference:
+            raise ValidationError("Notification incomplète")
+        return Notification(identifiant, reference, statut, montant)
+
+
+class PasserelleSimulee(PasserellePaiement):
+    """
+    Passerelle locale : les transactions vivent dans la mémoire du processus
+
+    regler() fait aboutir (ou échouer) un paiement et renvoie la notification
+    signée que la passerelle aurait envoyée. L'option 'latence' (secondes)
+    simule le temps de réponse d'une API distante ; l'option 'url_confirmation'
+    simule une passerelle à redirection (page de confirmation de la carte).
+    """
+
+    _transactions = {}
+    _verrou = threading.Lock()
+
+    def __init__(self, mode_paiement, secret='', latence=0, url_confirmation=''):
+        super().__init__(mode_paiement, secret)
+        self.latence = latence
+        self.url_confirmation = url_confirmation
+
+    def _attendre(self):
+        if self.latence:
+            time.sleep(self.latence)
+
+    def initier(self, paiement):
+        self._attendre()
+        with self._verrou:
+            self._transactions[paiement.reference] = 'EN_ATTENTE'
+        reference_passerelle = f'SIM-{secrets.token_hex(8)}'
+        return {
+            'reference_passerelle': reference_passerelle,
+            'url_redirection': f'{self.url_confirmation}{reference_passerelle}' if self.url_confirmation else None,
+        }
+
+    def consulter(self, reference):
+        self._attendre()
+        with self._verrou:
+            return self._transactions.get(reference)
+
+    def annuler(self, reference):
+        self._attendre()
+        with self._verrou:
+            if self._transactions.get(reference) == 'EN_ATTENTE':
+                self._transactions[reference] = 'ECHEC'
+            return self._transactions.get(reference, 'ECHEC')
+
+    def regler(self, reference, statut, montant=None, evenement=None):
+        """
+        Changer le statut d'une transaction simulée
+
+        Returns:
+            tuple: (corps, signature) de la notification correspondante
+        """
+        with self._verrou:
+            self._transactions[reference] = statut
+        corps = json.dumps({
+            'evenement': evenement or f'evt-{secrets.token_hex(8)}',
+            'reference': reference,
+            'statut': statut,
+            'montant': str(montant) if montant is not None else None,
+        }).encode()
+        return corps, self.signer(corps)
+
+    @classmethod
+    def reinitialiser(cls):
+        with cls._verrou:
+            cls._transactions.clear()
+
+
+def modes_en_ligne():
+    """Modes de paiement servis par une passerelle"""
+    return list(getattr(settings, 'PASSERELLES_PAIEMENT', {}))
+
+
+def obtenir_passerelle(mode_paiement):
+    """
+    Passerelle configurée pour un mode de paiement
+
+    Raises:
+        ValidationError: Si aucune passerelle ne sert ce mode
+    """
+    configuration = getattr(settings, 'PASSERELLES_PAIEMENT', {}).get(mode_paiement)
+    if configuration is None:
+        raise ValidationError("Mode de paiement non disponible en ligne")
+    classe = import_string(configuration['CLASSE'])
+    return classe(mode_paiement, **configuration.get('OPTIONS', {}))
@@ -0,0 +1,112 @@
+"""
+Routage des lectures vers les répliques de la base
+
+Seules les lectures déclarées explicitement (décorateur ``lecture_seule`` sur
+les services du catalogue et des tableaux de bord) partent vers une réplique ;
+toute autre requête reste sur la base principale ('default'). Une réplique
+peut avoir quelques secondes de retard : le tunnel de commande, les stocks et
+les verrous (select_for_update) ne doivent jamais la lire.
+
+Cohérence après écriture :
+- dès qu'une écriture a lieu dans la requête (ou la commande) en cours, les
+  lectures suivantes restent sur la base principale ;
+- le middleware RoutageBddMiddleware prolonge ce choix pendant
+  DB_REPLICA_DELAI secondes (cookie) : la page affichée après un POST
+  reflète bien ce qui vient d'être enregistré.
+
+Réglage DATABASE_REPLICAS : liste d'alias de DATABASES (vide = pas de routage).
+"""
+
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+
+# Lectures routables vers une réplique dans le contexte courant
+_lecture_seule = contextvars.ContextVar('lecture_seule', default=False)
+
+# Écriture effectuée : base principale jusqu'à la fin du contexte
+_primaire = contextvars.ContextVar('primaire', default=False)
+
+COOKIE_PRIMAIRE = 'bdd_primaire'
+
+
+def repliques():
+    """Alias des répliques configurées"""
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def alias_lecture():
+    """Alias à utiliser pour une lecture routable dans le contexte courant"""
+    aliases = repliques()
+    if not aliases or _primaire.get():
+        return DEFAULT_DB_ALIAS
+    return random.choice(aliases)
+
+
+def forcer_primaire():
+    """Envoyer toutes les lectures suivantes du contexte courant à la base principale"""
+    _primaire.set(True)
+
+
+def ecriture_effectuee():
+    return _primaire.get()
+
+
+def debut_requete(primaire=False):
+    """Réinitialiser le routage en début de requête ; renvoie les jetons à passer à fin_requete"""
+    return _lecture_seule.set(False), _primaire.set(primaire)
+
+
+def fin_requete(jetons):
+    jeton_lecture, jeton_primaire = jetons
+    _lecture_seule.reset(jeton_lecture)
+    _primaire.reset(jeton_primaire)
+
+
+def lecture_seule(fonction):
+    """
+    Déclarer un service en lecture seule : ses requêtes peuvent lire une réplique
+
+    Un QuerySet renvoyé est évalué plus tard (gabarit, pagination) : il est
+    attaché dès maintenant à l'alias choisi.
+    """
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        jeton = _lecture_seule.set(True)
+        try:
+            resultat = fonction(*args, **kwargs)
+        finally:
+            _lecture_seule.reset(jeton)
+        if isinstance(resultat, QuerySet) and resultat._db is None:
+            resultat = resultat.using(alias_lecture())
+        return resultat
+    return enveloppe
+
+
+class RouteurRepliques:
+    """Routeur de DATABASE_ROUTERS (cf. docstring du module)"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in repliques() and not _primaire.get():
+            # Objets liés d'une instance lue sur une réplique : même réplique
+            return instance._state.db
+        if _lecture_seule.get():
+            return alias_lecture()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        forcer_primaire()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Répliques et base principale contiennent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Les répliques reçoivent le schéma par réplication
+        return db not in repliques()
@@ -0,0 +1,105 @@
+"""
+Services d'export des ventes pour les vendeurs
+"""
+
+import csv
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import LigneCommande
+
+
+class _Tampon:
+    """Pseudo-fichier : csv.writer écrit une ligne, on la renvoie telle quelle"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def _neutraliser_formule(texte):
+    """Préfixer d'une apostrophe un texte que le tableur prendrait pour une formule"""
+    if texte.startswith(('=', '+', '-', '@', '\t', '\r')):
+        return "'" + texte
+    return texte
+
+
+class ServiceExport:
+    """
+    Service pour exporter les lignes de commande d'un vendeur en CSV
+    """
+
+    ENTETES = (
+        'Commande', 'Date', 'Client', 'Produit',
+        'Quantité', 'Prix unitaire', 'Total ligne',
+    )
+
+    # Nombre de lignes lues à chaque aller-retour du curseur serveur
+    TAILLE_LOT = 2000
+
+    @staticmethod
+    def lignes_vendeur(vendeur_id, date_debut=None, date_fin=None):
+        """
+        Lignes de commande (hors paniers) contenant les produits d'un vendeur
+
+        Args:
+            vendeur_id: ID du vendeur
+            date_debut: Date (incluse) de début de période (optionnel)
+            date_fin: Date (incluse) de fin de période (optionnel)
+
+        Returns:
+            QuerySet: Tuples (commande_id, date, prénom, nom, produit,
+            quantité, prix unitaire)
+        """
+        lignes = LigneCommande.objects.filter(
+            produit__vendeur_id=vendeur_id
+        ).exclude(commande__statut='PANIER')
+
+        # Bornes converties en datetimes : pas de conversion de la colonne côté SQL
+        if date_debut:
+            debut = timezone.make_aware(datetime.combine(date_debut, time.min))
+            lignes = lignes.filter(commande__date_commande__gte=debut)
+
+        if date_fin:
+            fin = timezone.make_aware(datetime.combine(date_fin + timedelta(days=1), time.min))
+            lignes = lignes.filter(commande__date_commande__lt=fin)
+
+        return lignes.order_by('commande_id', 'id').values_list(
+            'commande_id',
+            'commande__date_commande',
+            'commande__client__first_name',
+            'commande__client__last_name',
+            'produit__nom',
+            'quantite',
+            'prix_unitaire',
+        )
+
+    @staticmethod
+    def exporter_csv(vendeur_id, date_debut=None, date_fin=None):
+        """
+        Générer l'export CSV ligne par ligne
+
+        Les lignes sont lues via un curseur côté serveur (``iterator()``) :
+        la mémoire reste constante quel que soit le nombre de commandes.
+
+        Yields:
+            str: Une ligne CSV (séparateur ';' pour les tableurs français)
+        """
+        writer = csv.writer(_Tampon(), delimiter=';')
+
+        # BOM pour qu'Excel détecte l'UTF-8
+        yield '\ufeff' + writer.writerow(ServiceExport.ENTETES)
+
+        lignes = ServiceExport.lignes_vendeur(vendeur_id, date_debut, date_fin)
+        for (commande_id, date_commande, prenom, nom, produit,
+             quantite, prix_unitaire) in lignes.iterator(chunk_size=ServiceExport.TAILLE_LOT):
+            yield writer.writerow([
+                commande_id,
+                timezone.localtime(date_commande).strftime('%Y-%m-%d %H:%M'),
+                # Noms saisis librement : jamais interprétés comme formules
+                _neutraliser_formule(f"{prenom} {nom}".strip()),
+                _neutraliser_formule(produit),
+                quantite,
+                prix_unitaire,
+                prix_unitaire * quantite,
+            ])
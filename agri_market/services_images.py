@@ -0,0 +1,188 @@
+"""
+Services de gestion des photos de produits
+
+La photo envoyée est enregistrée telle quelle pendant la requête (après une
+vérification rapide de l'en-tête). Les versions redimensionnées WebP et JPEG
+servies dans les pages sont produites ensuite, hors requête, par un pool de
+threads du processus : la génération démarre après la validation de la
+transaction et ne retarde jamais la réponse au vendeur.
+
+Un travail perdu (redémarrage du processus pendant la génération) est repris
+par la commande generer_variantes, à planifier régulièrement.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Produit
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceImages:
+    """
+    Service pour valider les photos et générer leurs versions redimensionnées
+    """
+
+    # Largeurs produites (px) : vignettes du catalogue, page produit, écrans larges
+    LARGEURS = (320, 640, 1280)
+
+    # Formats des variantes : (clé, format Pillow, extension, options d'enregistrement)
+    FORMATS = (
+        ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+        ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    )
+
+    FORMATS_ACCEPTES = ('JPEG', 'PNG', 'WEBP')
+    TAILLE_MAX = 8 * 1024 * 1024  # octets
+    PIXELS_MAX = 40_000_000  # protège le worker contre les images « bombes »
+
+    # Générations simultanées par processus
+    NB_WORKERS = 2
+
+    _executeur = None
+
+    @staticmethod
+    def valider_image(fichier):
+        """
+        Vérifier une photo envoyée sans la décoder entièrement
+
+        Args:
+            fichier: Fichier envoyé (UploadedFile)
+
+        Raises:
+            ValidationError: Si le fichier n'est pas une image acceptée
+        """
+        if fichier.size > ServiceImages.TAILLE_MAX:
+            raise ValidationError("La photo ne doit pas dépasser 8 Mo")
+
+        try:
+            with Image.open(fichier) as image:
+                format_image = image.format
+                largeur, hauteur = image.size
+                image.verify()
+        except Image.DecompressionBombError:
+            # Dimensions de l'en-tête au-delà du seuil de Pillow : refusée avant PIXELS_MAX
+            raise ValidationError("La photo est trop grande (40 mégapixels maximum)")
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise ValidationError("Le fichier envoyé n'est pas une image valide")
+        finally:
+            fichier.seek(0)
+
+        if format_image not in ServiceImages.FORMATS_ACCEPTES:
+            raise ValidationError("Formats acceptés : JPEG, PNG ou WebP")
+        if largeur * hauteur > ServiceImages.PIXELS_MAX:
+            raise ValidationError("La photo est trop grande (40 mégapixels maximum)")
+
+    @staticmethod
+    def planifier_variantes(produit_id):
+        """Générer les variantes en arrière-plan, après validation de la transaction courante"""
+        transaction.on_commit(
+            lambda: ServiceImages._pool().submit(ServiceImages._travail, produit_id)
+        )
+
+    @staticmethod
+    def _pool():
+        if ServiceImages._executeur is None:
+            ServiceImages._executeur = ThreadPoolExecutor(
+                max_workers=ServiceImages.NB_WORKERS, thread_name_prefix='variantes'
+            )
+        return ServiceImages._executeur
+
+    @staticmethod
+    def _travail(produit_id):
+        """Tâche du pool : une erreur est journalisée, la commande generer_variantes la reprendra"""
+        close_old_connections()
+        try:
+            ServiceImages.generer_variantes(produit_id)
+        except Exception:
+            logger.exception("Échec de la génération des variantes du produit %s", produit_id)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def generer_variantes(produit_id):
+        """
+        Produire les versions redimensionnées de la photo d'un produit
+
+        Args:
+            produit_id: ID du produit
+
+        Returns:
+            dict: Variantes enregistrées (vide si le produit n'a pas de photo)
+        """
+        produit = Produit.objects.filter(id=produit_id).only('id', 'image', 'image_variantes').first()
+        if produit is None or not produit.image:
+            return {}
+        nom_image = produit.image.name
+
+        with produit.image.open('rb') as fichier, Image.open(fichier) as image:
+            # Orientation de l'appareil photo appliquée aux pixels (les variantes n'ont pas d'EXIF)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+        base = os.path.splitext(os.path.basename(nom_image))[0]
+        variantes = {}
+        # Jamais d'agrandissement : une photo étroite fournit aussi sa taille d'origine
+        largeurs = [largeur for largeur in ServiceImages.LARGEURS if largeur < image.width]
+        if image.width <= ServiceImages.LARGEURS[-1]:
+            largeurs.append(image.width)
+
+        for largeur in largeurs:
+            hauteur = round(image.height * largeur / image.width)
+            redimensionnee = image.resize((largeur, hauteur), Image.LANCZOS)
+            variante = {'hauteur': hauteur}
+            for cle, format_pillow, extension, options in ServiceImages.FORMATS:
+                tampon = BytesIO()
+                redimensionnee.save(tampon, format_pillow, **options)
+                nom = f'produits/variantes/{produit_id}/{base}-{largeur}.{extension}'
+                if default_storage.exists(nom):
+                    default_storage.delete(nom)
+                variante[cle] = default_storage.save(nom, ContentFile(tampon.getvalue()))
+            variantes[str(largeur)] = variante
+
+        # Photo remplacée pendant la génération : ces variantes ne sont plus les bonnes
+        if not Produit.objects.filter(id=produit_id, image=nom_image).update(image_variantes=variantes):
+            ServiceImages.supprimer_fichiers(variantes)
+            return {}
+
+        ServiceImages._supprimer(
+            ServiceImages._fichiers(produit.image_variantes) - ServiceImages._fichiers(variantes)
+        )
+        return variantes
+
+    @staticmethod
+    def supprimer_fichiers(variantes, image=None):
+        """
+        Supprimer la photo d'origine et/ou ses variantes du stockage
+
+        Args:
+            variantes: Dictionnaire image_variantes
+            image: Nom de la photo d'origine (optionnel)
+        """
+        noms = ServiceImages._fichiers(variantes)
+        if image:
+            noms.add(image)
+        ServiceImages._supprimer(noms)
+
+    @staticmethod
+    def _fichiers(variantes):
+        return {
+            nom for variante in variantes.values()
+            for cle, nom in variante.items() if cle != 'hauteur'
+        }
+
+    @staticmethod
+    def _supprimer(noms):
+        for nom in noms:
+            try:
+                default_storage.delete(nom)
+            except OSError:
+                logger.warning("Fichier %s non supprimé", nom)
@@ -0,0 +1,186 @@
+"""
+Services d'import de produits en masse (fichier CSV) pour les vendeurs
+"""
+
+import codecs
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Categorie, Produit
+from .services_produit import ServiceProduit
+
+
+class ServiceImport:
+    """
+    Service pour créer ou mettre à jour les produits d'un vendeur depuis un CSV
+
+    Le fichier est lu ligne à ligne et traité par lots : un lot est validé
+    puis écrit avec un seul bulk_create (INSERT ... ON CONFLICT DO UPDATE sur
+    la contrainte unique vendeur + nom). Une ligne invalide n'empêche pas
+    l'import des autres ; elle est signalée dans le rapport.
+    """
+
+    # Colonnes attendues (en-tête obligatoire, ordre libre)
+    COLONNES = ('nom', 'categorie', 'prix', 'quantite', 'description')
+    COLONNES_OBLIGATOIRES = ('nom', 'categorie', 'prix', 'quantite')
+
+    # Lignes validées et écrites ensemble
+    TAILLE_LOT = 1000
+
+    # Erreurs conservées dans le rapport (les suivantes sont seulement comptées)
+    MAX_ERREURS = 200
+
+    @staticmethod
+    def lire_csv(fichier):
+        """
+        Lecteur CSV sur un fichier binaire (fichier envoyé ou ouvert en 'rb')
+
+        Le décodage est progressif : le fichier n'est jamais chargé en entier.
+        Le séparateur (';' ou ',') est déduit de la ligne d'en-tête.
+
+        Returns:
+            csv.DictReader: Lignes du fichier, clés en minuscules
+        """
+        texte = codecs.iterdecode(fichier, 'utf-8-sig')
+        premiere = next(texte, '')
+        separateur = ';' if premiere.count(';') >= premiere.count(',') else ','
+
+        def lignes():
+            yield premiere
+            yield from texte
+
+        lecteur = csv.DictReader(lignes(), delimiter=separateur)
+        lecteur.fieldnames = [nom.strip().lower() for nom in lecteur.fieldnames or []]
+        return lecteur
+
+    @staticmethod
+    def importer_csv(vendeur_id, fichier):
+        """
+        Importer les produits d'un vendeur depuis un fichier CSV
+
+        Args:
+            vendeur_id: ID du vendeur
+            fichier: Fichier binaire (UploadedFile ou fichier ouvert en 'rb')
+
+        Returns:
+            dict: lignes, crees, mis_a_jour, nb_erreurs, erreurs [(numéro de ligne, message)]
+        """
+        rapport = {'lignes': 0, 'crees': 0, 'mis_a_jour': 0, 'nb_erreurs': 0, 'erreurs': []}
+
+        try:
+            lecteur = ServiceImport.lire_csv(fichier)
+        except UnicodeDecodeError:
+            ServiceImport._erreur(rapport, 1, "Le fichier doit être encodé en UTF-8")
+            return rapport
+
+        manquantes = [c for c in ServiceImport.COLONNES_OBLIGATOIRES if c not in lecteur.fieldnames]
+        if manquantes:
+            ServiceImport._erreur(rapport, 1, f"Colonnes manquantes : {', '.join(manquantes)}")
+            return rapport
+
+        # Toutes les catégories en une requête, recherche insensible à la casse
+        categories = {
+            nom.strip().lower(): categorie_id
+            for categorie_id, nom in Categorie.objects.values_list('id', 'nom')
+        }
+        noms_vus = set()
+        lot = []
+
+        try:
+            for numero, ligne in enumerate(lecteur, start=2):
+                rapport['lignes'] += 1
+                produit = ServiceImport._valider_ligne(vendeur_id, ligne, categories, noms_vus)
+                if isinstance(produit, str):
+                    ServiceImport._erreur(rapport, numero, produit)
+                    continue
+
+                lot.append(produit)
+                if len(lot) >= ServiceImport.TAILLE_LOT:
+                    ServiceImport._ecrire_lot(vendeur_id, lot, rapport)
+                    lot = []
+        except UnicodeDecodeError:
+            ServiceImport._erreur(rapport, rapport['lignes'] + 1, "Le fichier doit être encodé en UTF-8")
+        except csv.Error as e:
+            ServiceImport._erreur(rapport, rapport['lignes'] + 1, f"CSV illisible : {e}")
+
+        if lot:
+            ServiceImport._ecrire_lot(vendeur_id, lot, rapport)
+
+        return rapport
+
+    @staticmethod
+    def _valider_ligne(vendeur_id, ligne, categories, noms_vus):
+        """Produit non enregistré, ou message d'erreur"""
+        nom = (ligne.get('nom') or '').strip()
+        if not nom:
+            return "Nom manquant"
+        if len(nom) > 150:
+            return "Nom trop long (150 caractères maximum)"
+        if nom in noms_vus:
+            return f"'{nom}' apparaît plusieurs fois dans le fichier"
+
+        categorie_id = categories.get((ligne.get('categorie') or '').strip().lower())
+        if categorie_id is None:
+            return f"Catégorie inconnue : '{ligne.get('categorie') or ''}'"
+
+        try:
+            prix = Decimal((ligne.get('prix') or '').strip().replace(',', '.'))
+        except InvalidOperation:
+            return f"Prix invalide : '{ligne.get('prix') or ''}'"
+        if not prix.is_finite():
+            return f"Prix invalide : '{ligne.get('prix') or ''}'"
+        # Bornes vérifiées sur le prix enregistré (arrondi au centime)
+        try:
+            prix = prix.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            return "Le prix doit être inférieur à 100 000 000"
+        if prix < ServiceProduit.PRIX_MIN:
+            return "Le prix doit être supérieur à 0"
+        if prix > ServiceProduit.PRIX_MAX:
+            return "Le prix doit être inférieur à 100 000 000"
+
+        try:
+            quantite = int((ligne.get('quantite') or '').strip())
+        except ValueError:
+            return f"Quantité invalide : '{ligne.get('quantite') or ''}'"
+        if quantite < 0:
+            return "La quantité ne peut pas être négative"
+        if quantite > ServiceProduit.QUANTITE_MAX:
+            return f"La quantité ne peut pas dépasser {ServiceProduit.QUANTITE_MAX}"
+
+        noms_vus.add(nom)
+        return Produit(
+            vendeur_id=vendeur_id,
+            categorie_id=categorie_id,
+            nom=nom,
+            description=(ligne.get('description') or '').strip(),
+            prix=prix,
+            quantite=quantite,
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def _ecrire_lot(vendeur_id, produits, rapport):
+        """Insérer ou mettre à jour un lot de produits en une requête"""
+        existants = Produit.objects.filter(
+            vendeur_id=vendeur_id,
+            nom__in=[produit.nom for produit in produits]
+        ).count()
+
+        Produit.objects.bulk_create(
+            produits,
+            update_conflicts=True,
+            unique_fields=['vendeur', 'nom'],
+            update_fields=['categorie', 'description', 'prix', 'quantite'],
+        )
+
+        rapport['mis_a_jour'] += existants
+        rapport['crees'] += len(produits) - existants
+
+    @staticmethod
+    def _erreur(rapport, numero, message):
+        rapport['nb_erreurs'] += 1
+        if len(rapport['erreurs']) < ServiceImport.MAX_ERREURS:
+            rapport['erreurs'].append((numero, message))
@@ -0,0 +1,519 @@
+"""
+Services de paiement en ligne des commandes
+
+Le client initie le paiement d'une commande EN_ATTENTE ; la passerelle
+(cf. passerelles_paiement) confirme ensuite le résultat par une notification
+signée, reçue par la vue notification_paiement. Seule cette notification fait
+passer la commande à PAYEE.
+
+Les passerelles renvoient leurs notifications tant qu'elles n'ont pas reçu de
+réponse 2xx, parfois en parallèle et dans le désordre. Le traitement est donc
+idempotent :
+- les statuts REUSSI et ECHEC sont définitifs : une notification ultérieure
+  est un doublon (même statut) ou un conflit (statut contraire), jamais
+  réappliquée ;
+- les écritures sont conditionnelles (UPDATE ... WHERE statut = 'EN_ATTENTE') :
+  de deux notifications simultanées, une seule change les statuts ;
+- chaque événement est journalisé (NotificationPaiement) avec une contrainte
+  d'unicité sur son identifiant : un événement rejoué est reconnu et sa
+  transaction annulée.
+"""
+
+import logging
+import secrets
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError, PermissionDenied
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Commande, Paiement, NotificationPaiement, PointDeReprise
+from .passerelles_paiement import ErreurPasserelle, Notification, obtenir_passerelle
+from .services_import import ServiceImport
+from . import metriques
+
+logger = logging.getLogger(__name__)
+
+
+class ServicePaiement:
+    """Service pour initier les paiements en ligne et appliquer les notifications"""
+
+    STATUTS_FINAUX = ('REUSSI', 'ECHEC')
+
+    # Ancienneté à partir de laquelle un paiement en attente peut être remplacé
+    DELAI_ABANDON = timedelta(minutes=15)
+
+    @staticmethod
+    def initier_paiement(commande_id, client_id, mode_paiement):
+        """
+        Initier le paiement en ligne d'une commande validée
+
+        Un paiement en cours du même mode est renvoyé tel quel, avec sa page de
+        confirmation : en ouvrir un second exposerait le client à un double
+        débit. Il ne peut être remplacé (autre mode, page perdue) qu'après
+        DELAI_ABANDON, une fois abandonné auprès de sa passerelle. Après un
+        échec, le paiement repart avec une nouvelle référence.
+
+        Args:
+            commande_id: ID de la commande
+            client_id: ID du client propriétaire
+            mode_paiement: Mode servi par une passerelle (MOBILE_MONEY, CARTE)
+
+        Returns:
+            tuple: (Paiement, URL de redirection vers la passerelle ou None)
+
+        Raises:
+            ValidationError: Si la commande n'est pas payable, si un autre paiement
+            est en cours ou si la passerelle échoue
+        """
+        passerelle = obtenir_passerelle(mode_paiement)
+
+        commande = ServicePaiement._commande_payable(Commande.objects.all(), commande_id, client_id)
+        en_cours = Paiement.objects.filter(commande=commande, statut='EN_ATTENTE').first()
+        abandonne = None
+        if en_cours is not None:
+            if not ServicePaiement._remplacable(en_cours, mode_paiement):
+                return en_cours, en_cours.url_redirection or None
+            # Appels réseau hors transaction : aucun verrou n'est tenu pendant l'attente
+            ServicePaiement._abandonner(en_cours)
+            abandonne = en_cours.reference
+
+        with transaction.atomic():
+            commande = ServicePaiement._commande_payable(
+                Commande.objects.select_for_update(), commande_id, client_id
+            )
+
+            paiement = Paiement.objects.filter(commande=commande).first()
+            if paiement is not None and paiement.statut == 'EN_ATTENTE' and paiement.reference != abandonne:
+                # Initié entre-temps (autre onglet)
+                return paiement, paiement.url_redirection or None
+            if paiement is not None and paiement.statut == 'REUSSI':
+                raise ValidationError("Cette commande est déjà payée")
+
+            if paiement is None:
+                paiement = Paiement(commande=commande, client_id=client_id)
+            paiement.reference = ServicePaiement._nouvelle_reference(commande.id)
+            paiement.reference_passerelle = ''
+            paiement.url_redirection = ''
+            paiement.montant = commande.montant_total
+            paiement.mode_paiement = mode_paiement
+            paiement.statut = 'EN_ATTENTE'
+            paiement.save()
+
+        try:
+            reponse = passerelle.initier(paiement)
+        except ErreurPasserelle:
+            logger.exception("Initiation du paiement %s refusée par la passerelle", paiement.reference)
+            Paiement.objects.filter(id=paiement.id, statut='EN_ATTENTE').update(
+                statut='ECHEC', date_mise_a_jour=timezone.now()
+            )
+            raise ValidationError("Le service de paiement est indisponible, réessayez plus tard")
+
+        paiement.reference_passerelle = reponse['reference_passerelle']
+        paiement.url_redirection = reponse.get('url_redirection') or ''
+        Paiement.objects.filter(id=paiement.id).update(
+            reference_passerelle=paiement.reference_passerelle,
+            url_redirection=paiement.url_redirection,
+        )
+        return paiement, paiement.url_redirection or None
+
+    @staticmethod
+    def _commande_payable(commandes, commande_id, client_id):
+        try:
+            commande = commandes.get(id=commande_id, client_id=client_id)
+        except Commande.DoesNotExist:
+            raise ValidationError("Commande introuvable")
+        if commande.statut != 'EN_ATTENTE':
+            raise ValidationError("Cette commande n'est pas en attente de paiement")
+        return commande
+
+    @staticmethod
+    def _remplacable(paiement, mode_paiement):
+        """
+        Un paiement en attente peut-il céder la place à un nouveau ?
+
+        Raises:
+            ValidationError: Si le client change de mode avant DELAI_ABANDON
+        """
+        restant = paiement.date_mise_a_jour + ServicePaiement.DELAI_ABANDON - timezone.now()
+        if restant.total_seconds() <= 0:
+            return True
+        if paiement.mode_paiement == mode_paiement:
+            return False
+        minutes = int(restant.total_seconds() // 60) + 1
+        raise ValidationError(
+            f"Un paiement par {paiement.get_mode_paiement_display()} est déjà en cours : "
+            f"confirmez-le, ou changez de moyen de paiement dans {minutes} minute(s)"
+        )
+
+    @staticmethod
+    def _abandonner(paiement):
+        """
+        Abandonner un paiement en attente auprès de sa passerelle
+
+        Le statut renvoyé par la passerelle est appliqué comme une notification
+        (journalisée) : un paiement abouti entre-temps n'est jamais remplacé.
+
+        Raises:
+            ValidationError: Si le paiement a abouti ou si la passerelle ne répond pas
+        """
+        try:
+            statut = obtenir_passerelle(paiement.mode_paiement).annuler(paiement.reference)
+        except ErreurPasserelle:
+            logger.exception("Abandon du paiement %s refusé par la passerelle", paiement.reference)
+            raise ValidationError("Le service de paiement est indisponible, réessayez plus tard")
+
+        ServicePaiement.appliquer_notification(
+            paiement.mode_paiement,
+            Notification(f"abandon:{paiement.reference}"[:100], paiement.reference, statut, None),
+        )
+        if statut == 'REUSSI':
+            raise ValidationError("Cette commande est déjà payée")
+
+    @staticmethod
+    def _nouvelle_reference(commande_id):
+        return f"PAY-{commande_id}-{secrets.token_hex(6).upper()}"
+
+    @staticmethod
+    def traiter_notification(mode_paiement, corps, signature):
+        """
+        Authentifier, décoder et appliquer une notification de passerelle
+
+        Args:
+            mode_paiement: Mode de paiement de la passerelle émettrice
+            corps: Corps brut de la requête (bytes)
+            signature: Signature transmise par la passerelle
+
+        Returns:
+            str: Résultat (APPLIQUEE, DOUBLON, IGNOREE, CONFLIT ou INCONNUE)
+
+        Raises:
+            PermissionDenied: Si la signature est invalide
+            ValidationError: Si le mode est inconnu ou la notification illisible
+        """
+        passerelle = obtenir_passerelle(mode_paiement)
+        if not passerelle.verifier_signature(corps, signature):
+            raise PermissionDenied("Signature invalide")
+        return ServicePaiement.appliquer_notification(mode_paiement, passerelle.lire_notification(corps))
+
+    @staticmethod
+    def appliquer_notification(passerelle, notification):
+        """
+        Appliquer une notification décodée (idempotent, cf. docstring du module)
+
+        Args:
+            passerelle: Nom de la passerelle émettrice (mode de paiement)
+            notification: Notification
+
+        Returns:
+            str: Résultat (APPLIQUEE, DOUBLON, IGNOREE, CONFLIT ou INCONNUE)
+        """
+        try:
+            with transaction.atomic():
+                # Verrou de ligne : les notifications d'une même référence sont traitées l'une après l'autre.
+                # Une passerelle ne règle que ses propres paiements (secret d'une autre passerelle : INCONNUE)
+                paiement = (
+                    Paiement.objects.select_for_update()
+                    .filter(reference=notification.reference, mode_paiement=passerelle)
+                    .only('id', 'commande_id', 'montant', 'statut')
+                    .first()
+                )
+                resultat = ServicePaiement._decider(paiement, notification)
+                if resultat == 'APPLIQUEE':
+                    resultat = ServicePaiement._appliquer(paiement, notification.statut)
+
+                NotificationPaiement.objects.create(
+                    passerelle=passerelle,
+                    identifiant=notification.identifiant,
+                    reference=notification.reference,
+                    paiement=paiement,
+                    statut=notification.statut,
+                    montant=notification.montant,
+                    resultat=resultat,
+                )
+        except IntegrityError:
+            # Événement déjà journalisé : la transaction (écritures comprises) est annulée
+            resultat = 'DOUBLON'
+
+        if resultat in ('CONFLIT', 'INCONNUE'):
+            logger.warning(
+                "Notification %s (%s, %s) : %s",
+                notification.identifiant, notification.reference, notification.statut, resultat,
+            )
+        metriques.incrementer('agri_paiements_notifications_total', resultat=resultat.lower())
+        return resultat
+
+    @staticmethod
+    def _decider(paiement, notification):
+        """Résultat d'une notification au vu du paiement verrouillé"""
+        if paiement is None:
+            return 'INCONNUE'
+        if notification.statut not in ServicePaiement.STATUTS_FINAUX:
+            # Étape intermédiaire, éventuellement reçue après le statut final
+            return 'IGNOREE'
+        if paiement.statut in ServicePaiement.STATUTS_FINAUX:
+            return 'DOUBLON' if paiement.statut == notification.statut else 'CONFLIT'
+        if (notification.statut == 'REUSSI' and notification.montant is not None
+                and notification.montant != paiement.montant):
+            return 'CONFLIT'
+        return 'APPLIQUEE'
+
+    @staticmethod
+    def _appliquer(paiement, statut):
+        """Passer le paiement (et la commande, si réussi) à leur statut final"""
+        maintenant = timezone.now()
+        if not Paiement.objects.filter(id=paiement.id, statut='EN_ATTENTE').update(
+            statut=statut, date_mise_a_jour=maintenant
+        ):
+            # Bases sans verrou de ligne : une notification concurrente est passée avant
+            actuel = Paiement.objects.filter(id=paiement.id).values_list('statut', flat=True).get()
+            return 'DOUBLON' if actuel == statut else 'CONFLIT'
+
+        if statut == 'REUSSI' and not Commande.objects.filter(
+            id=paiement.commande_id, statut='EN_ATTENTE'
+        ).update(statut='PAYEE', date_modification=maintenant):
+            # Commande annulée pendant le paiement : l'argent est encaissé, remboursement à prévoir
+            return 'CONFLIT'
+        return 'APPLIQUEE'
+
+
+class ServiceRapprochement:
+    """
+    Rapprochement des relevés de règlement des passerelles avec les paiements
+
+    Le relevé (CSV : reference, statut, montant) est lu en flux et traité par
+    lots. Pour chaque lot, dans une transaction : une requête charge et
+    verrouille les paiements concernés, un UPDATE par statut applique les
+    résultats, le journal est inséré en une requête et la position atteinte
+    dans le fichier est enregistrée (PointDeReprise). Relancé après une
+    interruption, le rapprochement reprend au premier lot non validé.
+
+    Les paiements encore EN_ATTENTE (absents du relevé, notification perdue)
+    sont ensuite consultés auprès de la passerelle par un pool de threads.
+    Les règles de décision sont celles des notifications (ServicePaiement).
+    """
+
+    COLONNES_OBLIGATOIRES = ('reference', 'statut')
+
+    # Lignes du relevé traitées par transaction
+    TAILLE_LOT = 1000
+
+    # Consultations simultanées de la passerelle
+    NB_WORKERS = 8
+
+    # Paiements plus récents : peut-être encore en cours chez le client, non consultés
+    DELAI_ATTENTE = timedelta(minutes=15)
+
+    # Écarts conservés dans le rapport (les suivants sont seulement comptés)
+    MAX_ECARTS = 200
+
+    @staticmethod
+    def rapprocher(mode_paiement, fichier, nom_releve, taille_lot=None, nb_workers=None,
+                   delai_attente=None, recommencer=False):
+        """
+        Rapprocher un relevé de règlement puis consulter les paiements restés en attente
+
+        Args:
+            mode_paiement: Mode de paiement de la passerelle émettrice
+            fichier: Relevé CSV ouvert en binaire
+            nom_releve: Nom du relevé (identifie sa position de reprise)
+            taille_lot: Lignes par transaction (défaut TAILLE_LOT)
+            nb_workers: Consultations simultanées de la passerelle (défaut NB_WORKERS)
+            delai_attente: Âge minimal des paiements consultés (défaut DELAI_ATTENTE)
+            recommencer: Ignorer la position enregistrée et relire tout le relevé
+
+        Returns:
+            dict: lignes, reprises, consultees, resultats (Counter), duree,
+            nb_ecarts, ecarts [(ligne ou None, référence, motif)]
+
+        Raises:
+            ValidationError: Si le mode est inconnu ou le relevé illisible
+        """
+        passerelle = obtenir_passerelle(mode_paiement)
+        taille_lot = taille_lot or ServiceRapprochement.TAILLE_LOT
+        rapport = {
+            'lignes': 0, 'reprises': 0, 'consultees': 0, 'resultats': Counter(),
+            'duree': 0, 'nb_ecarts': 0, 'ecarts': [],
+        }
+        debut = time.perf_counter()
+
+        point, _ = PointDeReprise.objects.get_or_create(
+            nom=f"rapprochement:{mode_paiement}:{nom_releve}"[:100]
+        )
+        if recommencer:
+            point.position = 0
+
+        try:
+            lecteur = ServiceImport.lire_csv(fichier)
+            manquantes = [c for c in ServiceRapprochement.COLONNES_OBLIGATOIRES if c not in lecteur.fieldnames]
+            if manquantes:
+                raise ValidationError(f"Colonnes manquantes : {', '.join(manquantes)}")
+
+            lot = []
+            for position, ligne in enumerate(lecteur, start=1):
+                if position <= point.position:
+                    rapport['reprises'] += 1
+                    continue
+                rapport['lignes'] += 1
+                # Ligne 1 : en-tête
+                lot.append((position + 1, ServiceRapprochement._lire_ligne(passerelle, nom_releve, position, ligne)))
+                if len(lot) >= taille_lot:
+                    ServiceRapprochement._traiter_lot(mode_paiement, lot, rapport, point, position)
+                    lot = []
+            if lot:
+                ServiceRapprochement._traiter_lot(mode_paiement, lot, rapport, point, position)
+        except UnicodeDecodeError:
+            raise ValidationError("Le relevé doit être encodé en UTF-8")
+
+        ServiceRapprochement._consulter_en_attente(
+            passerelle, taille_lot, nb_workers or ServiceRapprochement.NB_WORKERS,
+            delai_attente if delai_attente is not None else ServiceRapprochement.DELAI_ATTENTE,
+            rapport,
+        )
+        rapport['duree'] = time.perf_counter() - debut
+        return rapport
+
+    @staticmethod
+    def _lire_ligne(passerelle, nom_releve, position, ligne):
+        """Notification équivalente à une ligne du relevé, ou message d'erreur"""
+        reference = (ligne.get('reference') or '').strip()
+        if not reference:
+            return "Référence manquante"
+        statut = passerelle.STATUTS.get((ligne.get('statut') or '').strip().upper())
+        if statut is None:
+            return f"Statut inconnu : '{ligne.get('statut') or ''}'"
+        montant = (ligne.get('montant') or '').strip().replace(',', '.')
+        try:
+            montant = Decimal(montant) if montant else None
+        except InvalidOperation:
+            return f"Montant invalide : '{montant}'"
+        return Notification(f"releve:{nom_releve}:{position}"[:100], reference, statut, montant)
+
+    @staticmethod
+    def _traiter_lot(mode_paiement, lot, rapport, point=None, position=None):
+        """
+        Appliquer un lot de notifications en une transaction
+
+        Args:
+            lot: Liste de (numéro de ligne ou None, Notification ou message d'erreur)
+            point: PointDeReprise avancé à ``position`` dans la même transaction
+        """
+        with transaction.atomic():
+            # Paiements et commandes verrouillés dans l'ordre des id (pas d'interblocage entre lots)
+            paiements = {
+                paiement.reference: paiement
+                for paiement in Paiement.objects.select_for_update()
+                .select_related('commande')
+                .filter(
+                    mode_paiement=mode_paiement,
+                    reference__in={n.reference for _, n in lot if isinstance(n, Notification)},
+                )
+                .only('id', 'reference', 'montant', 'statut', 'commande__id', 'commande__statut')
+                .order_by('id')
+            }
+
+            a_appliquer = {'REUSSI': [], 'ECHEC': []}
+            commandes_payees = []
+            journal = []
+            for numero, notification in lot:
+                if not isinstance(notification, Notification):
+                    ServiceRapprochement._ecart(rapport, numero, '', notification)
+                    continue
+
+                paiement = paiements.get(notification.reference)
+                resultat = ServicePaiement._decider(paiement, notification)
+                if resultat == 'APPLIQUEE':
+                    a_appliquer[notification.statut].append(paiement.id)
+                    paiement.statut = notification.statut
+                    if notification.statut == 'REUSSI':
+                        if paiement.commande.statut == 'EN_ATTENTE':
+                            commandes_payees.append(paiement.commande.id)
+                            paiement.commande.statut = 'PAYEE'
+                        else:
+                            # Commande annulée pendant le paiement : remboursement à prévoir
+                            resultat = 'CONFLIT'
+
+                rapport['resultats'][resultat] += 1
+                if resultat in ('CONFLIT', 'INCONNUE'):
+                    ServiceRapprochement._ecart(
+                        rapport, numero, notification.reference,
+                        ServiceRapprochement._motif(paiement, notification)
+                    )
+                journal.append(NotificationPaiement(
+                    passerelle=mode_paiement,
+                    identifiant=notification.identifiant,
+                    reference=notification.reference,
+                    paiement=paiement,
+                    statut=notification.statut,
+                    montant=notification.montant,
+                    resultat=resultat,
+                ))
+
+            maintenant = timezone.now()
+            for statut, ids in a_appliquer.items():
+                if ids:
+                    Paiement.objects.filter(id__in=ids).update(statut=statut, date_mise_a_jour=maintenant)
+            if commandes_payees:
+                Commande.objects.filter(id__in=commandes_payees).update(
+                    statut='PAYEE', date_modification=maintenant
+                )
+            # Lot rejoué (--recommencer) : ses lignes sont déjà journalisées
+            NotificationPaiement.objects.bulk_create(journal, ignore_conflicts=True)
+
+            if point is not None:
+                point.position = position
+                point.save(update_fields=['position', 'date_maj'])
+
+    @staticmethod
+    def _consulter_en_attente(passerelle, taille_lot, nb_workers, delai_attente, rapport):
+        """Interroger la passerelle sur les paiements en attente, puis appliquer les réponses par lots"""
+        references = list(
+            Paiement.objects.filter(
+                mode_paiement=passerelle.mode_paiement,
+                statut='EN_ATTENTE',
+                date_paiement__lt=timezone.now() - delai_attente,
+            ).order_by('id').values_list('reference', flat=True)
+        )
+
+        def consulter(reference):
+            try:
+                return passerelle.consulter(reference)
+            except ErreurPasserelle as e:
+                return e
+
+        # Le pool ne fait que des appels réseau : aucune connexion à la base dans les threads
+        with ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix='rapprochement') as pool:
+            for debut in range(0, len(references), taille_lot):
+                tranche = references[debut:debut + taille_lot]
+                lot = []
+                for reference, statut in zip(tranche, pool.map(consulter, tranche)):
+                    rapport['consultees'] += 1
+                    if isinstance(statut, ErreurPasserelle):
+                        ServiceRapprochement._ecart(rapport, None, reference, f"passerelle indisponible ({statut})")
+                    elif statut is None:
+                        ServiceRapprochement._ecart(rapport, None, reference, "inconnu de la passerelle")
+                    elif statut != 'EN_ATTENTE':
+                        lot.append((None, Notification(f"consultation:{reference}:{statut}"[:100], reference, statut, None)))
+                if lot:
+                    ServiceRapprochement._traiter_lot(passerelle.mode_paiement, lot, rapport)
+
+    @staticmethod
+    def _motif(paiement, notification):
+        """Explication d'un écart (CONFLIT ou INCONNUE)"""
+        if paiement is None:
+            return "référence inconnue"
+        if paiement.statut in ServicePaiement.STATUTS_FINAUX and paiement.statut != notification.statut:
+            return f"{notification.statut} annoncé, paiement {paiement.statut}"
+        if notification.montant is not None and notification.montant != paiement.montant:
+            return f"montant {notification.montant} annoncé, {paiement.montant} attendu"
+        return f"commande {paiement.commande.statut} : remboursement à prévoir"
+
+    @staticmethod
+    def _ecart(rapport, numero, reference, motif):
+        rapport['nb_ecarts'] += 1
+        if len(rapport['ecarts']) < ServiceRapprochement.MAX_ECARTS:
+            rapport['ecarts'].append((numero, reference, motif))
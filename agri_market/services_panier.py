@@ -4,18 +4,28 @@ Auteur: Franck
 """
 
 from django.db import transaction
-from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
+from django.core.exceptions import ValidationError, PermissionDenied
 from decimal import Decimal
-from .models import Commande, LigneCommande, Produit, Utilisateur
+from .models import Commande, LigneCommande, Produit, Utilisateur, Paiement
+from .passerelles_paiement import modes_en_ligne
+from .services_statistiques import ServiceMeilleuresVentes
+from . import metriques, mise_en_cache
 
 
 class ServicePanier:
     """Service pour gérer le panier d'achat"""
     
     @staticmethod
-    def obtenir_ou_creer_panier(client_id):
+    def obtenir_ou_creer_panier(client_id, verrouiller=False):
         """
         Obtenir le panier actif d'un client ou en créer un nouveau
+        
+        Args:
+            client_id: ID du client
+            verrouiller: Verrouiller le panier (modification dans une transaction) :
+                une validation en cours est attendue, puis un nouveau panier est ouvert
         """
         try:
             client = Utilisateur.objects.get(id=client_id, role='CLIENT')
@@ -23,7 +33,8 @@ class ServicePanier:
             raise ValidationError("Client introuvable")
         
         # Chercher un panier existant
-        panier = Commande.objects.filter(
+        paniers = Commande.objects.select_for_update() if verrouiller else Commande.objects
+        panier = paniers.filter(
             client=client,
             statut='PANIER'
         ).first()
@@ -44,8 +55,11 @@ class ServicePanier:
         """
         Ajouter un produit au panier
         """
+        if quantite <= 0:
+            raise ValidationError("La quantité doit être supérieure à 0")
+        
         # Obtenir le panier
-        panier = ServicePanier.obtenir_ou_creer_panier(client_id)
+        panier = ServicePanier.obtenir_ou_creer_panier(client_id, verrouiller=True)
         
         # Vérifier le produit
         try:
@@ -55,6 +69,7 @@ class ServicePanier:
         
         # Vérifier le stock
         if produit.quantite < quantite:
+            metriques.incrementer('agri_conflits_stock_total', operation='ajout')
             raise ValidationError(f"Stock insuffisant. Disponible: {produit.quantite}")
         
         # Chercher si le produit est déjà dans le panier
@@ -68,6 +83,7 @@ class ServicePanier:
             nouvelle_quantite = ligne_existante.quantite + quantite
             
             if nouvelle_quantite > produit.quantite:
+                metriques.incrementer('agri_conflits_stock_total', operation='ajout')
                 raise ValidationError(f"Stock insuffisant. Disponible: {produit.quantite}")
             
             ligne_existante.quantite = nouvelle_quantite
@@ -85,6 +101,8 @@ class ServicePanier:
         # Recalculer le montant total
         ServicePanier._recalculer_montant(panier)
         
+        mise_en_cache.supprimer('panier', client_id)
+        metriques.incrementer('agri_panier_ajouts_total')
         return ligne
     
     @staticmethod
@@ -93,7 +111,7 @@ class ServicePanier:
         """
         Modifier la quantité d'un article dans le panier
         """
-        panier = ServicePanier.obtenir_ou_creer_panier(client_id)
+        panier = ServicePanier.obtenir_ou_creer_panier(client_id, verrouiller=True)
         
         try:
             ligne = LigneCommande.objects.select_related('produit').get(
@@ -107,12 +125,14 @@ class ServicePanier:
             ligne.delete()
         else:
             if nouvelle_quantite > ligne.produit.quantite:
+                metriques.incrementer('agri_conflits_stock_total', operation='modification')
                 raise ValidationError(f"Stock insuffisant. Disponible: {ligne.produit.quantite}")
             
             ligne.quantite = nouvelle_quantite
             ligne.save()
         
         ServicePanier._recalculer_montant(panier)
+        mise_en_cache.supprimer('panier', client_id)
     
     @staticmethod
     @transaction.atomic
@@ -120,7 +140,7 @@ class ServicePanier:
         """
         Retirer un produit du panier
         """
-        panier = ServicePanier.obtenir_ou_creer_panier(client_id)
+        panier = ServicePanier.obtenir_ou_creer_panier(client_id, verrouiller=True)
         
         try:
             ligne = LigneCommande.objects.get(id=ligne_id, commande=panier)
@@ -129,6 +149,7 @@ class ServicePanier:
             raise ValidationError("Article introuvable dans le panier")
         
         ServicePanier._recalculer_montant(panier)
+        mise_en_cache.supprimer('panier', client_id)
     
     @staticmethod
     def vider_panier(client_id):
@@ -137,6 +158,7 @@ class ServicePanier:
         panier.lignes.all().delete()
         panier.montant_total = Decimal('0')
         panier.save()
+        mise_en_cache.supprimer('panier', client_id)
     
     @staticmethod
     def obtenir_panier_avec_details(client_id):
@@ -173,20 +195,53 @@ class ServicePanier:
     @transaction.atomic
     def valider_commande(client_id, mode_retrait='LIVRAISON', adresse_livraison=''):
         """
-        Transformer le panier en commande validée
+        Transformer le panier en commande validée et réserver le stock
+        
+        Le panier est verrouillé d'abord : un double envoi attend la première
+        validation puis ne trouve plus de panier, et aucun article ne peut être
+        ajouté pendant la validation. Les produits sont ensuite verrouillés dans
+        l'ordre de leur id : deux validations concurrentes prennent leurs verrous
+        dans le même ordre et ne peuvent pas s'interbloquer. Le stock est
+        décrémenté sous ces verrous.
+        
+        Raises:
+            ValidationError: Si le panier est vide ou si un stock est insuffisant
         """
-        panier = ServicePanier.obtenir_ou_creer_panier(client_id)
+        try:
+            panier = Commande.objects.select_for_update().get(client_id=client_id, statut='PANIER')
+        except Commande.DoesNotExist:
+            raise ValidationError("Le panier est vide")
         
-        if not panier.lignes.exists():
+        # Lignes lues sous le verrou du panier
+        lignes = list(panier.lignes.all())
+        if not lignes:
             raise ValidationError("Le panier est vide")
         
+        produits = {
+            produit.id: produit
+            for produit in Produit.objects.select_for_update().filter(
+                id__in=[ligne.produit_id for ligne in lignes]
+            ).order_by('id')
+        }
+        
         # Vérifier les stocks pour tous les produits
-        for ligne in panier.lignes.select_related('produit').select_for_update():
-            if ligne.produit.quantite < ligne.quantite:
+        for ligne in lignes:
+            produit = produits[ligne.produit_id]
+            if produit.quantite < ligne.quantite:
+                metriques.incrementer('agri_conflits_stock_total', operation='validation')
                 raise ValidationError(
-                    f"Stock insuffisant pour {ligne.produit.nom}. "
-                    f"Disponible: {ligne.produit.quantite}"
+                    f"Stock insuffisant pour {produit.nom}. "
+                    f"Disponible: {produit.quantite}"
                 )
+            produit.quantite -= ligne.quantite
+        
+        # Une seule requête pour tous les produits (lignes déjà verrouillées)
+        Produit.objects.bulk_update(produits.values(), ['quantite'])
+        
+        # Compteurs des meilleures ventes (sous les mêmes verrous)
+        ServiceMeilleuresVentes.enregistrer_commande(
+            panier, {ligne.produit_id: ligne.quantite for ligne in lignes}
+        )
         
         # Changer le statut
         panier.statut = 'EN_ATTENTE'
@@ -195,6 +250,8 @@ class ServicePanier:
         # Créer des notifications pour les vendeurs
         ServicePanier._notifier_vendeurs(panier)
         
+        mise_en_cache.supprimer('panier', client_id)
+        metriques.incrementer('agri_commandes_validees_total')
         return panier
     
     @staticmethod
@@ -222,3 +279,108 @@ class ServicePanier:
         # Pour chaque vendeur, on pourrait envoyer un email ici
         # Pour l'instant on laisse juste la commande visible dans leur interface
         pass
+
+
+class ServiceCommande:
+    """Service pour gérer le cycle de vie des commandes validées"""
+    
+    # Statut actuel -> statuts autorisés
+    TRANSITIONS = {
+        'EN_ATTENTE': ('PAYEE', 'ANNULEE'),
+        'PAYEE': ('EXPEDIEE', 'ANNULEE'),
+        'EXPEDIEE': ('LIVREE',),
+    }
+    
+    @staticmethod
+    @transaction.atomic
+    def changer_statut(commande_id, vendeur_id, nouveau_statut):
+        """
+        Changer le statut d'une commande contenant des produits du vendeur
+        
+        Une annulation remet en stock les quantités réservées à la validation.
+        Une commande réglée en ligne passe à PAYEE par la notification de la
+        passerelle (cf. ServicePaiement), pas par le vendeur.
+        
+        Args:
+            commande_id: ID de la commande
+            vendeur_id: ID du vendeur qui effectue le changement
+            nouveau_statut: Statut demandé
+            
+        Returns:
+            Commande: La commande mise à jour
+            
+        Raises:
+            ValidationError: Si la commande est introuvable ou la transition invalide
+            PermissionDenied: Si la commande ne contient aucun produit du vendeur
+        """
+        try:
+            # Verrou : deux annulations simultanées ne remettent pas deux fois en stock
+            commande = Commande.objects.select_for_update().get(id=commande_id)
+        except Commande.DoesNotExist:
+            raise ValidationError("Commande introuvable")
+        
+        if not commande.lignes.filter(produit__vendeur_id=vendeur_id).exists():
+            raise PermissionDenied("Cette commande ne vous concerne pas")
+        
+        if commande.statut not in ServiceCommande.TRANSITIONS:
+            raise ValidationError("Impossible de modifier ce statut")
+        
+        if nouveau_statut not in ServiceCommande.TRANSITIONS[commande.statut]:
+            raise ValidationError("Transition de statut invalide")
+        
+        if nouveau_statut == 'PAYEE' and Paiement.objects.filter(
+            commande_id=commande.id, mode_paiement__in=modes_en_ligne()
+        ).exists():
+            # Un paiement en ligne n'est confirmé que par la notification de la passerelle
+            raise ValidationError("Cette commande est réglée en ligne : le paiement la confirmera")
+        
+        if nouveau_statut == 'ANNULEE':
+            ServiceCommande._remettre_en_stock(commande)
+        
+        commande.statut = nouveau_statut
+        commande.save()
+        return commande
+    
+    @staticmethod
+    def changer_statut_en_masse(commande_ids, nouveau_statut):
+        """
+        Changer le statut de plusieurs commandes en un seul UPDATE (actions de l'admin)
+        
+        Seules les commandes dont le statut actuel autorise la transition sont
+        modifiées. Les annulations (remise en stock) et les commandes réglées
+        en ligne (confirmées par la passerelle) restent hors des traitements
+        en masse.
+        
+        Args:
+            commande_ids: IDs des commandes
+            nouveau_statut: Statut demandé
+            
+        Returns:
+            int: Nombre de commandes modifiées
+            
+        Raises:
+            ValidationError: Si ce statut ne peut pas être appliqué en masse
+        """
+        sources = [
+            statut for statut, cibles in ServiceCommande.TRANSITIONS.items()
+            if nouveau_statut in cibles
+        ]
+        if not sources or nouveau_statut == 'ANNULEE':
+            raise ValidationError("Ce changement de statut n'est pas disponible en masse")
+        
+        commandes = Commande.objects.filter(id__in=commande_ids, statut__in=sources)
+        if nouveau_statut == 'PAYEE':
+            commandes = commandes.exclude(paiement__mode_paiement__in=modes_en_ligne())
+        # .update() ne renseigne pas date_modification (marque des agrégations incrémentales)
+        return commandes.update(statut=nouveau_statut, date_modification=timezone.now())
+    
+    @staticmethod
+    def _remettre_en_stock(commande):
+        """Rendre au stock les quantités d'une commande"""
+        quantites = dict(commande.lignes.values_list('produit_id', 'quantite'))
+        
+        # Mises à jour par id croissant : même ordre de verrouillage que valider_commande
+        for produit_id in sorted(quantites):
+            Produit.objects.filter(id=produit_id).update(quantite=F('quantite') + quantites[produit_id])
+        
+        ServiceMeilleuresVentes.enregistrer_commande(commande, quantites, signe=-1)
@@ -3,9 +3,15 @@ Services métier pour la gestion des produits agricoles
 Auteur: Pavel
 """
 
-from django.db import transaction
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, Subquery, When
+from django.db.models.functions import Greatest, Least, Round
 from django.core.exceptions import ValidationError, PermissionDenied
 from .models import Produit, Categorie, Utilisateur
+from . import metriques, mise_en_cache, routage_bdd
+from .services_images import ServiceImages
 
 
 class ServiceProduit:
@@ -13,8 +19,20 @@ class ServiceProduit:
     Service pour gérer toutes les opérations liées aux produits
     """
 
+    # Produits maximum par appel à ajuster_stocks
+    MAX_AJUSTEMENTS = 500
+    
+    # Bornes d'une révision de prix en masse (%) et prix extrêmes (DecimalField(10, 2))
+    REVISION_MIN = Decimal('-90')
+    REVISION_MAX = Decimal('100')
+    PRIX_MIN = Decimal('0.01')
+    PRIX_MAX = Decimal('99999999.99')
+    
+    # Plus grand stock enregistrable (PositiveIntegerField)
+    QUANTITE_MAX = 2147483647
+
     @staticmethod
-    def creer_produit(vendeur_id, nom, prix, quantite, categorie_id, description=""):
+    def creer_produit(vendeur_id, nom, prix, quantite, categorie_id, description="", image=None):
         """
         Créer un nouveau produit
         
@@ -25,6 +43,7 @@ class ServiceProduit:
             quantite: Quantité en stock
             categorie_id: ID de la catégorie
             description: Description du produit (optionnel)
+            image: Photo envoyée (optionnel, variantes générées en arrière-plan)
             
         Returns:
             Produit: Le produit créé
@@ -49,6 +68,12 @@ class ServiceProduit:
             if quantite < 0:
                 raise ValidationError("La quantité ne peut pas être négative")
             
+            if Produit.objects.filter(vendeur=vendeur, nom=nom).exists():
+                raise ValidationError(f"Vous avez déjà un produit nommé '{nom}'")
+            
+            if image:
+                ServiceImages.valider_image(image)
+            
             # Création du produit
             produit = Produit.objects.create(
                 vendeur=vendeur,
@@ -56,9 +81,13 @@ class ServiceProduit:
                 nom=nom,
                 description=description,
                 prix=prix,
-                quantite=quantite
+                quantite=quantite,
+                image=image
             )
             
+            if image:
+                ServiceImages.planifier_variantes(produit.id)
+            
             return produit
             
         except Utilisateur.DoesNotExist:
@@ -74,7 +103,7 @@ class ServiceProduit:
         Args:
             produit_id: ID du produit à modifier
             vendeur_id: ID du vendeur (pour vérification)
-            **kwargs: Champs à modifier (nom, prix, quantite, description, categorie_id)
+            **kwargs: Champs à modifier (nom, prix, quantite, description, categorie_id, image)
             
         Returns:
             Produit: Le produit modifié
@@ -92,6 +121,10 @@ class ServiceProduit:
             
             # Mise à jour des champs
             if 'nom' in kwargs:
+                if Produit.objects.filter(
+                    vendeur_id=vendeur_id, nom=kwargs['nom']
+                ).exclude(id=produit_id).exists():
+                    raise ValidationError(f"Vous avez déjà un produit nommé '{kwargs['nom']}'")
                 produit.nom = kwargs['nom']
             
             if 'description' in kwargs:
@@ -111,7 +144,19 @@ class ServiceProduit:
                 categorie = Categorie.objects.get(id=kwargs['categorie_id'])
                 produit.categorie = categorie
             
+            ancienne_image = None
+            if kwargs.get('image'):
+                ServiceImages.valider_image(kwargs['image'])
+                ancienne_image = (produit.image.name, produit.image_variantes)
+                produit.image = kwargs['image']
+                produit.image_variantes = {}
+            
             produit.save()
+            
+            if ancienne_image:
+                nom, variantes = ancienne_image
+                transaction.on_commit(lambda: ServiceImages.supprimer_fichiers(variantes, nom))
+                ServiceImages.planifier_variantes(produit.id)
             return produit
             
         except Produit.DoesNotExist:
@@ -141,13 +186,17 @@ class ServiceProduit:
             if produit.vendeur.id != vendeur_id:
                 raise PermissionDenied("Vous ne pouvez supprimer que vos propres produits")
             
+            nom_image, variantes = produit.image.name, produit.image_variantes
             produit.delete()
+            if nom_image:
+                transaction.on_commit(lambda: ServiceImages.supprimer_fichiers(variantes, nom_image))
             return True
             
         except Produit.DoesNotExist:
             raise ValidationError("Produit introuvable")
 
     @staticmethod
+    @routage_bdd.lecture_seule
     def obtenir_produit(produit_id):
         """
         Obtenir les détails d'un produit
@@ -163,6 +212,59 @@ class ServiceProduit:
         except Produit.DoesNotExist:
             raise ValidationError("Produit introuvable")
 
+    @staticmethod
+    async def aobtenir_produit(produit_id):
+        """
+        Version asynchrone de obtenir_produit (vues ASGI)
+        
+        Raises:
+            ValidationError: Si le produit n'existe pas
+        """
+        try:
+            return await Produit.objects.using(routage_bdd.alias_lecture()).select_related(
+                'vendeur', 'categorie'
+            ).aget(id=produit_id)
+        except Produit.DoesNotExist:
+            raise ValidationError("Produit introuvable")
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def produits_similaires(produit_id, limite=4):
+        """
+        Produits de la même catégorie qu'un produit, les plus consultés d'abord
+        
+        La catégorie est lue dans une sous-requête : la liste ne dépend pas
+        du chargement préalable du produit.
+        
+        Args:
+            produit_id: ID du produit de référence
+            limite: Nombre maximum de produits
+            
+        Returns:
+            QuerySet: Produits similaires
+        """
+        return Produit.objects.filter(
+            categorie_id=Subquery(Produit.objects.filter(id=produit_id).values('categorie_id'))
+        ).exclude(id=produit_id).select_related('vendeur').order_by('-vues')[:limite]
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def produits_populaires(limite=8, categorie_id=None):
+        """
+        Produits les plus consultés, lus dans l'index des compteurs de vues
+        
+        Args:
+            limite: Nombre maximum de produits
+            categorie_id: Restreindre à une catégorie (optionnel)
+            
+        Returns:
+            QuerySet: Produits par nombre de vues décroissant
+        """
+        produits = Produit.objects.filter(vues__gt=0)
+        if categorie_id is not None:
+            produits = produits.filter(categorie_id=categorie_id)
+        return produits.select_related('vendeur', 'categorie').order_by('-vues')[:limite]
+
     @staticmethod
     def lister_produits_vendeur(vendeur_id):
         """
@@ -179,6 +281,7 @@ class ServiceProduit:
         ).select_related('categorie').order_by('-date_ajout')
 
     @staticmethod
+    @routage_bdd.lecture_seule
     def lister_tous_produits():
         """
         Lister tous les produits disponibles (quantité > 0)
@@ -191,6 +294,7 @@ class ServiceProduit:
         ).select_related('vendeur', 'categorie').order_by('-date_ajout')
 
     @staticmethod
+    @routage_bdd.lecture_seule
     def rechercher_produits(terme_recherche):
         """
         Rechercher des produits par nom ou description
@@ -208,6 +312,7 @@ class ServiceProduit:
         ).select_related('vendeur', 'categorie')
 
     @staticmethod
+    @routage_bdd.lecture_seule
     def filtrer_par_categorie(categorie_id):
         """
         Filtrer les produits par catégorie
@@ -245,6 +350,7 @@ class ServiceProduit:
             nouvelle_quantite = produit.quantite + quantite_delta
             
             if nouvelle_quantite < 0:
+                metriques.incrementer('agri_conflits_stock_total', operation='ajustement')
                 raise ValidationError(f"Stock insuffisant. Disponible: {produit.quantite}")
             
             produit.quantite = nouvelle_quantite
@@ -256,6 +362,104 @@ class ServiceProduit:
             raise ValidationError("Produit introuvable")
 
 
+    @staticmethod
+    @transaction.atomic
+    def ajuster_stocks(vendeur_id, ajustements):
+        """
+        Ajuster le stock de plusieurs produits d'un vendeur en une transaction
+        
+        Les produits sont verrouillés par id croissant (même ordre que la
+        validation des commandes) puis mis à jour par un seul UPDATE. Si un
+        ajustement est refusé, aucun n'est appliqué.
+        
+        Args:
+            vendeur_id: ID du vendeur propriétaire des produits
+            ajustements: Liste de couples (produit_id, delta) ; les deltas
+                d'un même produit s'additionnent
+            
+        Returns:
+            dict: produit_id -> nouvelle quantité
+            
+        Raises:
+            ValidationError: Si la liste est invalide, un produit introuvable
+                ou un stock insuffisant ou trop grand
+            PermissionDenied: Si un produit appartient à un autre vendeur
+        """
+        deltas = {}
+        for produit_id, delta in ajustements:
+            deltas[produit_id] = deltas.get(produit_id, 0) + delta
+        
+        if not deltas:
+            raise ValidationError("Aucun ajustement fourni")
+        if len(deltas) > ServiceProduit.MAX_AJUSTEMENTS:
+            raise ValidationError(f"{ServiceProduit.MAX_AJUSTEMENTS} produits maximum par lot")
+        
+        # Seuls les produits du vendeur sont verrouillés
+        produits = list(
+            Produit.objects.select_for_update().filter(
+                id__in=deltas, vendeur_id=vendeur_id
+            ).order_by('id').values_list('id', 'quantite')
+        )
+        
+        manquants = set(deltas) - {produit_id for produit_id, _ in produits}
+        if manquants:
+            if Produit.objects.filter(id__in=manquants).exists():
+                raise PermissionDenied("Vous ne pouvez ajuster que vos propres produits")
+            raise ValidationError(f"Produit(s) introuvable(s) : {sorted(manquants)}")
+        
+        nouvelles_quantites = {}
+        for produit_id, quantite in produits:
+            nouvelle_quantite = quantite + deltas[produit_id]
+            if nouvelle_quantite < 0:
+                metriques.incrementer('agri_conflits_stock_total', operation='ajustement')
+                raise ValidationError(f"Stock insuffisant pour le produit {produit_id}. Disponible: {quantite}")
+            if nouvelle_quantite > ServiceProduit.QUANTITE_MAX:
+                raise ValidationError(
+                    f"Le stock du produit {produit_id} ne peut pas dépasser {ServiceProduit.QUANTITE_MAX}"
+                )
+            nouvelles_quantites[produit_id] = nouvelle_quantite
+        
+        Produit.objects.filter(id__in=deltas).update(quantite=Case(
+            *[When(id=produit_id, then=F('quantite') + delta) for produit_id, delta in deltas.items()],
+            default=F('quantite'),
+            output_field=models.PositiveIntegerField(),
+        ))
+        
+        return nouvelles_quantites
+
+
+    @staticmethod
+    def reviser_prix(produit_ids, pourcentage):
+        """
+        Augmenter ou baisser les prix de produits d'un pourcentage, en un seul UPDATE
+        
+        Les prix sont arrondis au centime et restent dans les bornes du modèle
+        (jamais nuls ni négatifs).
+        
+        Args:
+            produit_ids: IDs des produits à réviser
+            pourcentage: Variation en % (Decimal, ex. -10 pour une baisse de 10 %)
+            
+        Returns:
+            int: Nombre de produits modifiés
+            
+        Raises:
+            ValidationError: Si le pourcentage est nul ou hors bornes
+        """
+        if not pourcentage or not ServiceProduit.REVISION_MIN <= pourcentage <= ServiceProduit.REVISION_MAX:
+            raise ValidationError(
+                f"Le pourcentage doit être non nul et compris entre "
+                f"{ServiceProduit.REVISION_MIN} et {ServiceProduit.REVISION_MAX}"
+            )
+        
+        facteur = 1 + pourcentage / 100
+        return Produit.objects.filter(id__in=produit_ids).update(prix=Greatest(
+            Least(Round(F('prix') * facteur, 2), ServiceProduit.PRIX_MAX),
+            ServiceProduit.PRIX_MIN,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ))
+
+
 class ServiceCategorie:
     """
     Service pour gérer les catégories de produits
@@ -280,14 +484,17 @@ class ServiceCategorie:
         return categorie
 
     @staticmethod
+    @routage_bdd.lecture_seule
     def lister_categories():
         """
         Lister toutes les catégories
         
         Returns:
-            QuerySet: Toutes les catégories
+            list: Toutes les catégories, par nom (mises en cache, cf. signals)
         """
-        return Categorie.objects.all().order_by('nom')
+        return mise_en_cache.obtenir_ou_calculer(
+            'categories', ('toutes',), lambda: list(Categorie.objects.all().order_by('nom'))
+        )
 
     @staticmethod
     def obtenir_categorie(categorie_id):
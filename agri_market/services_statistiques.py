@@ -0,0 +1,736 @@
+"""
+Services de statistiques pour les tableaux de bord
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
+
+from . import mise_en_cache, routage_bdd
+from .models import (
+    Utilisateur, Produit, Commande, LigneCommande,
+    VenteJournaliere, VenteProduitJournaliere, PointDeReprise, CompteurVentesJour,
+)
+
+
+# Statuts comptés comme des ventes (les paniers et annulations sont exclus)
+STATUTS_VENTE = ('EN_ATTENTE', 'PAYEE', 'EXPEDIEE', 'LIVREE')
+
+# Fenêtres (en jours) proposées dans l'analyse des ventes vendeur
+FENETRES_ANALYSE = (7, 30, 365)
+
+# Nombre de produits détaillés (séries) dans l'analyse vendeur
+NB_PRODUITS_ANALYSE = 10
+
+# Durée de vie en cache d'une analyse vendeur (secondes)
+DUREE_CACHE_ANALYSE = 300
+
+
+class ServiceStatistiques:
+    """
+    Service pour calculer les statistiques de la plateforme
+    """
+
+    @staticmethod
+    def statistiques_plateforme():
+        """
+        Compteurs globaux du dashboard administrateur, mis en cache une minute
+
+        Returns:
+            dict: total_users, total_vendeurs, total_clients, total_produits,
+            total_commandes, commandes_attente, commandes_payees, commandes_livrees
+        """
+        return mise_en_cache.obtenir_ou_calculer(
+            'dashboard', ('statistiques',), ServiceStatistiques._calculer_statistiques_plateforme
+        )
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def _calculer_statistiques_plateforme():
+        """
+        Une seule agrégation conditionnelle par table au lieu d'un COUNT
+        par indicateur
+        """
+        stats = Utilisateur.objects.aggregate(
+            total_users=Count('id'),
+            total_vendeurs=Count('id', filter=Q(role='VENDEUR')),
+            total_clients=Count('id', filter=Q(role='CLIENT')),
+        )
+
+        stats.update(Commande.objects.aggregate(
+            total_commandes=Count('id', filter=~Q(statut='PANIER')),
+            commandes_attente=Count('id', filter=Q(statut='EN_ATTENTE')),
+            commandes_payees=Count('id', filter=Q(statut='PAYEE')),
+            commandes_livrees=Count('id', filter=Q(statut='LIVREE')),
+        ))
+
+        stats['total_produits'] = Produit.objects.count()
+
+        return stats
+
+    @staticmethod
+    def _filtrer_utilisateurs(utilisateurs, recherche):
+        """Appliquer la recherche (nom, username, email, boutique)"""
+        if recherche:
+            utilisateurs = utilisateurs.filter(
+                Q(username__icontains=recherche)
+                | Q(email__icontains=recherche)
+                | Q(first_name__icontains=recherche)
+                | Q(last_name__icontains=recherche)
+                | Q(nom_boutique__icontains=recherche)
+            )
+        return utilisateurs
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def lister_vendeurs(recherche=''):
+        """
+        Lister les vendeurs, sans compteur (cf. compter_produits)
+
+        Args:
+            recherche: Terme de recherche (optionnel)
+
+        Returns:
+            QuerySet: Vendeurs, les plus récents d'abord
+        """
+        vendeurs = Utilisateur.objects.filter(role='VENDEUR')
+        return ServiceStatistiques._filtrer_utilisateurs(vendeurs, recherche).order_by('-date_joined', '-id')
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def lister_clients(recherche=''):
+        """
+        Lister les clients, sans compteur (cf. compter_commandes)
+
+        Args:
+            recherche: Terme de recherche (optionnel)
+
+        Returns:
+            QuerySet: Clients, les plus récents d'abord
+        """
+        clients = Utilisateur.objects.filter(role='CLIENT')
+        return ServiceStatistiques._filtrer_utilisateurs(clients, recherche).order_by('-date_joined', '-id')
+
+    @staticmethod
+    def _renseigner_compteur(utilisateurs, lignes, champ_utilisateur, attribut):
+        """
+        Compter les lignes liées aux seuls utilisateurs affichés
+
+        Une jointure agrégée avant pagination grouperait toute la table ;
+        ici un seul GROUP BY porte sur les ids de la page.
+        """
+        utilisateurs = list(utilisateurs)
+        compteurs = dict(
+            lignes.filter(**{f'{champ_utilisateur}__in': [u.id for u in utilisateurs]})
+            .values_list(champ_utilisateur)
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        for utilisateur in utilisateurs:
+            setattr(utilisateur, attribut, compteurs.get(utilisateur.id, 0))
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def compter_produits(vendeurs):
+        """
+        Renseigner ``nb_produits`` sur une page de vendeurs
+
+        Args:
+            vendeurs: Vendeurs affichés (page de lister_vendeurs)
+        """
+        ServiceStatistiques._renseigner_compteur(vendeurs, Produit.objects, 'vendeur_id', 'nb_produits')
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def compter_commandes(clients):
+        """
+        Renseigner ``nb_commandes`` sur une page de clients
+
+        Args:
+            clients: Clients affichés (page de lister_clients)
+        """
+        ServiceStatistiques._renseigner_compteur(clients, Commande.objects, 'client_id', 'nb_commandes')
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def commandes_recentes(limite=20):
+        """
+        Dernières commandes validées avec leur nombre d'articles
+
+        Args:
+            limite: Nombre maximum de commandes
+
+        Returns:
+            QuerySet: Commandes annotées avec ``nb_articles``
+        """
+        return Commande.objects.exclude(
+            statut='PANIER'
+        ).select_related('client').annotate(
+            nb_articles=Count('lignes')
+        ).order_by('-date_commande')[:limite]
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def totaux_ventes(vendeur_id=None):
+        """
+        Totaux des ventes lus dans les agrégats journaliers
+
+        Args:
+            vendeur_id: Restreindre à un vendeur (optionnel)
+
+        Returns:
+            dict: chiffre_affaires, unites
+        """
+        ventes = VenteJournaliere.objects.filter(statut__in=STATUTS_VENTE)
+        if vendeur_id:
+            ventes = ventes.filter(vendeur_id=vendeur_id)
+
+        totaux = ventes.aggregate(
+            chiffre_affaires=Sum('chiffre_affaires'),
+            unites=Sum('unites'),
+        )
+        return {
+            'chiffre_affaires': totaux['chiffre_affaires'] or Decimal('0'),
+            'unites': totaux['unites'] or 0,
+        }
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def ventes_par_jour(jours=30, vendeur_id=None):
+        """
+        Série journalière des ventes sur les derniers jours
+
+        Args:
+            jours: Taille de la fenêtre en jours
+            vendeur_id: Restreindre à un vendeur (optionnel)
+
+        Returns:
+            list: Un dict par jour (jour, chiffre_affaires, unites, pourcentage),
+            jours sans vente inclus ; ``pourcentage`` est relatif au meilleur jour
+        """
+        fin = timezone.localdate()
+        debut = fin - timedelta(days=jours - 1)
+
+        ventes = VenteJournaliere.objects.filter(
+            jour__gte=debut,
+            statut__in=STATUTS_VENTE
+        )
+        if vendeur_id:
+            ventes = ventes.filter(vendeur_id=vendeur_id)
+
+        par_jour = {
+            ligne['jour']: ligne
+            for ligne in ventes.values('jour').annotate(
+                chiffre_affaires=Sum('chiffre_affaires'),
+                unites=Sum('unites'),
+            )
+        }
+
+        serie = []
+        for decalage in range(jours):
+            jour = debut + timedelta(days=decalage)
+            ligne = par_jour.get(jour, {})
+            serie.append({
+                'jour': jour,
+                'chiffre_affaires': ligne.get('chiffre_affaires') or Decimal('0'),
+                'unites': ligne.get('unites') or 0,
+            })
+
+        maximum = max((point['chiffre_affaires'] for point in serie), default=0)
+        for point in serie:
+            point['pourcentage'] = int(point['chiffre_affaires'] * 100 / maximum) if maximum else 0
+
+        return serie
+
+    @staticmethod
+    def analyse_vendeur(vendeur_id, fenetre=30):
+        """
+        Analyse des ventes d'un vendeur, mise en cache par vendeur et fenêtre
+
+        Args:
+            vendeur_id: ID du vendeur
+            fenetre: Nombre de jours (une valeur de FENETRES_ANALYSE)
+
+        Returns:
+            dict: Données sérialisables en JSON (voir ``_calculer_analyse_vendeur``)
+        """
+        if fenetre not in FENETRES_ANALYSE:
+            fenetre = 30
+
+        return mise_en_cache.obtenir_ou_calculer(
+            'analyse_vendeur',
+            (vendeur_id, fenetre),
+            lambda: ServiceStatistiques._calculer_analyse_vendeur(vendeur_id, fenetre),
+            DUREE_CACHE_ANALYSE,
+        )
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def _calculer_analyse_vendeur(vendeur_id, fenetre):
+        """
+        Construire l'analyse à partir des agrégats par produit (jamais des lignes brutes)
+
+        Returns:
+            dict: fenetre, debut, total, produits (meilleurs produits avec leurs
+            séries journalières ``serie_ca`` / ``serie_unites``), statuts
+        """
+        debut = timezone.localdate() - timedelta(days=fenetre - 1)
+        ventes = VenteProduitJournaliere.objects.filter(vendeur_id=vendeur_id, jour__gte=debut)
+
+        # Répartition par statut (annulations comprises)
+        libelles = dict(Commande.STATUT_CHOICES)
+        statuts = [
+            {
+                'statut': ligne['statut'],
+                'libelle': libelles.get(ligne['statut'], ligne['statut']),
+                'chiffre_affaires': float(ligne['chiffre_affaires']),
+                'unites': ligne['unites'],
+            }
+            for ligne in ventes.values('statut').annotate(
+                chiffre_affaires=Sum('chiffre_affaires'),
+                unites=Sum('unites'),
+            ).order_by('-chiffre_affaires')
+        ]
+
+        ventes = ventes.filter(statut__in=STATUTS_VENTE)
+
+        # Meilleurs produits de la fenêtre
+        produits = [
+            {
+                'id': ligne['produit_id'],
+                'nom': ligne['produit__nom'],
+                'chiffre_affaires': float(ligne['chiffre_affaires']),
+                'unites': ligne['unites'],
+                'serie_ca': [0] * fenetre,
+                'serie_unites': [0] * fenetre,
+            }
+            for ligne in ventes.values('produit_id', 'produit__nom').annotate(
+                chiffre_affaires=Sum('chiffre_affaires'),
+                unites=Sum('unites'),
+            ).order_by('-chiffre_affaires', 'produit_id')[:NB_PRODUITS_ANALYSE]
+        ]
+
+        # Séries journalières des meilleurs produits
+        index_produits = {produit['id']: produit for produit in produits}
+        points = ventes.filter(produit_id__in=index_produits).values('jour', 'produit_id').annotate(
+            chiffre_affaires=Sum('chiffre_affaires'),
+            unites=Sum('unites'),
+        ).order_by()
+        for point in points:
+            produit = index_produits[point['produit_id']]
+            position = (point['jour'] - debut).days
+            produit['serie_ca'][position] = float(point['chiffre_affaires'])
+            produit['serie_unites'][position] = point['unites']
+
+        ventes_statuts = [ligne for ligne in statuts if ligne['statut'] in STATUTS_VENTE]
+        total = {
+            'chiffre_affaires': sum(ligne['chiffre_affaires'] for ligne in ventes_statuts),
+            'unites': sum(ligne['unites'] for ligne in ventes_statuts),
+        }
+
+        return {
+            'fenetre': fenetre,
+            'debut': debut.isoformat(),
+            'total': total,
+            'produits': produits,
+            'statuts': statuts,
+        }
+
+
+class ServiceAgregationVentes:
+    """
+    Service pour maintenir les agrégats journaliers de ventes
+
+    Un jour est toujours recalculé en entier depuis les lignes de commande :
+    la mise à jour incrémentale se contente de trouver les jours touchés
+    depuis la dernière exécution.
+    """
+
+    NOM_POINT_DE_REPRISE = 'ventes_journalieres'
+
+    # Recouvrement avec l'exécution précédente, pour les transactions
+    # validées après la lecture de la marque
+    MARGE_REPRISE = timedelta(minutes=5)
+
+    @staticmethod
+    def _bornes_jour(jour):
+        """Début (inclus) et fin (exclue) d'un jour dans le fuseau courant"""
+        debut = timezone.make_aware(datetime.combine(jour, time.min))
+        fin = timezone.make_aware(datetime.combine(jour + timedelta(days=1), time.min))
+        return debut, fin
+
+    @staticmethod
+    def agregats_source(jour):
+        """
+        Agréger un jour directement depuis les lignes de commande
+
+        Args:
+            jour: Date à agréger
+
+        Returns:
+            dict: (vendeur_id, categorie_id, statut) -> (chiffre_affaires, unites, nb_commandes)
+        """
+        debut, fin = ServiceAgregationVentes._bornes_jour(jour)
+
+        lignes = LigneCommande.objects.filter(
+            commande__date_commande__gte=debut,
+            commande__date_commande__lt=fin
+        ).exclude(commande__statut='PANIER')
+
+        agregats = lignes.values(
+            'produit__vendeur_id', 'produit__categorie_id', 'commande__statut'
+        ).annotate(
+            chiffre_affaires=Sum(ExpressionWrapper(
+                F('quantite') * F('prix_unitaire'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )),
+            unites=Sum('quantite'),
+            nb_commandes=Count('commande_id', distinct=True),
+        ).order_by()
+
+        return {
+            (a['produit__vendeur_id'], a['produit__categorie_id'], a['commande__statut']): (
+                Decimal(str(a['chiffre_affaires'])).quantize(Decimal('0.01')),
+                a['unites'],
+                a['nb_commandes'],
+            )
+            for a in agregats
+        }
+
+    @staticmethod
+    def agregats_produits_source(jour):
+        """
+        Agréger un jour par produit directement depuis les lignes de commande
+
+        Args:
+            jour: Date à agréger
+
+        Returns:
+            dict: (produit_id, statut) -> (vendeur_id, chiffre_affaires, unites)
+        """
+        debut, fin = ServiceAgregationVentes._bornes_jour(jour)
+
+        agregats = LigneCommande.objects.filter(
+            commande__date_commande__gte=debut,
+            commande__date_commande__lt=fin
+        ).exclude(
+            commande__statut='PANIER'
+        ).values(
+            'produit_id', 'produit__vendeur_id', 'commande__statut'
+        ).annotate(
+            chiffre_affaires=Sum(ExpressionWrapper(
+                F('quantite') * F('prix_unitaire'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )),
+            unites=Sum('quantite'),
+        ).order_by()
+
+        return {
+            (a['produit_id'], a['commande__statut']): (
+                a['produit__vendeur_id'],
+                Decimal(str(a['chiffre_affaires'])).quantize(Decimal('0.01')),
+                a['unites'],
+            )
+            for a in agregats
+        }
+
+    @staticmethod
+    def agregats_stockes(jour):
+        """
+        Lire les agrégats enregistrés pour un jour
+
+        Returns:
+            dict: Même format que ``agregats_source``
+        """
+        return {
+            (v.vendeur_id, v.categorie_id, v.statut): (v.chiffre_affaires, v.unites, v.nb_commandes)
+            for v in VenteJournaliere.objects.filter(jour=jour)
+        }
+
+    @staticmethod
+    def agregats_produits_stockes(jour):
+        """
+        Lire les agrégats par produit enregistrés pour un jour
+
+        Returns:
+            dict: Même format que ``agregats_produits_source``
+        """
+        return {
+            (v.produit_id, v.statut): (v.vendeur_id, v.chiffre_affaires, v.unites)
+            for v in VenteProduitJournaliere.objects.filter(jour=jour)
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def recalculer_jour(jour):
+        """
+        Reconstruire les agrégats d'un jour depuis les données source
+
+        Args:
+            jour: Date à reconstruire
+
+        Returns:
+            int: Nombre de lignes d'agrégat écrites
+        """
+        agregats = ServiceAgregationVentes.agregats_source(jour)
+        agregats_produits = ServiceAgregationVentes.agregats_produits_source(jour)
+
+        VenteJournaliere.objects.filter(jour=jour).delete()
+        VenteJournaliere.objects.bulk_create([
+            VenteJournaliere(
+                jour=jour,
+                vendeur_id=vendeur_id,
+                categorie_id=categorie_id,
+                statut=statut,
+                chiffre_affaires=chiffre_affaires,
+                unites=unites,
+                nb_commandes=nb_commandes,
+            )
+            for (vendeur_id, categorie_id, statut), (chiffre_affaires, unites, nb_commandes)
+            in agregats.items()
+        ])
+
+        VenteProduitJournaliere.objects.filter(jour=jour).delete()
+        VenteProduitJournaliere.objects.bulk_create([
+            VenteProduitJournaliere(
+                jour=jour,
+                produit_id=produit_id,
+                vendeur_id=vendeur_id,
+                statut=statut,
+                chiffre_affaires=chiffre_affaires,
+                unites=unites,
+            )
+            for (produit_id, statut), (vendeur_id, chiffre_affaires, unites)
+            in agregats_produits.items()
+        ])
+
+        # Les analyses vendeur en cache reposent sur ces agrégats
+        transaction.on_commit(lambda: mise_en_cache.invalider('analyse_vendeur'))
+
+        return len(agregats) + len(agregats_produits)
+
+    @staticmethod
+    def mettre_a_jour():
+        """
+        Recalculer les jours touchés depuis la dernière exécution
+
+        Returns:
+            list: Jours recalculés
+        """
+        maintenant = timezone.now()
+        point, _ = PointDeReprise.objects.get_or_create(
+            nom=ServiceAgregationVentes.NOM_POINT_DE_REPRISE
+        )
+
+        commandes = Commande.objects.exclude(statut='PANIER').filter(
+            date_modification__lte=maintenant
+        )
+        if point.date_marque:
+            commandes = commandes.filter(
+                date_modification__gt=point.date_marque - ServiceAgregationVentes.MARGE_REPRISE
+            )
+
+        jours = sorted(set(
+            commandes.annotate(jour=TruncDate('date_commande')).values_list('jour', flat=True)
+        ))
+
+        for jour in jours:
+            ServiceAgregationVentes.recalculer_jour(jour)
+
+        point.date_marque = maintenant
+        point.save()
+
+        return jours
+
+    @staticmethod
+    def verifier_jour(jour):
+        """
+        Comparer les agrégats enregistrés d'un jour avec les données source
+
+        Args:
+            jour: Date à vérifier
+
+        Returns:
+            list: Écarts (table, cle, valeur_stockee, valeur_source) ; vide si cohérent
+        """
+        comparaisons = (
+            ('vendeur×catégorie',
+             ServiceAgregationVentes.agregats_stockes(jour),
+             ServiceAgregationVentes.agregats_source(jour)),
+            ('produit',
+             ServiceAgregationVentes.agregats_produits_stockes(jour),
+             ServiceAgregationVentes.agregats_produits_source(jour)),
+        )
+
+        return [
+            (table, cle, stockes.get(cle), source.get(cle))
+            for table, stockes, source in comparaisons
+            for cle in sorted(set(source) | set(stockes), key=str)
+            if stockes.get(cle) != source.get(cle)
+        ]
+
+
+class ServiceMeilleuresVentes:
+    """
+    Classements des meilleures ventes (global et par catégorie) sur des fenêtres glissantes
+
+    Les unités vendues sont comptées par produit et par jour dans
+    CompteurVentesJour au moment où une commande est validée ou annulée :
+    un classement additionne au plus fenêtre × produits vendus lignes de
+    compteurs, jamais les lignes de commande. Tous les classements d'une
+    fenêtre sont calculés en une fois et servis par une seule lecture du cache.
+    """
+
+    # Fenêtres proposées (jours)
+    FENETRES = (7, 30)
+    FENETRE_PAR_DEFAUT = 30
+
+    # Produits par classement
+    TAILLE_CLASSEMENT = 8
+
+    @staticmethod
+    def enregistrer_commande(commande, quantites=None, signe=1):
+        """
+        Ajouter (signe=1, validation) ou retirer (signe=-1, annulation) les unités d'une commande
+
+        À appeler dans la transaction qui valide ou annule la commande, produits
+        verrouillés : deux commandes du même produit ne créent pas deux fois
+        le même compteur.
+
+        Args:
+            commande: Commande validée ou annulée
+            quantites: {produit_id: unités} si déjà connues (défaut : lignes de la commande)
+            signe: 1 ou -1
+        """
+        if quantites is None:
+            quantites = dict(commande.lignes.values_list('produit_id', 'quantite'))
+        if not quantites:
+            return
+
+        jour = timezone.localdate(commande.date_commande)
+        compteurs = CompteurVentesJour.objects.filter(jour=jour)
+
+        existants = set(compteurs.filter(produit_id__in=quantites).values_list('produit_id', flat=True))
+        if existants:
+            # Un UPDATE par quantité distincte (le plus souvent 1 à 3)
+            par_quantite = defaultdict(list)
+            for produit_id in existants:
+                par_quantite[quantites[produit_id]].append(produit_id)
+            for unites, produit_ids in sorted(par_quantite.items()):
+                compteurs.filter(produit_id__in=sorted(produit_ids)).update(
+                    unites=F('unites') + signe * unites
+                )
+
+        # Annulation d'une commande antérieure aux compteurs : rien à retirer
+        if signe > 0:
+            CompteurVentesJour.objects.bulk_create([
+                CompteurVentesJour(jour=jour, produit_id=produit_id, unites=unites)
+                for produit_id, unites in sorted(quantites.items())
+                if produit_id not in existants
+            ])
+
+    @staticmethod
+    @transaction.atomic
+    def reconstruire(jours=None):
+        """
+        Recalculer les compteurs depuis les lignes de commande (mise en service, contrôle)
+
+        Args:
+            jours: Nombre de jours recalculés (défaut : tout l'historique)
+
+        Returns:
+            int: Nombre de compteurs écrits
+        """
+        compteurs = CompteurVentesJour.objects.all()
+        lignes = LigneCommande.objects.filter(commande__statut__in=STATUTS_VENTE)
+        if jours:
+            debut = timezone.localdate() - timedelta(days=jours - 1)
+            compteurs = compteurs.filter(jour__gte=debut)
+            lignes = lignes.filter(
+                commande__date_commande__gte=ServiceAgregationVentes._bornes_jour(debut)[0]
+            )
+
+        compteurs.delete()
+        crees = CompteurVentesJour.objects.bulk_create([
+            CompteurVentesJour(jour=ligne['jour'], produit_id=ligne['produit_id'], unites=ligne['unites'])
+            for ligne in lignes.annotate(jour=TruncDate('commande__date_commande')).values(
+                'jour', 'produit_id'
+            ).annotate(unites=Sum('quantite')).order_by().iterator()
+        ], batch_size=1000)
+
+        transaction.on_commit(lambda: mise_en_cache.invalider('meilleures_ventes'))
+        return len(crees)
+
+    @staticmethod
+    def classements(fenetre=None):
+        """
+        Tous les classements d'une fenêtre (une lecture du cache)
+
+        Args:
+            fenetre: Nombre de jours (une valeur de FENETRES)
+
+        Returns:
+            dict: {None: classement global, categorie_id: classement} ; un
+            classement est une liste de Produit portant ``unites_vendues``
+        """
+        if fenetre not in ServiceMeilleuresVentes.FENETRES:
+            fenetre = ServiceMeilleuresVentes.FENETRE_PAR_DEFAUT
+
+        return mise_en_cache.obtenir_ou_calculer(
+            'meilleures_ventes',
+            (fenetre,),
+            lambda: ServiceMeilleuresVentes._calculer_classements(fenetre),
+        )
+
+    @staticmethod
+    def meilleures_ventes(categorie_id=None, fenetre=None):
+        """
+        Meilleures ventes d'une catégorie (ou de tout le catalogue)
+
+        Returns:
+            list: Produits par unités vendues décroissantes
+        """
+        try:
+            categorie_id = int(categorie_id) if categorie_id else None
+        except (TypeError, ValueError):
+            return []
+        return ServiceMeilleuresVentes.classements(fenetre).get(categorie_id, [])
+
+    @staticmethod
+    @routage_bdd.lecture_seule
+    def _calculer_classements(fenetre):
+        """Deux requêtes : rangs par catégorie (fonction de fenêtre), puis les produits"""
+        debut = timezone.localdate() - timedelta(days=fenetre - 1)
+        taille = ServiceMeilleuresVentes.TAILLE_CLASSEMENT
+
+        # Les premiers de chaque catégorie contiennent les premiers du classement global
+        rangs = CompteurVentesJour.objects.filter(jour__gte=debut).values('produit_id', categorie_id=F('produit__categorie_id')).annotate(
+            unites=Sum('unites'),
+        ).filter(unites__gt=0).annotate(
+            rang=Window(
+                RowNumber(),
+                partition_by=F('produit__categorie_id'),
+                order_by=(F('unites').desc(), F('produit_id').asc()),
+            ),
+        ).filter(rang__lte=taille).values_list('produit_id', 'categorie_id', 'unites')
+
+        rangs = sorted(rangs, key=lambda rang: (-rang[2], rang[0]))
+        produits = Produit.objects.select_related('categorie', 'vendeur').in_bulk(
+            [produit_id for produit_id, _, _ in rangs]
+        )
+
+        classements = defaultdict(list)
+        for produit_id, categorie_id, unites in rangs:
+            produit = produits.get(produit_id)
+            if produit is None:
+                continue
+            produit.unites_vendues = unites
+            if len(classements[None]) < taille:
+                classements[None].append(produit)
+            classements[categorie_id].append(produit)
+        return dict(classements)
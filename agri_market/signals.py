@@ -0,0 +1,15 @@
+"""
+Récepteurs de signaux de l'application agri_market
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import mise_en_cache
+from .models import Categorie
+
+
+@receiver([post_save, post_delete], sender=Categorie)
+def invalider_categories(sender, **kwargs):
+    """La liste des catégories en cache est reconstruite après toute modification (admin compris)"""
+    mise_en_cache.invalider('categories')
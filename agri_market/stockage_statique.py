@@ -0,0 +1,71 @@
+"""
+Stockage des fichiers statiques : noms hachés et variantes précompressées
+
+collectstatic copie les fichiers dans STATIC_ROOT, leur donne un nom
+contenant l'empreinte de leur contenu (styles.3f2a9c1b7e4d.css) et écrit le
+manifeste utilisé par {% static %}. Ce stockage ajoute, pour chaque fichier
+texte, une variante .gz (et .br si le paquet brotli est installé) que le
+serveur envoie aux clients qui l'acceptent, sans compresser à chaque requête.
+"""
+
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # Optionnel : seules les variantes gzip sont produites
+    brotli = None
+
+
+# Extensions compressées (les images et polices le sont déjà)
+EXTENSIONS_COMPRESSIBLES = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml')
+
+# En dessous, l'en-tête de compression coûte plus qu'il ne rapporte
+TAILLE_MIN = 200
+
+# Variante conservée seulement si elle fait gagner au moins 5 %
+RATIO_MAX = 0.95
+
+
+def variantes_compressees(contenu):
+    """
+    Variantes compressées d'un contenu
+
+    Args:
+        contenu: Octets du fichier
+
+    Returns:
+        list: [(extension, octets)] des variantes assez efficaces
+    """
+    if len(contenu) < TAILLE_MIN:
+        return []
+
+    # mtime=0 : même contenu, même variante (déploiements reproductibles)
+    variantes = [('.gz', gzip.compress(contenu, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variantes.append(('.br', brotli.compress(contenu, quality=11)))
+    return [(extension, octets) for extension, octets in variantes if len(octets) <= len(contenu) * RATIO_MAX]
+
+
+class StockageStatiqueCompresse(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage produisant aussi les variantes .gz / .br"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        # Fichiers d'origine et leurs copies hachées (servies avec un cache long)
+        noms = set(paths) | set(self.hashed_files.values())
+        for nom in sorted(noms):
+            if not nom.endswith(EXTENSIONS_COMPRESSIBLES) or not self.exists(nom):
+                continue
+            with self.open(nom) as fichier:
+                contenu = fichier.read()
+            for extension, octets in variantes_compressees(contenu):
+                if self.exists(nom + extension):
+                    self.delete(nom + extension)
+                self._save(nom + extension, ContentFile(octets))
+                yield nom, nom + extension, True
@@ -0,0 +1,45 @@
+"""
+Balises de template pour les photos des produits
+"""
+
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+@register.inclusion_tag('agri_market/_image_produit.html')
+def image_produit(produit, tailles='100vw', classe='', chargement='lazy'):
+    """
+    Photo responsive d'un produit : <picture> WebP + JPEG avec srcset
+
+    Tant que les variantes ne sont pas générées, la photo d'origine est servie.
+
+    Args:
+        produit: Produit (champs image et image_variantes)
+        tailles: Attribut sizes (largeur d'affichage selon l'écran)
+        classe: Classes CSS de l'image
+        chargement: 'lazy' (défaut) ou 'eager' pour une image visible dès l'affichage
+    """
+    contexte = {'produit': produit, 'tailles': tailles, 'classe': classe, 'chargement': chargement}
+    if not produit.image:
+        return contexte
+
+    variantes = sorted(produit.image_variantes.items(), key=lambda item: int(item[0]))
+    if not variantes:
+        contexte['src'] = produit.image.url
+        return contexte
+
+    def srcset(cle):
+        return ', '.join(f'{default_storage.url(v[cle])} {largeur}w' for largeur, v in variantes)
+
+    # Repli (navigateurs sans srcset) : variante intermédiaire
+    largeur, repli = variantes[min(1, len(variantes) - 1)]
+    contexte.update({
+        'src': default_storage.url(repli['jpeg']),
+        'srcset_webp': srcset('webp'),
+        'srcset_jpeg': srcset('jpeg'),
+        'largeur': largeur,
+        'hauteur': repli['hauteur'],
+    })
+    return contexte
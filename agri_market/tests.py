@@ -7,14 +7,58 @@ Tests unitaires pour la gestion des produits
 Auteur: Pavel (responsable tests)
 """
 
-from django.test import TestCase, Client
-from django.urls import reverse
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, resolve
+from django.core.cache import cache
 from django.core.exceptions import ValidationError, PermissionDenied
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import gzip
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+from datetime import timedelta
 from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-from .models import Utilisateur, Categorie, Produit
-from .services_produit import ServiceProduit, ServiceCategorie
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.utils import timezone
+from PIL import Image
 
+from .models import (
+    Utilisateur, Categorie, Produit, Commande, LigneCommande,
+    CompteurVentesJour, NotificationPaiement, Paiement, VenteJournaliere,
+)
+from .services_produit import ServiceProduit, ServiceCategorie
+from .services_panier import ServicePanier, ServiceCommande
+from .services_paiement import ServicePaiement, ServiceRapprochement
+from .services_statistiques import ServiceStatistiques, ServiceAgregationVentes, ServiceMeilleuresVentes
+from .services_import import ServiceImport
+from .services_images import ServiceImages
+from .passerelles_paiement import PasserelleSimulee, obtenir_passerelle
+from .routage_bdd import COOKIE_PRIMAIRE, RouteurRepliques
+from .admin import PaginateurEstime
+from .benchmarks import percentile, comparer
+from .budget_requetes import BudgetRequetesMixin, DepassementBudget
+from . import compteur_vues, metriques, mise_en_cache, routage_bdd, views_async
+from e_agri import settings as reglages_projet
 
 class ServiceProduitTestCase(TestCase):
     """Tests pour le service de gestion des produits"""
@@ -280,5 +324,1899 @@ class VuesProduitsTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+
+class ExportCommandesTestCase(TestCase):
+    """Tests pour l'export CSV des commandes vendeur"""
+    
+    def setUp(self):
+        """Préparation des données de test"""
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test',
+            email='vendeur@test.com',
+            password='password123',
+            first_name='Jean',
+            last_name='Dupont',
+            role='VENDEUR',
+            nom_boutique='Boutique Test'
+        )
+        
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test',
+            email='client@test.com',
+            password='password123',
+            first_name='Marie',
+            last_name='Martin',
+            role='CLIENT'
+        )
+        
+        categorie = Categorie.objects.create(nom='Légumes')
+        self.produit = Produit.objects.create(
+            vendeur=self.vendeur,
+            categorie=categorie,
+            nom='Tomates',
+            prix=Decimal('500'),
+            quantite=100
+        )
+        
+        # Une commande validée et un panier (qui ne doit pas être exporté)
+        self.commande = Commande.objects.create(client=self.client_user, statut='EN_ATTENTE')
+        LigneCommande.objects.create(
+            commande=self.commande, produit=self.produit, quantite=3, prix_unitaire=Decimal('500')
+        )
+        panier = Commande.objects.create(client=self.client_user, statut='PANIER')
+        LigneCommande.objects.create(
+            commande=panier, produit=self.produit, quantite=1, prix_unitaire=Decimal('500')
+        )
+    
+    def _exporter(self, **params):
+        self.client.login(username='vendeur_test', password='password123')
+        response = self.client.get(reverse('exporter_commandes_vendeur'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+    
+    def test_export_lignes_vendeur(self):
+        """Test que l'export contient les lignes validées et pas les paniers"""
+        lignes = self._exporter()
+        
+        self.assertEqual(len(lignes), 2)
+        self.assertTrue(lignes[0].startswith('Commande;Date;Client'))
+        self.assertIn(f'{self.commande.id};', lignes[1])
+        self.assertIn('Marie Martin;Tomates;3;500.00;1500.00', lignes[1])
+    
+    def test_export_neutralise_les_formules(self):
+        """Test que les noms commençant par =, +, - ou @ ne sont pas lus comme formules"""
+        self.client_user.first_name = '=HYPERLINK("http://x")'
+        self.client_user.last_name = ''
+        self.client_user.save()
+        self.produit.nom = '@SUM(A1)'
+        self.produit.save()
+        
+        lignes = self._exporter()
+        
+        self.assertIn(';"\'=HYPERLINK(""http://x"")";\'@SUM(A1);3;', lignes[1])
+    
+    def test_export_filtre_dates(self):
+        """Test que le filtre de période exclut les commandes hors plage"""
+        lignes = self._exporter(du='2000-01-01', au='2000-12-31')
+        self.assertEqual(len(lignes), 1)
+    
+    def test_export_reserve_aux_vendeurs(self):
+        """Test qu'un client ne peut pas exporter"""
+        self.client.login(username='client_test', password='password123')
+        response = self.client.get(reverse('exporter_commandes_vendeur'))
+        self.assertEqual(response.status_code, 302)
+
+
+
+class DashboardAdminTestCase(TestCase):
+    """Tests pour le dashboard administrateur"""
+    
+    def setUp(self):
+        """Préparation des données de test"""
+        self.admin = Utilisateur.objects.create_user(
+            username='admin_test',
+            email='admin@test.com',
+            password='password123',
+            first_name='Ada',
+            last_name='Admin',
+            role='CLIENT',
+            is_staff=True
+        )
+        self.categorie = Categorie.objects.create(nom='Légumes')
+        self.client.login(username='admin_test', password='password123')
+        # Les statistiques de la plateforme sont mises en cache
+        cache.clear()
+    
+    def _creer_vendeur(self, numero, nb_produits=1):
+        vendeur = Utilisateur.objects.create_user(
+            username=f'vendeur_{numero}',
+            email=f'vendeur_{numero}@test.com',
+            password='password123',
+            first_name='Jean',
+            last_name=f'Vendeur {numero}',
+            role='VENDEUR',
+            nom_boutique=f'Boutique {numero}'
+        )
+        for i in range(nb_produits):
+            Produit.objects.create(
+                vendeur=vendeur, categorie=self.categorie,
+                nom=f'Produit {numero}-{i}', prix=Decimal('100'), quantite=10
+            )
+        return vendeur
+    
+    def test_statistiques_et_annotations(self):
+        """Test des compteurs agrégés et des badges annotés"""
+        self._creer_vendeur(1, nb_produits=3)
+        
+        response = self.client.get(reverse('dashboard_admin'))
+        
+        self.assertEqual(response.status_code, 200)
+        stats = response.context['stats']
+        self.assertEqual(stats['total_users'], 2)
+        self.assertEqual(stats['total_vendeurs'], 1)
+        self.assertEqual(stats['total_produits'], 3)
+        self.assertEqual(response.context['vendeurs'][0].nb_produits, 3)
+    
+    def test_nombre_requetes_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre d'utilisateurs"""
+        self._creer_vendeur(1)
+        with CaptureQueriesContext(connection) as avant:
+            self.client.get(reverse('dashboard_admin'))
+        
+        for numero in range(2, 8):
+            self._creer_vendeur(numero, nb_produits=2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as apres:
+            self.client.get(reverse('dashboard_admin'))
+        
+        self.assertEqual(len(avant), len(apres))
+    
+    def test_recherche_et_pagination(self):
+        """Test de la recherche et de la pagination des vendeurs"""
+        for numero in range(30):
+            self._creer_vendeur(numero, nb_produits=0)
+        
+        response = self.client.get(reverse('dashboard_admin'))
+        self.assertEqual(len(response.context['vendeurs']), 25)
+        self.assertEqual(response.context['vendeurs'].paginator.count, 30)
+        
+        response = self.client.get(reverse('dashboard_admin'), {'q': 'Boutique 7'})
+        self.assertEqual(response.context['vendeurs'].paginator.count, 1)
+    
+    def test_compteurs_calcules_pour_la_page(self):
+        """Test que les compteurs sont justes sur une autre page que la première"""
+        for numero in range(30):
+            self._creer_vendeur(numero, nb_produits=numero % 3)
+        Commande.objects.create(client=self.admin, statut='EN_ATTENTE')
+        
+        response = self.client.get(reverse('dashboard_admin'), {'page_vendeurs': 2})
+        
+        # Les plus récents d'abord : la page 2 contient les vendeurs 4 à 0
+        self.assertEqual(
+            [(vendeur.last_name, vendeur.nb_produits) for vendeur in response.context['vendeurs']],
+            [(f'Vendeur {numero}', numero % 3) for numero in range(4, -1, -1)]
+        )
+        self.assertEqual([client.nb_commandes for client in response.context['clients']], [1])
+
+
+
+class AgregationVentesTestCase(TestCase):
+    """Tests pour les agrégats journaliers de ventes"""
+    
+    def setUp(self):
+        """Préparation des données de test"""
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test',
+            email='vendeur@test.com',
+            password='password123',
+            first_name='Jean',
+            last_name='Dupont',
+            role='VENDEUR',
+            nom_boutique='Boutique Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test',
+            email='client@test.com',
+            password='password123',
+            first_name='Marie',
+            last_name='Martin',
+            role='CLIENT'
+        )
+        legumes = Categorie.objects.create(nom='Légumes')
+        fruits = Categorie.objects.create(nom='Fruits')
+        self.tomates = Produit.objects.create(
+            vendeur=self.vendeur, categorie=legumes, nom='Tomates', prix=Decimal('500'), quantite=100
+        )
+        self.mangues = Produit.objects.create(
+            vendeur=self.vendeur, categorie=fruits, nom='Mangues', prix=Decimal('200'), quantite=100
+        )
+        
+        self.commande = Commande.objects.create(client=self.client_user, statut='EN_ATTENTE')
+        LigneCommande.objects.create(
+            commande=self.commande, produit=self.tomates, quantite=2, prix_unitaire=Decimal('500')
+        )
+        LigneCommande.objects.create(
+            commande=self.commande, produit=self.mangues, quantite=5, prix_unitaire=Decimal('200')
+        )
+        self.jour = self.commande.date_commande.date()
+    
+    def test_mise_a_jour_incrementale(self):
+        """Test que les agrégats suivent les changements de statut"""
+        call_command('agreger_ventes', stdout=StringIO())
+        
+        self.assertEqual(VenteJournaliere.objects.filter(statut='EN_ATTENTE').count(), 2)
+        totaux = ServiceStatistiques.totaux_ventes(vendeur_id=self.vendeur.id)
+        self.assertEqual(totaux['chiffre_affaires'], Decimal('2000'))
+        self.assertEqual(totaux['unites'], 7)
+        
+        self.commande.statut = 'ANNULEE'
+        self.commande.save()
+        call_command('agreger_ventes', stdout=StringIO())
+        
+        self.assertEqual(VenteJournaliere.objects.filter(statut='EN_ATTENTE').count(), 0)
+        self.assertEqual(VenteJournaliere.objects.filter(statut='ANNULEE').count(), 2)
+        self.assertEqual(ServiceStatistiques.totaux_ventes()['chiffre_affaires'], Decimal('0'))
+    
+    def test_verifier_jour_reconstruit(self):
+        """Test que le vérificateur détecte et corrige un écart"""
+        ServiceAgregationVentes.recalculer_jour(self.jour)
+        self.assertEqual(ServiceAgregationVentes.verifier_jour(self.jour), [])
+        
+        VenteJournaliere.objects.filter(categorie=self.tomates.categorie).update(unites=99)
+        self.assertEqual(len(ServiceAgregationVentes.verifier_jour(self.jour)), 1)
+        
+        call_command('verifier_ventes', jour=self.jour.isoformat(), stdout=StringIO())
+        self.assertEqual(ServiceAgregationVentes.verifier_jour(self.jour), [])
+    
+    def test_page_vendeur_lit_les_agregats(self):
+        """Test que la page des commandes reçues affiche les totaux agrégés"""
+        ServiceAgregationVentes.recalculer_jour(self.jour)
+        self.client.login(username='vendeur_test', password='password123')
+        
+        response = self.client.get(reverse('commandes_vendeur'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['ventes']['chiffre_affaires'], Decimal('2000'))
+        self.assertEqual(len(response.context['serie_ventes']), 30)
+    
+    def test_analyse_vendeur_json(self):
+        """Test des séries compactes par produit servies en JSON"""
+        cache.clear()
+        ServiceAgregationVentes.recalculer_jour(self.jour)
+        self.client.login(username='vendeur_test', password='password123')
+        
+        response = self.client.get(reverse('statistiques_vendeur_json'), {'fenetre': 7})
+        
+        self.assertEqual(response.status_code, 200)
+        analyse = response.json()
+        self.assertEqual(analyse['fenetre'], 7)
+        self.assertEqual([p['nom'] for p in analyse['produits']], ['Tomates', 'Mangues'])
+        self.assertEqual(analyse['produits'][1]['serie_unites'], [0] * 6 + [5])
+        self.assertEqual(analyse['total'], {'chiffre_affaires': 2000.0, 'unites': 7})
+        
+        response = self.client.get(reverse('statistiques_vendeur'), {'fenetre': 365})
+        self.assertEqual(response.status_code, 200)
+
+
+
+class MetriquesTestCase(TestCase):
+    """Tests pour le middleware de métriques et l'endpoint /metrics"""
+    
+    def setUp(self):
+        """Préparation des données de test"""
+        repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repertoire, ignore_errors=True)
+        self.repertoire = repertoire
+        reglages = self.settings(METRIQUES_REPERTOIRE=repertoire, METRIQUES_JETON='')
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        
+        # Métriques écrites par un autre worker
+        with open(f'{repertoire}/metriques-1-1.json', 'w') as fichier:
+            json.dump({
+                'compteurs': [['agri_commandes_validees_total', {}, 40]],
+                'histogrammes': [],
+            }, fichier)
+        
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test',
+            email='vendeur@test.com',
+            password='password123',
+            first_name='Jean',
+            last_name='Dupont',
+            role='VENDEUR',
+            nom_boutique='Boutique Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test',
+            email='client@test.com',
+            password='password123',
+            first_name='Marie',
+            last_name='Martin',
+            role='CLIENT'
+        )
+        self.staff = Utilisateur.objects.create_user(
+            username='staff_test',
+            email='staff@test.com',
+            password='password123',
+            role='CLIENT',
+            is_staff=True
+        )
+        self.produit = Produit.objects.create(
+            vendeur=self.vendeur,
+            categorie=Categorie.objects.create(nom='Légumes'),
+            nom='Tomates',
+            prix=Decimal('500'),
+            quantite=2
+        )
+    
+    def _lire_metriques(self):
+        lecteur = Client()
+        lecteur.force_login(self.staff)
+        response = lecteur.get(reverse('metriques'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+    
+    def test_latence_par_vue(self):
+        """Test que chaque vue alimente les histogrammes de latence et de requêtes SQL"""
+        self.client.get(reverse('liste_produits'))
+        
+        texte = self._lire_metriques()
+        
+        self.assertIn('# TYPE agri_requete_duree_secondes histogram', texte)
+        self.assertIn('agri_requete_duree_secondes_bucket{vue="liste_produits",le="+Inf"}', texte)
+        self.assertIn('agri_requete_sql_count{vue="liste_produits"}', texte)
+        self.assertIn('agri_reponses_total{code="2xx",vue="liste_produits"}', texte)
+    
+    def test_compteurs_panier_agreges(self):
+        """Test des compteurs du panier, additionnés avec ceux des autres workers"""
+        self.client.login(username='client_test', password='password123')
+        self.client.post(reverse('ajouter_au_panier', args=[self.produit.id]), {'quantite': 1})
+        self.client.post(reverse('ajouter_au_panier', args=[self.produit.id]), {'quantite': 5})
+        self.client.post(reverse('valider_commande'))
+        
+        texte = self._lire_metriques()
+        
+        self.assertRegex(texte, r'agri_panier_ajouts_total \d+')
+        self.assertRegex(texte, r'agri_conflits_stock_total\{operation="ajout"\} \d+')
+        # 40 (autre worker) + au moins 1 (ce processus)
+        valeur = float(re.search(r'^agri_commandes_validees_total (\S+)$', texte, re.M).group(1))
+        self.assertGreaterEqual(valeur, 41)
+    
+    def test_reserve_au_personnel_sans_jeton(self):
+        """Test que, sans jeton configuré, seul le personnel connecté lit les métriques"""
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 403)
+        self.client.login(username='client_test', password='password123')
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 403)
+        self.client.login(username='staff_test', password='password123')
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 200)
+    
+    def test_jeton_requis(self):
+        """Test que l'endpoint est protégé quand un jeton est configuré"""
+        with self.settings(METRIQUES_JETON='secret'):
+            self.assertEqual(self.client.get(reverse('metriques')).status_code, 401)
+            response = self.client.get(reverse('metriques'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+    
+    def test_fichiers_des_processus_termines_compactes(self):
+        """Test que les fichiers des processus terminés sont additionnés au cumul puis supprimés"""
+        processus = subprocess.Popen([sys.executable, '-c', 'pass'])
+        processus.wait()
+        for horodatage in (1, 2):
+            with open(os.path.join(self.repertoire, f'metriques-{processus.pid}-{horodatage}.json'), 'w') as fichier:
+                json.dump({
+                    'compteurs': [['agri_commandes_validees_total', {}, 5]],
+                    'histogrammes': [],
+                }, fichier)
+        
+        self.assertEqual(metriques.compacter(self.repertoire), 2)
+        self.assertEqual(metriques.compacter(self.repertoire), 0)
+        self.assertEqual(
+            sorted(os.listdir(self.repertoire)),
+            sorted([metriques.FICHIER_CUMUL, 'metriques-1-1.json'])
+        )
+        
+        # 40 (worker actif) + 2 × 5 (cumul), rien de compté deux fois
+        compteurs, _ = metriques._fusionner_fichiers()
+        self.assertEqual(compteurs[('agri_commandes_validees_total', ())], 50)
+    
+    def test_suite_de_tests_isolee(self):
+        """Test que la suite n'écrit pas dans le répertoire de métriques configuré"""
+        self.assertNotEqual(settings.METRIQUES_REPERTOIRE, reglages_projet.METRIQUES_REPERTOIRE)
+
+
+
+class StockCommandeTestCase(TestCase):
+    """Tests de la réservation du stock à la validation et de sa remise à l'annulation"""
+
+    def setUp(self):
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test', email='client@test.com', password='password123', role='CLIENT'
+        )
+        categorie = Categorie.objects.create(nom='Légumes')
+        self.tomates = Produit.objects.create(
+            vendeur=self.vendeur, categorie=categorie, nom='Tomates', prix=Decimal('500'), quantite=10
+        )
+        self.oignons = Produit.objects.create(
+            vendeur=self.vendeur, categorie=categorie, nom='Oignons', prix=Decimal('300'), quantite=4
+        )
+        ServicePanier.ajouter_au_panier(self.client_user.id, self.tomates.id, 3)
+        ServicePanier.ajouter_au_panier(self.client_user.id, self.oignons.id, 4)
+        self.commande = ServicePanier.valider_commande(self.client_user.id)
+
+    def test_validation_decremente_le_stock(self):
+        """Test que la validation réserve les quantités commandées"""
+        self.tomates.refresh_from_db()
+        self.oignons.refresh_from_db()
+        self.assertEqual((self.tomates.quantite, self.oignons.quantite), (7, 0))
+
+        # Plus de stock : un second client ne peut plus valider les oignons
+        autre = Utilisateur.objects.create_user(
+            username='autre', email='autre@test.com', password='password123', role='CLIENT'
+        )
+        with self.assertRaises(ValidationError):
+            ServicePanier.ajouter_au_panier(autre.id, self.oignons.id, 1)
+
+    def test_annulation_remet_en_stock(self):
+        """Test que l'annulation rend le stock, une seule fois"""
+        ServiceCommande.changer_statut(self.commande.id, self.vendeur.id, 'ANNULEE')
+        self.tomates.refresh_from_db()
+        self.oignons.refresh_from_db()
+        self.assertEqual((self.tomates.quantite, self.oignons.quantite), (10, 4))
+
+        with self.assertRaises(ValidationError):
+            ServiceCommande.changer_statut(self.commande.id, self.vendeur.id, 'ANNULEE')
+        self.tomates.refresh_from_db()
+        self.assertEqual(self.tomates.quantite, 10)
+
+    def test_transition_refusee(self):
+        """Test des transitions invalides et des commandes d'autres vendeurs"""
+        with self.assertRaises(ValidationError):
+            ServiceCommande.changer_statut(self.commande.id, self.vendeur.id, 'LIVREE')
+
+        intrus = Utilisateur.objects.create_user(
+            username='intrus', email='intrus@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Autre'
+        )
+        with self.assertRaises(PermissionDenied):
+            ServiceCommande.changer_statut(self.commande.id, intrus.id, 'PAYEE')
+
+
+class ImportProduitsTestCase(TestCase):
+    """Tests pour l'import CSV des produits"""
+
+    def setUp(self):
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.legumes = Categorie.objects.create(nom='Légumes')
+        self.fruits = Categorie.objects.create(nom='Fruits')
+        Produit.objects.create(
+            vendeur=self.vendeur, categorie=self.legumes, nom='Tomates', prix=Decimal('500'), quantite=10
+        )
+
+    def _importer(self, contenu):
+        return ServiceImport.importer_csv(self.vendeur.id, BytesIO(contenu.encode('utf-8-sig')))
+
+    def test_creation_et_mise_a_jour(self):
+        """Test que les produits existants sont mis à jour et les nouveaux créés"""
+        rapport = self._importer(
+            "nom;categorie;prix;quantite;description\n"
+            "Tomates;légumes;650,50;40;Nouvelle récolte\n"
+            "Mangues;Fruits;800;25;\n"
+        )
+
+        self.assertEqual((rapport['crees'], rapport['mis_a_jour'], rapport['nb_erreurs']), (1, 1, 0))
+        tomates = Produit.objects.get(vendeur=self.vendeur, nom='Tomates')
+        self.assertEqual((tomates.prix, tomates.quantite), (Decimal('650.50'), 40))
+        self.assertEqual(Produit.objects.get(nom='Mangues').categorie, self.fruits)
+
+    def test_rapport_erreurs(self):
+        """Test que les lignes invalides sont signalées sans bloquer les autres"""
+        rapport = self._importer(
+            "nom,categorie,prix,quantite\n"
+            "Oignons,Légumes,300,10\n"
+            "Riz,Céréales,900,5\n"
+            "Ail,Légumes,abc,5\n"
+            "Piments,Légumes,200,-1\n"
+            "Oignons,Légumes,310,10\n"
+        )
+
+        self.assertEqual(rapport['crees'], 1)
+        self.assertEqual([numero for numero, _ in rapport['erreurs']], [3, 4, 5, 6])
+        self.assertIn('Céréales', rapport['erreurs'][0][1])
+
+    def test_messages_de_prix(self):
+        """Test d'un message distinct pour un prix nul, trop grand ou non fini"""
+        rapport = self._importer(
+            "nom,categorie,prix,quantite\n"
+            "Ail,Légumes,0,5\n"
+            "Piments,Légumes,100000000,5\n"
+            "Gombo,Légumes,NaN,5\n"
+            "Manioc,Légumes,Infinity,5\n"
+            "Igname,Légumes,0.001,5\n"
+            "Taro,Légumes,99999999.999,5\n"
+            "Fonio,Légumes,1e40,5\n"
+            "Mil,Légumes,100,2147483648\n"
+        )
+
+        self.assertEqual([message for _, message in rapport['erreurs']], [
+            "Le prix doit être supérieur à 0",
+            "Le prix doit être inférieur à 100 000 000",
+            "Prix invalide : 'NaN'",
+            "Prix invalide : 'Infinity'",
+            # Arrondis au centime : 0,00 puis 100 000 000,00
+            "Le prix doit être supérieur à 0",
+            "Le prix doit être inférieur à 100 000 000",
+            "Le prix doit être inférieur à 100 000 000",
+            "La quantité ne peut pas dépasser 2147483647",
+        ])
+        self.assertEqual(rapport['crees'], 0)
+
+    def test_lots_volumineux(self):
+        """Test d'un import réparti sur plusieurs lots"""
+        lignes = ''.join(f"Produit {i};Fruits;{100 + i};{i}\n" for i in range(2 * ServiceImport.TAILLE_LOT + 10))
+        rapport = self._importer("nom;categorie;prix;quantite\n" + lignes)
+
+        self.assertEqual(rapport['crees'], 2 * ServiceImport.TAILLE_LOT + 10)
+        self.assertEqual(Produit.objects.filter(vendeur=self.vendeur).count(), 2 * ServiceImport.TAILLE_LOT + 11)
+
+    def test_vue_import(self):
+        """Test de l'envoi d'un fichier par le formulaire"""
+        self.client.login(username='vendeur_test', password='password123')
+        fichier = SimpleUploadedFile(
+            'produits.csv', "nom;categorie;prix;quantite\nAnanas;Fruits;700;12\n".encode('utf-8'), 'text/csv'
+        )
+        response = self.client.post(reverse('importer_produits'), {'fichier': fichier})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['rapport']['crees'], 1)
+        self.assertTrue(Produit.objects.filter(vendeur=self.vendeur, nom='Ananas').exists())
+
+
+class AjustementStocksTestCase(BudgetRequetesMixin, TestCase):
+    """Tests pour l'ajustement de stock par lot"""
+
+    def setUp(self):
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.autre = Utilisateur.objects.create_user(
+            username='autre_vendeur', email='autre@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Autre'
+        )
+        categorie = Categorie.objects.create(nom='Légumes')
+        self.produits = [
+            Produit.objects.create(
+                vendeur=self.vendeur, categorie=categorie, nom=f'Produit {i}', prix=Decimal('100'), quantite=10
+            )
+            for i in range(3)
+        ]
+        self.etranger = Produit.objects.create(
+            vendeur=self.autre, categorie=categorie, nom='Étranger', prix=Decimal('100'), quantite=10
+        )
+
+    def _quantites(self):
+        return list(Produit.objects.filter(vendeur=self.vendeur).order_by('id').values_list('quantite', flat=True))
+
+    def test_ajustement_par_lot(self):
+        """Test d'un lot d'ajustements, deltas d'un même produit cumulés"""
+        a, b, c = self.produits
+        quantites = ServiceProduit.ajuster_stocks(self.vendeur.id, [(c.id, 5), (a.id, -4), (a.id, -1)])
+
+        self.assertEqual(quantites, {a.id: 5, c.id: 15})
+        self.assertEqual(self._quantites(), [5, 10, 15])
+
+    def test_tout_ou_rien(self):
+        """Test qu'un stock insuffisant ou un produit étranger annule tout le lot"""
+        a, b, _ = self.produits
+
+        with self.assertRaises(ValidationError):
+            ServiceProduit.ajuster_stocks(self.vendeur.id, [(a.id, 3), (b.id, -11)])
+        with self.assertRaises(PermissionDenied):
+            ServiceProduit.ajuster_stocks(self.vendeur.id, [(a.id, 3), (self.etranger.id, 1)])
+        self.assertEqual(self._quantites(), [10, 10, 10])
+
+    def test_vue_json(self):
+        """Test de l'endpoint JSON et de son budget de requêtes"""
+        a, b, _ = self.produits
+        self.client.login(username='vendeur_test', password='password123')
+        corps = {'ajustements': [{'produit_id': a.id, 'delta': 2}, {'produit_id': b.id, 'delta': -3}]}
+
+        response = self.assertBudgetRequetes('ajuster_stocks_ajax', lambda: self.client.post(
+            reverse('ajuster_stocks_ajax'), json.dumps(corps), content_type='application/json'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantites'], {str(a.id): 12, str(b.id): 7})
+
+        response = self.client.post(reverse('ajuster_stocks_ajax'), '{"ajustements": 3}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_vue_deltas_non_entiers(self):
+        """Test qu'un delta flottant, booléen ou textuel est refusé sans rien modifier"""
+        a, _, _ = self.produits
+        self.client.login(username='vendeur_test', password='password123')
+
+        for delta in (2.7, True, '3'):
+            corps = {'ajustements': [{'produit_id': a.id, 'delta': delta}]}
+            response = self.client.post(reverse('ajuster_stocks_ajax'), json.dumps(corps),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._quantites(), [10, 10, 10])
+
+    def test_stock_borne(self):
+        """Test que le stock résultant ne peut pas dépasser la capacité du champ"""
+        a, b, _ = self.produits
+
+        with self.assertRaises(ValidationError):
+            ServiceProduit.ajuster_stocks(self.vendeur.id, [(b.id, 1), (a.id, ServiceProduit.QUANTITE_MAX)])
+        with self.assertRaises(ValidationError):
+            ServiceProduit.ajuster_stocks(self.vendeur.id, [(a.id, 1), (999999, 1)])
+        self.assertEqual(self._quantites(), [10, 10, 10])
+
+
+class BenchConnexionsTestCase(TransactionTestCase):
+    """Test de la commande bench_connexions (threads réels, handler WSGI)"""
+
+    def test_deux_modes(self):
+        """Test que les deux modes sont mesurés et les réglages restaurés"""
+        avant = connections.settings['default']['CONN_MAX_AGE']
+        sortie = StringIO()
+        call_command('bench_connexions', threads=2, requetes=6, stdout=sortie)
+
+        self.assertIn('sans persistance', sortie.getvalue())
+        self.assertIn('persistantes', sortie.getvalue())
+        self.assertEqual(connections.settings['default']['CONN_MAX_AGE'], avant)
+
+
+class StressCommandesTestCase(TransactionTestCase):
+    """Test de la commande stress_commandes (threads réels, données validées)"""
+
+    def test_invariants(self):
+        """Test que le tunnel concurrent respecte les invariants et nettoie ses données"""
+        sortie = StringIO()
+        call_command('stress_commandes', clients=4, produits=2, stock=2, stdout=sortie)
+
+        self.assertIn('Invariants respectés', sortie.getvalue())
+        self.assertFalse(Utilisateur.objects.filter(username__startswith='stress_').exists())
+
+
+class BudgetRequetesTestCase(BudgetRequetesMixin, TestCase):
+    """Tests des budgets de requêtes des vues sur un jeu de données représentatif"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Plusieurs vendeurs, produits et commandes : un N+1 se voit immédiatement"""
+        cls.client_user = Utilisateur.objects.create_user(
+            username='client_test',
+            email='client@test.com',
+            password='password123',
+            first_name='Marie',
+            last_name='Martin',
+            role='CLIENT'
+        )
+        cls.admin = Utilisateur.objects.create_user(
+            username='admin_test',
+            email='admin@test.com',
+            password='password123',
+            first_name='Ada',
+            last_name='Admin',
+            role='CLIENT',
+            is_staff=True
+        )
+        
+        categories = [Categorie.objects.create(nom=nom) for nom in ('Légumes', 'Fruits', 'Céréales')]
+        cls.vendeurs = []
+        produits = []
+        for numero in range(3):
+            vendeur = Utilisateur.objects.create_user(
+                username=f'vendeur_{numero}',
+                email=f'vendeur_{numero}@test.com',
+                password='password123',
+                first_name='Jean',
+                last_name=f'Vendeur {numero}',
+                role='VENDEUR',
+                nom_boutique=f'Boutique {numero}'
+            )
+            cls.vendeurs.append(vendeur)
+            for i, categorie in enumerate(categories):
+                produits.append(Produit.objects.create(
+                    vendeur=vendeur, categorie=categorie,
+                    nom=f'Produit {numero}-{i}', prix=Decimal('100'), quantite=50
+                ))
+        cls.produit = produits[0]
+        
+        for statut in ('EN_ATTENTE', 'PAYEE', 'LIVREE', 'PANIER'):
+            commande = Commande.objects.create(client=cls.client_user, statut=statut)
+            for produit in produits[::2]:
+                LigneCommande.objects.create(
+                    commande=commande, produit=produit, quantite=1, prix_unitaire=produit.prix
+                )
+        
+        # Classements des meilleures ventes non vides (accueil, catalogue)
+        ServiceMeilleuresVentes.reconstruire()
+    
+    def _get(self, vue, *args, **params):
+        return self.assertBudgetRequetes(vue, lambda: self.client.get(reverse(vue, args=args), params))
+    
+    def test_vues_publiques(self):
+        """Test des budgets du catalogue"""
+        # Classements recalculés : budget d'un défaut de cache
+        cache.clear()
+        self._get('home')
+        self._get('liste_produits')
+        self._get('liste_produits', recherche='Produit')
+        self._get('detail_produit', self.produit.id)
+    
+    def test_vues_client(self):
+        """Test des budgets du parcours client"""
+        self.client.login(username='client_test', password='password123')
+        self._get('voir_panier')
+        self._get('valider_commande')
+        self._get('mes_commandes')
+        self.assertBudgetRequetes('ajouter_au_panier', lambda: self.client.post(
+            reverse('ajouter_au_panier', args=[self.produit.id]), {'quantite': 1}
+        ))
+        self.assertBudgetRequetes('valider_commande', lambda: self.client.post(reverse('valider_commande')))
+    
+    def test_vues_vendeur(self):
+        """Test des budgets de l'espace vendeur"""
+        self.client.login(username='vendeur_0', password='password123')
+        self._get('mes_produits')
+        self._get('commandes_vendeur')
+        self._get('statistiques_vendeur')
+    
+    def test_dashboard_admin(self):
+        """Test du budget du dashboard administrateur"""
+        self.client.login(username='admin_test', password='password123')
+        self._get('dashboard_admin')
+    
+    def test_depassement_detecte(self):
+        """Test que le middleware signale une vue hors budget"""
+        with self.settings(BUDGET_REQUETES_MODE='raise', BUDGETS_REQUETES={'liste_produits': (1, 0)}):
+            with self.assertRaises(DepassementBudget):
+                self.client.get(reverse('liste_produits'))
+
+
+class GenerateurDonneesTestCase(TestCase):
+    """Tests pour la commande generer_donnees"""
+
+    def _generer(self, **options):
+        options = dict({'vendeurs': 3, 'clients': 5, 'produits': 30, 'lignes': 120,
+                        'taille_lot': 10, 'stdout': StringIO()}, **options)
+        call_command('generer_donnees', **options)
+
+    def test_volumes_et_coherence(self):
+        """Test des volumes générés et de la cohérence des montants"""
+        self._generer()
+
+        self.assertEqual(Utilisateur.objects.filter(role='VENDEUR').count(), 3)
+        self.assertEqual(Utilisateur.objects.filter(role='CLIENT').count(), 5)
+        self.assertEqual(Produit.objects.count(), 30)
+        self.assertEqual(LigneCommande.objects.count(), 120)
+        self.assertFalse(Commande.objects.filter(statut='PANIER').exists())
+
+        commande = Commande.objects.order_by('id').first()
+        total = sum(l.prix_unitaire * l.quantite for l in commande.lignes.all())
+        self.assertEqual(commande.montant_total, total)
+        self.assertEqual(
+            Paiement.objects.count(),
+            Commande.objects.filter(statut__in=['PAYEE', 'EXPEDIEE', 'LIVREE']).count()
+        )
+
+    def test_deterministe(self):
+        """Test qu'une même graine produit le même jeu de données"""
+        self._generer(prefixe='a')
+        premier = list(Produit.objects.order_by('id').values_list('nom', 'prix', 'quantite'))
+
+        with self.assertRaises(CommandError):
+            self._generer(prefixe='a')
+
+        Produit.objects.all().delete()
+        Utilisateur.objects.all().delete()
+        self._generer(prefixe='a')
+        second = list(Produit.objects.order_by('id').values_list('nom', 'prix', 'quantite'))
+        self.assertEqual(premier, second)
+
+
+class BenchmarkVuesTestCase(TestCase):
+    """Tests pour les outils de benchmark et la commande bench_vues"""
+
+    def test_percentiles_et_comparaison(self):
+        """Test du calcul des percentiles et de la détection des régressions"""
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 100), 5)
+
+        reference = {'vue': {'p50_ms': 10.0, 'p95_ms': 20.0, 'requetes': 4}}
+        self.assertEqual(comparer({'vue': {'p50_ms': 11.0, 'p95_ms': 24.0, 'requetes': 4}}, reference), [])
+        regressions = comparer({'vue': {'p50_ms': 10.0, 'p95_ms': 30.0, 'requetes': 5}}, reference)
+        self.assertEqual(len(regressions), 2)
+
+    def test_reference_puis_comparaison(self):
+        """Test d'un cycle référence / comparaison sans modifier les données"""
+        call_command('generer_donnees', vendeurs=2, clients=3, produits=20, lignes=40, stdout=StringIO())
+        nb_commandes = Commande.objects.count()
+        options = {'iterations': 2, 'echauffement': 0, 'allocations': 1, 'stdout': StringIO()}
+
+        with tempfile.TemporaryDirectory() as repertoire:
+            chemin = os.path.join(repertoire, 'reference.json')
+            call_command('bench_vues', sortie=chemin, **options)
+
+            with open(chemin, encoding='utf-8') as fichier:
+                reference = json.load(fichier)
+            self.assertIn('valider_commande', reference['resultats'])
+            self.assertEqual(Commande.objects.count(), nb_commandes)
+            self.assertFalse(Utilisateur.objects.filter(username='bench_admin').exists())
+
+            # Une référence irréaliste (0 requête) fait échouer la comparaison
+            reference['resultats']['detail_produit']['requetes'] = 0
+            with open(chemin, 'w', encoding='utf-8') as fichier:
+                json.dump(reference, fichier)
+            with self.assertRaises(CommandError):
+                call_command('bench_vues', reference=chemin, vues=['detail_produit'], **options)
+
+    def test_bench_services(self):
+        """Test des microbenchmarks de services sur de petites tailles"""
+        sortie = StringIO()
+        call_command(
+            'bench_services', iterations=2, echauffement=0, allocations=0,
+            tailles_panier=[1, 3], tailles_catalogue=[5], stdout=sortie
+        )
+
+        texte = sortie.getvalue()
+        self.assertIn('obtenir_panier_avec_details[3]', texte)
+        self.assertIn('rechercher_produits[5]', texte)
+        self.assertFalse(Produit.objects.exists())
+
+
+class MiseEnCacheTestCase(TestCase):
+    """Tests pour la couche de cache (versions, verrou, rafraîchissement anticipé)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.appels = 0
+    
+    def _calcul(self):
+        self.appels += 1
+        return self.appels
+    
+    def test_invalidation_par_version(self):
+        """Test qu'invalider un espace rend ses anciennes valeurs inaccessibles"""
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 1)
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 1)
+        
+        mise_en_cache.invalider('essai')
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 2)
+        self.assertEqual(self.appels, 2)
+    
+    def test_version_evincee_sans_resurrection(self):
+        """Test qu'une version évincée du cache ne ressert pas les anciennes valeurs"""
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 1)
+        
+        cache.delete(mise_en_cache._cle_version('essai'))
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 2)
+        
+        # Idem si l'éviction précède une invalidation
+        cache.delete(mise_en_cache._cle_version('essai'))
+        mise_en_cache.invalider('essai')
+        self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 3)
+    
+    def test_attente_pendant_calcul_concurrent(self):
+        """Test qu'un worker n'effectue pas le calcul déjà verrouillé par un autre"""
+        cle_valeur = mise_en_cache.cle('essai', 1)
+        cache.add(f'{cle_valeur}:verrou', 1)
+        
+        def calcul_concurrent(duree):
+            # L'autre worker termine son calcul pendant l'attente
+            mise_en_cache._calculer_et_stocker(cle_valeur, lambda: 'autre worker', 60)
+        
+        with mock.patch.object(mise_en_cache.time, 'sleep', side_effect=calcul_concurrent):
+            valeur = mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul)
+        
+        self.assertEqual(valeur, 'autre worker')
+        self.assertEqual(self.appels, 0)
+        
+        # Verrou jamais libéré : calcul local après ATTENTE_MAX
+        cache.clear()
+        cache.add(f'{mise_en_cache.cle("essai", 2)}:verrou', 1)
+        with mock.patch.object(mise_en_cache, 'ATTENTE_MAX', 0.01):
+            self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (2,), self._calcul), 1)
+    
+    def test_rafraichissement_anticipe_et_metriques(self):
+        """Test du rafraîchissement d'une valeur proche de l'expiration et des compteurs"""
+        with mock.patch.object(mise_en_cache.metriques, 'incrementer') as incrementer:
+            mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul)
+            mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul)
+            
+            # Échéance dépassée : le tirage XFetch déclenche toujours le recalcul
+            cle_valeur = mise_en_cache.cle('essai', 1)
+            entree = cache.get(cle_valeur)
+            entree['expiration'] = 0
+            cache.set(cle_valeur, entree)
+            self.assertEqual(mise_en_cache.obtenir_ou_calculer('essai', (1,), self._calcul), 2)
+        
+        resultats = [appel.kwargs['resultat'] for appel in incrementer.call_args_list]
+        self.assertEqual(resultats, ['miss', 'hit', 'rafraichissement'])
+        self.assertEqual(cache.get(cle_valeur)['valeur'], 2)
+    
+    def test_categories_et_panier_invalides(self):
+        """Test de l'invalidation des catégories et du compteur de panier"""
+        Categorie.objects.create(nom='Fruits')
+        self.assertEqual([c.nom for c in ServiceCategorie.lister_categories()], ['Fruits'])
+        Categorie.objects.create(nom='Céréales')
+        self.assertEqual(len(ServiceCategorie.lister_categories()), 2)
+        
+        vendeur = Utilisateur.objects.create_user(
+            username='vendeur_cache', email='vendeur_cache@test.com',
+            password='password123', role='VENDEUR'
+        )
+        client = Utilisateur.objects.create_user(
+            username='client_cache', email='client_cache@test.com',
+            password='password123', role='CLIENT'
+        )
+        produit = Produit.objects.create(
+            vendeur=vendeur, categorie=Categorie.objects.first(),
+            nom='Mangues', prix=Decimal('100'), quantite=10
+        )
+        self.client.login(username='client_cache', password='password123')
+        
+        self.assertEqual(self.client.get(reverse('voir_panier')).context['panier_count'], 0)
+        ServicePanier.ajouter_au_panier(client.id, produit.id, 2)
+        self.assertEqual(self.client.get(reverse('voir_panier')).context['panier_count'], 1)
+
+
+class SessionsTestCase(TestCase):
+    """Tests pour le stockage des sessions et leur purge"""
+    
+    def setUp(self):
+        cache.clear()
+        self.utilisateur = Utilisateur.objects.create_user(
+            username='client_session', email='client_session@test.com',
+            password='password123', role='CLIENT'
+        )
+    
+    def test_cached_db_sans_lecture_de_session_en_base(self):
+        """Test que le moteur cached_db évite la lecture de django_session à chaque page"""
+        lectures = {}
+        for moteur in ('db', 'cached_db'):
+            with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{moteur}'):
+                navigateur = Client()
+                navigateur.force_login(self.utilisateur)
+                navigateur.get(reverse('voir_panier'))
+                with CaptureQueriesContext(connection) as requetes:
+                    self.assertEqual(navigateur.get(reverse('voir_panier')).status_code, 200)
+                lectures[moteur] = sum('django_session' in q['sql'] for q in requetes.captured_queries)
+        
+        self.assertEqual(lectures, {'db': 1, 'cached_db': 0})
+    
+    def test_nettoyer_sessions_par_lots(self):
+        """Test de la purge par lots des seules sessions expirées"""
+        maintenant = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expiree{i}', session_data='', expire_date=maintenant - timedelta(days=1))
+             for i in range(7)]
+            + [Session(session_key='valide', session_data='', expire_date=maintenant + timedelta(days=1))]
+        )
+        
+        sortie = StringIO()
+        call_command('nettoyer_sessions', taille_lot=3, stdout=sortie)
+        
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['valide'])
+        self.assertIn('7 session(s) expirée(s) supprimée(s) en 3 lot(s)', sortie.getvalue())
+        
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            call_command('nettoyer_sessions', stdout=sortie)
+        self.assertIn('aucune session stockée en base', sortie.getvalue())
+
+
+class FichiersStatiquesTestCase(TestCase):
+    """Tests pour les fichiers statiques hachés, précompressés et servis avec cache long"""
+    
+    STOCKAGE = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'agri_market.stockage_statique.StockageStatiqueCompresse'},
+    }
+    
+    def setUp(self):
+        repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(repertoire.cleanup)
+        self.racine = repertoire.name
+        
+        reglages = override_settings(STATIC_ROOT=self.racine, STORAGES=self.STOCKAGE, STATIC_SERVIR=True)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+    
+    def test_collectstatic_hache_et_compresse(self):
+        """Test des noms hachés, du manifeste et des variantes gzip"""
+        with open(os.path.join(self.racine, 'staticfiles.json'), encoding='utf-8') as fichier:
+            manifeste = json.load(fichier)['paths']
+        nom_hache = manifeste['css/styles.css']
+        self.assertRegex(nom_hache, r'^css/styles\.[0-9a-f]{12}\.css$')
+        self.assertEqual(static('css/styles.css'), f'/static/{nom_hache}')
+        
+        with open(os.path.join(self.racine, nom_hache), 'rb') as original, \
+                open(os.path.join(self.racine, nom_hache + '.gz'), 'rb') as compresse:
+            self.assertEqual(gzip.decompress(compresse.read()), original.read())
+    
+    def test_service_avec_negociation_et_cache_immuable(self):
+        """Test de l'envoi de la variante acceptée et des en-têtes de cache"""
+        url = '/static/' + staticfiles_storage.stored_name('css/styles.css')
+        navigateur = Client()
+        
+        response = navigateur.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        
+        response = navigateur.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'product-card', b''.join(response.streaming_content))
+        
+        response = navigateur.get('/static/css/styles.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(navigateur.get('/static/../manage.py').status_code, 404)
+
+
+class ImagesProduitTestCase(TestCase):
+    """Tests pour les photos de produits et leurs variantes redimensionnées"""
+    
+    def setUp(self):
+        repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(repertoire.cleanup)
+        reglages = override_settings(MEDIA_ROOT=repertoire.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_photo', email='vendeur_photo@test.com',
+            password='password123', role='VENDEUR'
+        )
+        self.categorie = Categorie.objects.create(nom='Fruits')
+    
+    def _photo(self, largeur=1600, hauteur=1000, nom='mangues.png'):
+        tampon = BytesIO()
+        Image.new('RGB', (largeur, hauteur), (200, 120, 30)).save(tampon, 'PNG')
+        return SimpleUploadedFile(nom, tampon.getvalue(), content_type='image/png')
+    
+    def test_validation_de_la_photo(self):
+        """Test du refus d'un fichier qui n'est pas une image"""
+        faux = SimpleUploadedFile('photo.jpg', b'pas une image', content_type='image/jpeg')
+        with self.assertRaises(ValidationError):
+            ServiceProduit.creer_produit(
+                vendeur_id=self.vendeur.id, nom='Mangues', prix=Decimal('500'),
+                quantite=5, categorie_id=self.categorie.id, image=faux
+            )
+        self.assertFalse(Produit.objects.exists())
+    
+    def test_image_bombe_refusee(self):
+        """Test du refus d'un petit PNG annonçant des dimensions démesurées"""
+        tampon = BytesIO()
+        Image.new('1', (1, 1)).save(tampon, 'PNG')
+        contenu = bytearray(tampon.getvalue())
+        # En-tête IHDR réécrit en 15000 × 15000 (225 mégapixels), CRC recalculé
+        contenu[16:24] = struct.pack('>II', 15000, 15000)
+        contenu[29:33] = struct.pack('>I', zlib.crc32(bytes(contenu[12:29])))
+        bombe = SimpleUploadedFile('bombe.png', bytes(contenu), content_type='image/png')
+        
+        self.client.login(username='vendeur_photo', password='password123')
+        response = self.client.post(reverse('ajouter_produit'), {
+            'nom': 'Mangues', 'prix': '500', 'quantite': '5',
+            'categorie': self.categorie.id, 'image': bombe,
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'trop grande')
+        self.assertFalse(Produit.objects.exists())
+    
+    def test_generation_hors_requete(self):
+        """Test que la vue enregistre la photo et délègue les variantes au pool après commit"""
+        self.client.login(username='vendeur_photo', password='password123')
+        with mock.patch.object(ServiceImages, '_pool') as pool, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('ajouter_produit'), {
+                'nom': 'Mangues', 'prix': '500', 'quantite': '5',
+                'categorie': self.categorie.id, 'image': self._photo(),
+            })
+        
+        self.assertRedirects(response, reverse('mes_produits'), fetch_redirect_response=False)
+        produit = Produit.objects.get(nom='Mangues')
+        self.assertTrue(produit.image.name.startswith('produits/'))
+        self.assertEqual(produit.image_variantes, {})
+        pool.return_value.submit.assert_called_once_with(ServiceImages._travail, produit.id)
+    
+    def test_variantes_et_srcset(self):
+        """Test des variantes WebP/JPEG générées et de la balise <picture> responsive"""
+        produit = Produit.objects.create(
+            vendeur=self.vendeur, categorie=self.categorie, nom='Mangues',
+            prix=Decimal('500'), quantite=5, image=self._photo()
+        )
+        gabarit = Template('{% load images %}{% image_produit produit "50vw" %}')
+        
+        # Variantes pas encore prêtes : photo d'origine
+        html = gabarit.render(Context({'produit': produit}))
+        self.assertIn(produit.image.url, html)
+        self.assertNotIn('srcset', html)
+        
+        variantes = ServiceImages.generer_variantes(produit.id)
+        self.assertEqual(sorted(variantes, key=int), ['320', '640', '1280'])
+        self.assertEqual(variantes['640']['hauteur'], 400)
+        with default_storage.open(variantes['320']['webp']) as fichier, Image.open(fichier) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 200)))
+        
+        produit.refresh_from_db()
+        html = gabarit.render(Context({'produit': produit}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('1280w', html)
+        self.assertIn('loading="lazy"', html)
+        
+        # Photo étroite : jamais agrandie
+        petit = Produit.objects.create(
+            vendeur=self.vendeur, categorie=self.categorie, nom='Citrons',
+            prix=Decimal('300'), quantite=5, image=self._photo(400, 300, 'citrons.png')
+        )
+        self.assertEqual(sorted(ServiceImages.generer_variantes(petit.id), key=int), ['320', '400'])
+
+
+class RoutageRepliquesTestCase(TestCase):
+    """Tests pour le routage des lectures vers les répliques"""
+    
+    def setUp(self):
+        reglages = override_settings(
+            DATABASE_REPLICAS=['replica_test'],
+            DATABASE_ROUTERS=['agri_market.routage_bdd.RouteurRepliques'],
+        )
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_replique', email='vendeur_replique@test.com',
+            password='password123', role='VENDEUR'
+        )
+        
+        # Contexte de routage vierge, comme en début de requête
+        jetons = routage_bdd.debut_requete()
+        self.addCleanup(routage_bdd.fin_requete, jetons)
+    
+    def test_lectures_declarees_sur_replique_puis_primaire_apres_ecriture(self):
+        """Test du routage des services en lecture seule et de la cohérence après écriture"""
+        self.assertEqual(ServiceProduit.lister_tous_produits().db, 'replica_test')
+        self.assertEqual(ServiceStatistiques.lister_vendeurs().db, 'replica_test')
+        # Lecture non déclarée (tunnel de commande, stocks) : base principale
+        self.assertEqual(Produit.objects.all().db, 'default')
+        
+        Categorie.objects.create(nom='Tubercules')
+        self.assertTrue(routage_bdd.ecriture_effectuee())
+        self.assertEqual(ServiceProduit.lister_tous_produits().db, 'default')
+    
+    def test_routeur(self):
+        """Test des objets liés, des migrations et des écritures"""
+        routeur = RouteurRepliques()
+        self.vendeur._state.db = 'replica_test'
+        self.assertEqual(routeur.db_for_read(Utilisateur, instance=self.vendeur), 'replica_test')
+        self.assertFalse(routeur.allow_migrate('replica_test', 'agri_market'))
+        self.assertTrue(routeur.allow_migrate('default', 'agri_market'))
+        
+        self.assertEqual(routeur.db_for_write(Produit), 'default')
+        self.assertEqual(routeur.db_for_read(Utilisateur, instance=self.vendeur), 'default')
+    
+    def test_cookie_apres_ecriture(self):
+        """Test que le middleware maintient la base principale après un POST qui écrit"""
+        categorie = Categorie.objects.create(nom='Fruits')
+        produit = Produit.objects.create(
+            vendeur=self.vendeur, categorie=categorie, nom='Ananas', prix=Decimal('800'), quantite=10
+        )
+        client = Utilisateur.objects.create_user(
+            username='client_replique', email='client_replique@test.com',
+            password='password123', role='CLIENT'
+        )
+        
+        # Alias existant : les requêtes s'exécutent réellement
+        with override_settings(DATABASE_REPLICAS=['default']):
+            navigateur = Client()
+            navigateur.force_login(client)
+            
+            response = navigateur.get(reverse('liste_produits'))
+            self.assertNotIn(COOKIE_PRIMAIRE, response.cookies)
+            
+            response = navigateur.post(reverse('ajouter_au_panier', args=[produit.id]), {'quantite': 1})
+            self.assertEqual(response.cookies[COOKIE_PRIMAIRE]['max-age'], 5)
+
+
+@override_settings(ROOT_URLCONF='e_agri.urls_async')
+class VuesAsyncTestCase(TestCase):
+    """Tests pour les vues asynchrones du catalogue (déploiement ASGI)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_async', email='vendeur_async@test.com',
+            password='password123', role='VENDEUR'
+        )
+        self.categorie = Categorie.objects.create(nom='Légumes')
+        self.produits = [
+            Produit.objects.create(
+                vendeur=self.vendeur, categorie=self.categorie, nom=f'Carottes {i}',
+                prix=Decimal('250'), quantite=10
+            )
+            for i in range(3)
+        ]
+    
+    async def test_catalogue_et_detail(self):
+        """Test des pages du catalogue servies par les vues async"""
+        self.assertIs(resolve(reverse('liste_produits')).func, views_async.liste_produits)
+        navigateur = AsyncClient()
+        
+        response = await navigateur.get(reverse('liste_produits'), {'recherche': 'Carottes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['produits']), 3)
+        
+        produit = self.produits[0]
+        response = await navigateur.get(reverse('detail_produit', args=[produit.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['produit'], produit)
+        self.assertEqual(len(response.context['produits_similaires']), 2)
+        
+        response = await navigateur.get(reverse('detail_produit', args=[999999]))
+        self.assertRedirects(response, reverse('liste_produits'), fetch_redirect_response=False)
+    
+    async def test_api_statistiques_authentifiee(self):
+        """Test de l'authentification de l'API JSON async"""
+        navigateur = AsyncClient()
+        response = await navigateur.get(reverse('statistiques_vendeur_json'))
+        self.assertEqual(response.status_code, 302)
+        
+        await sync_to_async(navigateur.force_login)(self.vendeur)
+        response = await navigateur.get(reverse('statistiques_vendeur_json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('produits', response.json())
+
+
+class BenchAsgiTestCase(TransactionTestCase):
+    """Test de la commande bench_asgi (handlers WSGI et ASGI réels)"""
+    
+    def test_deux_deploiements(self):
+        """Test que les deux déploiements servent la page sans erreur"""
+        vendeur = Utilisateur.objects.create_user(
+            username='vendeur_bench', email='vendeur_bench@test.com',
+            password='password123', role='VENDEUR'
+        )
+        Produit.objects.create(
+            vendeur=vendeur, categorie=Categorie.objects.create(nom='Fruits'),
+            nom='Papayes mûres', prix=Decimal('400'), quantite=10
+        )
+        
+        sortie = StringIO()
+        call_command('bench_asgi', concurrence=2, requetes=6, stdout=sortie)
+        
+        self.assertEqual(sortie.getvalue().count('WSGI'), 2)
+        self.assertEqual(sortie.getvalue().count('ASGI'), 2)
+
+
+PASSERELLES_TEST = {
+    mode: {
+        'CLASSE': 'agri_market.passerelles_paiement.PasserelleSimulee',
+        'OPTIONS': {'secret': 'secret-test'},
+    }
+    for mode in ('MOBILE_MONEY', 'CARTE')
+}
+
+
+class PaiementsMixin:
+    """Commande EN_ATTENTE d'un client et notifications signées de la passerelle simulée"""
+
+    def creer_commande(self):
+        PasserelleSimulee.reinitialiser()
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test', email='client@test.com', password='password123', role='CLIENT'
+        )
+        self.produit = Produit.objects.create(
+            vendeur=self.vendeur, categorie=Categorie.objects.create(nom='Légumes'),
+            nom='Tomates', prix=Decimal('500'), quantite=10
+        )
+        ServicePanier.ajouter_au_panier(self.client_user.id, self.produit.id, 2)
+        self.commande = ServicePanier.valider_commande(self.client_user.id)
+
+    def notifier(self, reference, statut, montant=Decimal('1000'), evenement=None, mode='MOBILE_MONEY'):
+        """Poster une notification signée par la passerelle du mode ; renvoie la réponse"""
+        corps, signature = obtenir_passerelle(mode).regler(
+            reference, statut, montant, evenement
+        )
+        return self.client.post(
+            reverse('notification_paiement', args=[mode.lower().replace('_', '-')]),
+            corps, content_type='application/json', HTTP_X_SIGNATURE=signature
+        )
+
+
+@override_settings(PASSERELLES_PAIEMENT=PASSERELLES_TEST)
+class PaiementsTestCase(PaiementsMixin, BudgetRequetesMixin, TestCase):
+    """Tests de l'initiation des paiements et des notifications des passerelles"""
+
+    def setUp(self):
+        self.creer_commande()
+
+    def _payer(self, mode='MOBILE_MONEY'):
+        self.client.login(username='client_test', password='password123')
+        self.client.post(reverse('payer_commande', args=[self.commande.id]), {'mode_paiement': mode})
+        self.client.logout()
+        return Paiement.objects.get(commande=self.commande)
+
+    def test_paiement_reussi_et_doublon(self):
+        """Test qu'une notification rejouée ne s'applique qu'une fois"""
+        paiement = self._payer()
+        self.assertEqual(paiement.statut, 'EN_ATTENTE')
+        self.assertTrue(paiement.reference_passerelle.startswith('SIM-'))
+
+        # Le vendeur ne peut plus confirmer lui-même le paiement
+        with self.assertRaises(ValidationError):
+            ServiceCommande.changer_statut(self.commande.id, self.vendeur.id, 'PAYEE')
+
+        reponse = self.assertBudgetRequetes(
+            'notification_paiement', lambda: self.notifier(paiement.reference, 'REUSSI', evenement='evt-1')
+        )
+        self.assertEqual(reponse.json(), {'resultat': 'APPLIQUEE'})
+
+        reponse = self.notifier(paiement.reference, 'REUSSI', evenement='evt-1')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json(), {'resultat': 'DOUBLON'})
+
+        paiement.refresh_from_db()
+        self.commande.refresh_from_db()
+        self.assertEqual((paiement.statut, self.commande.statut), ('REUSSI', 'PAYEE'))
+        self.assertEqual(NotificationPaiement.objects.count(), 1)
+
+    def test_notifications_hors_sequence(self):
+        """Test des notifications tardives, contradictoires, inconnues ou mal signées"""
+        paiement = self._payer()
+
+        # Montant différent de la commande : rien n'est appliqué
+        self.assertEqual(self.notifier(paiement.reference, 'REUSSI', Decimal('10')).json()['resultat'], 'CONFLIT')
+        self.assertEqual(self.notifier(paiement.reference, 'REUSSI').json()['resultat'], 'APPLIQUEE')
+        # « En attente » reçu après le statut final, puis échec contradictoire
+        self.assertEqual(self.notifier(paiement.reference, 'EN_ATTENTE').json()['resultat'], 'IGNOREE')
+        self.assertEqual(self.notifier(paiement.reference, 'ECHEC').json()['resultat'], 'CONFLIT')
+        self.assertEqual(self.notifier('PAY-INCONNU', 'REUSSI').json()['resultat'], 'INCONNUE')
+
+        paiement.refresh_from_db()
+        self.commande.refresh_from_db()
+        self.assertEqual((paiement.statut, self.commande.statut), ('REUSSI', 'PAYEE'))
+
+        reponse = self.client.post(
+            reverse('notification_paiement', args=['mobile-money']),
+            b'{}', content_type='application/json', HTTP_X_SIGNATURE='falsifiee'
+        )
+        self.assertEqual(reponse.status_code, 403)
+
+    def test_notification_d_une_autre_passerelle(self):
+        """Test qu'une passerelle ne peut pas régler le paiement d'une autre"""
+        paiement = self._payer('MOBILE_MONEY')
+
+        reponse = self.notifier(paiement.reference, 'REUSSI', evenement='evt-carte', mode='CARTE')
+        self.assertEqual(reponse.json(), {'resultat': 'INCONNUE'})
+        paiement.refresh_from_db()
+        self.commande.refresh_from_db()
+        self.assertEqual((paiement.statut, self.commande.statut), ('EN_ATTENTE', 'EN_ATTENTE'))
+        journal = NotificationPaiement.objects.get(identifiant='evt-carte')
+        self.assertEqual((journal.passerelle, journal.paiement), ('CARTE', None))
+
+        self.assertEqual(self.notifier(paiement.reference, 'REUSSI').json()['resultat'], 'APPLIQUEE')
+
+    def test_echec_puis_nouvelle_tentative(self):
+        """Test qu'un paiement échoué peut être relancé et qu'un paiement en cours n'est pas dupliqué"""
+        premier = self._payer()
+        self.assertEqual(self.notifier(premier.reference, 'ECHEC', None).json()['resultat'], 'APPLIQUEE')
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.statut, 'EN_ATTENTE')
+
+        second = self._payer('CARTE')
+        self.assertNotEqual(second.reference, premier.reference)
+        self.assertEqual((second.statut, second.mode_paiement), ('EN_ATTENTE', 'CARTE'))
+
+        encore, _ = ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+        self.assertEqual(encore.reference, second.reference)
+
+    @override_settings(PASSERELLES_PAIEMENT=dict(PASSERELLES_TEST, CARTE={
+        'CLASSE': 'agri_market.passerelles_paiement.PasserelleSimulee',
+        'OPTIONS': {'secret': 'secret-test', 'url_confirmation': 'https://paiement.test/carte/'},
+    }))
+    def test_page_de_confirmation_reproposee(self):
+        """Test qu'un client revenu sans confirmer retrouve la page de la passerelle"""
+        paiement, url = ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+        self.assertEqual(url, f'https://paiement.test/carte/{paiement.reference_passerelle}')
+
+        encore, url_encore = ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+        self.assertEqual((encore.reference, url_encore), (paiement.reference, url))
+
+        self.client.login(username='client_test', password='password123')
+        response = self.client.post(reverse('payer_commande', args=[self.commande.id]), {'mode_paiement': 'CARTE'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+    def test_changement_de_mode_apres_delai(self):
+        """Test qu'un paiement en attente n'est remplacé qu'après le délai, une fois abandonné"""
+        premier = self._payer('MOBILE_MONEY')
+        with self.assertRaisesMessage(ValidationError, 'déjà en cours'):
+            ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+
+        Paiement.objects.filter(id=premier.id).update(
+            date_mise_a_jour=timezone.now() - ServicePaiement.DELAI_ABANDON - timedelta(minutes=1)
+        )
+        second, _ = ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+
+        self.assertNotEqual(second.reference, premier.reference)
+        self.assertEqual((second.statut, second.mode_paiement), ('EN_ATTENTE', 'CARTE'))
+        self.assertEqual(obtenir_passerelle('MOBILE_MONEY').consulter(premier.reference), 'ECHEC')
+        journal = NotificationPaiement.objects.get(reference=premier.reference)
+        self.assertEqual((journal.statut, journal.resultat), ('ECHEC', 'APPLIQUEE'))
+        # Confirmation tardive de l'ancienne référence : sans effet
+        self.assertEqual(self.notifier(premier.reference, 'REUSSI').json()['resultat'], 'INCONNUE')
+
+    def test_paiement_abouti_non_remplace(self):
+        """Test qu'un paiement abouti sans notification reçue n'est pas remplacé mais appliqué"""
+        paiement = self._payer('MOBILE_MONEY')
+        # Réglé chez la passerelle, notification perdue
+        obtenir_passerelle('MOBILE_MONEY').regler(paiement.reference, 'REUSSI')
+        Paiement.objects.filter(id=paiement.id).update(
+            date_mise_a_jour=timezone.now() - ServicePaiement.DELAI_ABANDON - timedelta(minutes=1)
+        )
+
+        with self.assertRaisesMessage(ValidationError, 'déjà payée'):
+            ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'CARTE')
+        paiement.refresh_from_db()
+        self.commande.refresh_from_db()
+        self.assertEqual((paiement.statut, paiement.mode_paiement, self.commande.statut), ('REUSSI', 'MOBILE_MONEY', 'PAYEE'))
+
+    def test_commande_annulee_pendant_le_paiement(self):
+        """Test qu'un paiement confirmé après annulation est signalé sans rouvrir la commande"""
+        paiement = self._payer()
+        ServiceCommande.changer_statut(self.commande.id, self.vendeur.id, 'ANNULEE')
+
+        self.assertEqual(self.notifier(paiement.reference, 'REUSSI').json()['resultat'], 'CONFLIT')
+        paiement.refresh_from_db()
+        self.commande.refresh_from_db()
+        self.assertEqual((paiement.statut, self.commande.statut), ('REUSSI', 'ANNULEE'))
+
+
+@override_settings(PASSERELLES_PAIEMENT=PASSERELLES_TEST)
+class PaiementsConcurrentsTestCase(PaiementsMixin, TransactionTestCase):
+    """Test des notifications simultanées (threads réels, données validées)"""
+
+    def test_notifications_simultanees(self):
+        """Test que des notifications parallèles ne changent les statuts qu'une fois"""
+        self.creer_commande()
+        paiement, _ = ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'MOBILE_MONEY')
+        passerelle = obtenir_passerelle('MOBILE_MONEY')
+        # Chaque événement livré trois fois, dont un échec contradictoire
+        evenements = [('evt-a', 'REUSSI'), ('evt-b', 'REUSSI'), ('evt-c', 'ECHEC')] * 3
+
+        resultats = []
+        verrou = threading.Lock()
+
+        def livrer(evenement, statut):
+            corps, _ = passerelle.regler(paiement.reference, statut, Decimal('1000'), evenement)
+            notification = passerelle.lire_notification(corps)
+            try:
+                # SQLite refuse une écriture concurrente : la passerelle renverrait la notification
+                for _ in range(100):
+                    try:
+                        resultat = ServicePaiement.appliquer_notification('MOBILE_MONEY', notification)
+                        break
+                    except OperationalError:
+                        pass
+                with verrou:
+                    resultats.append(resultat)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=livrer, args=evenement) for evenement in evenements]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(resultats), 9)
+        self.assertEqual(resultats.count('APPLIQUEE'), 1)
+        self.commande.refresh_from_db()
+        paiement.refresh_from_db()
+        self.assertIn(paiement.statut, ('REUSSI', 'ECHEC'))
+        self.assertEqual(self.commande.statut, 'PAYEE' if paiement.statut == 'REUSSI' else 'EN_ATTENTE')
+        # Un seul enregistrement par événement, quel que soit le nombre de livraisons
+        self.assertEqual(
+            sorted(NotificationPaiement.objects.values_list('identifiant', flat=True)),
+            ['evt-a', 'evt-b', 'evt-c']
+        )
+
+
+@override_settings(PASSERELLES_PAIEMENT=PASSERELLES_TEST)
+class RapprochementPaiementsTestCase(PaiementsMixin, TestCase):
+    """Tests du rapprochement des relevés de règlement"""
+
+    def setUp(self):
+        self.creer_commande()
+        self.paiements = [ServicePaiement.initier_paiement(self.commande.id, self.client_user.id, 'MOBILE_MONEY')[0]]
+        for _ in range(3):
+            ServicePanier.ajouter_au_panier(self.client_user.id, self.produit.id, 1)
+            commande = ServicePanier.valider_commande(self.client_user.id)
+            self.paiements.append(
+                ServicePaiement.initier_paiement(commande.id, self.client_user.id, 'MOBILE_MONEY')[0]
+            )
+
+    def _releve(self, lignes):
+        return BytesIO(("reference;statut;montant\n" + "\n".join(lignes) + "\n").encode())
+
+    def _statuts(self):
+        return [Paiement.objects.get(id=p.id).statut for p in self.paiements]
+
+    def test_rapprochement_et_consultation(self):
+        """Test des mises à jour, des écarts et de la consultation des paiements absents du relevé"""
+        p1, p2, p3, p4 = self.paiements
+        # Paiement absent du relevé mais réglé chez la passerelle (notification perdue)
+        obtenir_passerelle('MOBILE_MONEY').regler(p4.reference, 'REUSSI')
+        type(p4).objects.filter(id=p4.id).update(date_paiement=p4.date_paiement - timedelta(hours=1))
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as fichier:
+            fichier.write(self._releve([
+                f"{p1.reference};REUSSI;1000",
+                f"{p2.reference};ECHEC;500",
+                f"{p3.reference};REUSSI;5",
+                "PAY-INCONNU;REUSSI;500",
+                f"{p1.reference};ECHEC;1000",
+                ";REUSSI;500",
+            ]).getvalue())
+        self.addCleanup(os.remove, fichier.name)
+
+        sortie, erreurs = StringIO(), StringIO()
+        call_command('rapprocher_paiements', fichier.name, stdout=sortie, stderr=erreurs)
+
+        self.assertEqual(self._statuts(), ['REUSSI', 'ECHEC', 'EN_ATTENTE', 'REUSSI'])
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.statut, 'PAYEE')
+        self.assertIn("6 ligne(s) lue(s), 1 paiement(s) consulté(s)", sortie.getvalue())
+        self.assertIn("4 écart(s)", sortie.getvalue())
+        self.assertIn("montant 5 annoncé", erreurs.getvalue())
+        self.assertIn("ECHEC annoncé, paiement REUSSI", erreurs.getvalue())
+
+    def test_reprise_apres_interruption(self):
+        """Test qu'un rapprochement interrompu reprend au premier lot non validé"""
+        releve = [f"{p.reference};REUSSI;{p.montant}" for p in self.paiements]
+        traiter_lot = ServiceRapprochement._traiter_lot
+        appels = []
+
+        def interrompre(*args, **kwargs):
+            appels.append(1)
+            if len(appels) == 2:
+                raise RuntimeError("processus arrêté")
+            return traiter_lot(*args, **kwargs)
+
+        with mock.patch.object(ServiceRapprochement, '_traiter_lot', side_effect=interrompre):
+            with self.assertRaises(RuntimeError):
+                ServiceRapprochement.rapprocher('MOBILE_MONEY', self._releve(releve), 'releve.csv', taille_lot=2)
+        self.assertEqual(self._statuts(), ['REUSSI', 'REUSSI', 'EN_ATTENTE', 'EN_ATTENTE'])
+
+        rapport = ServiceRapprochement.rapprocher('MOBILE_MONEY', self._releve(releve), 'releve.csv', taille_lot=2)
+        self.assertEqual((rapport['reprises'], rapport['lignes']), (2, 2))
+        self.assertEqual(rapport['resultats']['APPLIQUEE'], 2)
+        self.assertEqual(self._statuts(), ['REUSSI'] * 4)
+
+        # Relecture complète : rien n'est réappliqué ni journalisé deux fois
+        rapport = ServiceRapprochement.rapprocher(
+            'MOBILE_MONEY', self._releve(releve), 'releve.csv', recommencer=True
+        )
+        self.assertEqual(rapport['resultats']['DOUBLON'], 4)
+        self.assertEqual(NotificationPaiement.objects.count(), 4)
+
+
+class AdminGrandesTablesTestCase(TestCase):
+    """Tests des listes de l'admin sur les tables volumineuses"""
+
+    def setUp(self):
+        self.admin = Utilisateur.objects.create_superuser(
+            username='admin_test', email='admin@test.com', password='password123',
+            first_name='Ada', last_name='Admin', role='CLIENT'
+        )
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.categorie = Categorie.objects.create(nom='Légumes')
+        self.client.login(username='admin_test', password='password123')
+
+    def _creer_commandes(self, nombre):
+        for i in range(nombre):
+            client = Utilisateur.objects.create_user(
+                username=f'client_{Commande.objects.count()}', email=f'client{Commande.objects.count()}@test.com',
+                password='password123', role='CLIENT'
+            )
+            produit = Produit.objects.create(
+                vendeur=self.vendeur, categorie=self.categorie,
+                nom=f'Produit {Produit.objects.count()}', prix=Decimal('100'), quantite=5
+            )
+            commande = Commande.objects.create(client=client, statut='EN_ATTENTE', montant_total=Decimal('100'))
+            LigneCommande.objects.create(commande=commande, produit=produit, quantite=1, prix_unitaire=Decimal('100'))
+        return commande
+
+    def _nb_requetes(self, modele):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(reverse(f'admin:agri_market_{modele}_changelist'))
+        self.assertEqual(reponse.status_code, 200)
+        return len(requetes)
+
+    def test_listes_en_nombre_de_requetes_constant(self):
+        """Test que le nombre de requêtes d'une liste ne dépend pas du nombre de lignes"""
+        modeles = ('produit', 'commande', 'lignecommande', 'paiement')
+        self._creer_commandes(2)
+        avant = [self._nb_requetes(modele) for modele in modeles]
+        self._creer_commandes(8)
+        self.assertEqual([self._nb_requetes(modele) for modele in modeles], avant)
+
+    def test_nombre_estime_sur_grande_table(self):
+        """Test que le paginateur remplace le COUNT(*) par l'estimation au-delà du seuil"""
+        self._creer_commandes(3)
+        with mock.patch('agri_market.admin.estimer_nombre', return_value=5_000_000):
+            self.assertEqual(PaginateurEstime(Produit.objects.all(), 100).count, 5_000_000)
+            reponse = self.client.get(reverse('admin:agri_market_produit_changelist'))
+            self.assertContains(reponse, '5000000')
+        with mock.patch('agri_market.admin.estimer_nombre', return_value=40):
+            self.assertEqual(PaginateurEstime(Produit.objects.all(), 100).count, 3)
+
+    def test_autocompletion_et_recherche(self):
+        """Test des clés étrangères en autocomplétion et de la recherche par numéro"""
+        commande = self._creer_commandes(3)
+
+        reponse = self.client.get(reverse('admin:agri_market_produit_add'))
+        self.assertContains(reponse, 'admin-autocomplete')
+        self.assertNotContains(reponse, f'<option value="{self.vendeur.id}"')
+
+        # Seuls les vendeurs sont proposés (limit_choices_to)
+        reponse = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'agri_market', 'model_name': 'produit', 'field_name': 'vendeur', 'term': 'vendeur_',
+        })
+        self.assertEqual([r['id'] for r in reponse.json()['results']], [str(self.vendeur.id)])
+
+        reponse = self.client.get(reverse('admin:agri_market_lignecommande_changelist'), {'q': str(commande.id)})
+        self.assertEqual(list(reponse.context['cl'].result_list), list(commande.lignes.all()))
+
+        # Chiffres non ASCII ou hors des bornes d'un id : recherche textuelle ordinaire
+        for terme in ('²', '9' * 30):
+            reponse = self.client.get(reverse('admin:agri_market_lignecommande_changelist'), {'q': terme})
+            self.assertEqual(reponse.status_code, 200)
+            self.assertEqual(list(reponse.context['cl'].result_list), [])
+
+
+class ActionsAdminTestCase(TestCase):
+    """Tests des actions en masse de l'admin (UPDATE ensemblistes par lots)"""
+
+    def setUp(self):
+        Utilisateur.objects.create_superuser(
+            username='admin_test', email='admin@test.com', password='password123',
+            first_name='Ada', last_name='Admin', role='CLIENT'
+        )
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test', email='client@test.com', password='password123', role='CLIENT'
+        )
+        self.categorie = Categorie.objects.create(nom='Légumes')
+        self.client.login(username='admin_test', password='password123')
+
+    def _action(self, modele, action, objets, **donnees):
+        return self.client.post(reverse(f'admin:agri_market_{modele}_changelist'), {
+            'action': action,
+            '_selected_action': [objet.pk for objet in objets],
+            **donnees,
+        }, follow=True)
+
+    def test_revision_des_prix_par_lots(self):
+        """Test de la révision des prix, arrondie et bornée, en plusieurs lots"""
+        prix = [Decimal('100'), Decimal('0.01'), Decimal('33.33'), Decimal('250'), Decimal('80')]
+        produits = [
+            Produit.objects.create(
+                vendeur=self.vendeur, categorie=self.categorie, nom=f'Produit {i}', prix=p, quantite=1
+            )
+            for i, p in enumerate(prix)
+        ]
+
+        with mock.patch('agri_market.admin.TAILLE_LOT_ACTIONS', 2):
+            reponse = self._action('produit', 'reviser_prix', produits, pourcentage='-10')
+        self.assertContains(reponse, "5 ligne(s) modifiée(s) sur 5 sélectionnée(s) — 3 lot(s)")
+        self.assertEqual(
+            [Produit.objects.get(id=p.id).prix for p in produits],
+            [Decimal('90.00'), Decimal('0.01'), Decimal('30.00'), Decimal('225.00'), Decimal('72.00')]
+        )
+
+        reponse = self._action('produit', 'reviser_prix', produits, pourcentage='-95')
+        self.assertContains(reponse, "compris entre -90 et 100")
+        self.assertEqual(Produit.objects.get(id=produits[0].id).prix, Decimal('90.00'))
+
+    def test_statuts_de_commandes_en_masse(self):
+        """Test que seules les transitions autorisées sont appliquées, date_modification comprise"""
+        def commande(statut):
+            return Commande.objects.create(client=self.client_user, statut=statut, montant_total=Decimal('10'))
+
+        en_attente, expediee, annulee, en_ligne = (
+            commande('EN_ATTENTE'), commande('EXPEDIEE'), commande('ANNULEE'), commande('EN_ATTENTE')
+        )
+        Paiement.objects.create(
+            reference='PAY-TEST', commande=en_ligne, client=self.client_user,
+            montant=Decimal('10'), mode_paiement='MOBILE_MONEY'
+        )
+        selection = [en_attente, expediee, annulee, en_ligne]
+
+        reponse = self._action('commande', 'marquer_payees', selection)
+        self.assertContains(reponse, "1 ligne(s) modifiée(s) sur 4 sélectionnée(s), 3 ignorée(s)")
+        self._action('commande', 'marquer_livrees', selection)
+
+        statuts = [Commande.objects.get(id=c.id).statut for c in selection]
+        self.assertEqual(statuts, ['PAYEE', 'LIVREE', 'ANNULEE', 'EN_ATTENTE'])
+        en_attente_avant = en_attente.date_modification
+        en_attente.refresh_from_db()
+        self.assertGreater(en_attente.date_modification, en_attente_avant)
+
+    def test_desactivation_des_vendeurs(self):
+        """Test que seuls les vendeurs sont désactivés"""
+        reponse = self._action('utilisateur', 'desactiver_vendeurs', [self.vendeur, self.client_user])
+        self.assertContains(reponse, "1 ligne(s) modifiée(s) sur 2 sélectionnée(s)")
+
+        self.vendeur.refresh_from_db()
+        self.client_user.refresh_from_db()
+        self.assertEqual((self.vendeur.is_active, self.client_user.is_active), (False, True))
+        self.assertFalse(self.client.login(username='vendeur_test', password='password123'))
+
+
+class CompteurVuesTestCase(BudgetRequetesMixin, TestCase):
+    """Tests des compteurs de vues tamponnés et des produits populaires"""
+
+    def setUp(self):
+        self.tampon = compteur_vues.tampon
+        self.tampon.reinitialiser()
+        self.addCleanup(self.tampon.reinitialiser)
+        vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        categorie = Categorie.objects.create(nom='Légumes')
+        self.produits = [
+            Produit.objects.create(
+                vendeur=vendeur, categorie=categorie, nom=f'Produit {i}', prix=Decimal('100'), quantite=5
+            )
+            for i in range(4)
+        ]
+
+    def _vues(self):
+        return [Produit.objects.get(id=p.id).vues for p in self.produits]
+
+    def test_vidage_par_lots(self):
+        """Test que les consultations restent en mémoire puis s'écrivent en un UPDATE par incrément"""
+        a, b, c, _ = self.produits
+        for produit in (a, b, c, a, b, a):
+            self.client.get(reverse('detail_produit', args=[produit.id]))
+        self.assertEqual(self._vues(), [0, 0, 0, 0])
+
+        # Incréments 3, 2 et 1 : trois UPDATE
+        with self.assertNumQueries(3):
+            self.assertEqual(self.tampon.vider(), 3)
+        self.assertEqual(self._vues(), [3, 2, 1, 0])
+        self.assertEqual(self.tampon.vider(), 0)
+
+    @override_settings(VUES_INTERVALLE_VIDAGE=0)
+    def test_vidage_periodique(self):
+        """Test que la page produit vide le tampon une fois l'intervalle écoulé"""
+        self.client.get(reverse('detail_produit', args=[self.produits[1].id]))
+        self.assertEqual(self._vues(), [0, 1, 0, 0])
+
+    def test_echec_d_ecriture_reporte(self):
+        """Test qu'une base indisponible ne perd pas les consultations"""
+        compteur_vues.compter_vue(self.produits[0].id)
+        with mock.patch.object(compteur_vues.Produit.objects, 'filter', side_effect=OperationalError):
+            self.assertEqual(self.tampon.vider(), 0)
+        compteur_vues.compter_vue(self.produits[0].id)
+        self.tampon.vider()
+        self.assertEqual(self._vues(), [2, 0, 0, 0])
+
+    def test_produits_populaires(self):
+        """Test du classement par vues, sur la page d'accueil"""
+        Produit.objects.filter(id=self.produits[2].id).update(vues=50)
+        Produit.objects.filter(id=self.produits[0].id).update(vues=7)
+
+        self.assertEqual(
+            list(ServiceProduit.produits_populaires()), [self.produits[2], self.produits[0]]
+        )
+        reponse = self.assertBudgetRequetes('home', lambda: self.client.get(reverse('home')))
+        self.assertContains(reponse, 'Les plus consultés')
+        self.assertEqual(list(reponse.context['produits_populaires']), [self.produits[2], self.produits[0]])
+
+
+class MeilleuresVentesTestCase(TestCase):
+    """Tests des compteurs de ventes et des classements des meilleures ventes"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.vendeur = Utilisateur.objects.create_user(
+            username='vendeur_test', email='vendeur@test.com', password='password123',
+            role='VENDEUR', nom_boutique='Ferme Test'
+        )
+        self.client_user = Utilisateur.objects.create_user(
+            username='client_test', email='client@test.com', password='password123', role='CLIENT'
+        )
+        legumes = Categorie.objects.create(nom='Légumes')
+        fruits = Categorie.objects.create(nom='Fruits')
+        self.tomate, self.oignon, self.mangue = [
+            Produit.objects.create(
+                vendeur=self.vendeur, categorie=categorie, nom=nom, prix=Decimal('100'), quantite=100
+            )
+            for nom, categorie in (('Tomate', legumes), ('Oignon', legumes), ('Mangue', fruits))
+        ]
+
+    def _acheter(self, *achats):
+        for produit, quantite in achats:
+            ServicePanier.ajouter_au_panier(self.client_user.id, produit.id, quantite)
+        return ServicePanier.valider_commande(self.client_user.id)
+
+    def _unites(self):
+        return dict(CompteurVentesJour.objects.values_list('produit_id', 'unites'))
+
+    def test_validation_et_annulation(self):
+        """Test que les compteurs suivent les validations et les annulations"""
+        self._acheter((self.tomate, 3), (self.mangue, 1))
+        commande = self._acheter((self.tomate, 2), (self.oignon, 4))
+        self.assertEqual(self._unites(), {self.tomate.id: 5, self.mangue.id: 1, self.oignon.id: 4})
+
+        ServiceCommande.changer_statut(commande.id, self.vendeur.id, 'ANNULEE')
+        self.assertEqual(self._unites(), {self.tomate.id: 3, self.mangue.id: 1, self.oignon.id: 0})
+
+    def test_classements_par_fenetre(self):
+        """Test des classements global et par catégorie sur une fenêtre glissante"""
+        self._acheter((self.tomate, 2), (self.oignon, 1), (self.mangue, 5))
+        # Ventes d'il y a 10 jours : dans la fenêtre de 30 jours seulement
+        CompteurVentesJour.objects.create(
+            jour=timezone.localdate() - timedelta(days=10), produit=self.oignon, unites=9
+        )
+
+        semaine = ServiceMeilleuresVentes.classements(7)
+        self.assertEqual(semaine[None], [self.mangue, self.tomate, self.oignon])
+        self.assertEqual(semaine[self.tomate.categorie_id], [self.tomate, self.oignon])
+        self.assertEqual(semaine[self.mangue.categorie_id], [self.mangue])
+
+        mois = ServiceMeilleuresVentes.meilleures_ventes(fenetre=30)
+        self.assertEqual(mois, [self.oignon, self.mangue, self.tomate])
+        self.assertEqual(mois[0].unites_vendues, 10)
+        self.assertEqual(ServiceMeilleuresVentes.meilleures_ventes('inconnue'), [])
+
+    def test_servi_par_le_cache(self):
+        """Test qu'un classement en cache est servi sans requête et affiché au catalogue"""
+        self._acheter((self.tomate, 2), (self.mangue, 1))
+        ServiceMeilleuresVentes.classements()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ServiceMeilleuresVentes.meilleures_ventes(self.mangue.categorie_id), [self.mangue])
+
+        response = self.client.get(reverse('liste_produits'), {'categorie': self.mangue.categorie_id})
+        self.assertContains(response, 'Meilleures ventes')
+        self.assertEqual(response.context['meilleures_ventes'], [self.mangue])
+
+    def test_reconstruction(self):
+        """Test que la reconstruction retrouve les compteurs tenus à jour"""
+        self._acheter((self.tomate, 2), (self.mangue, 1))
+        self._acheter((self.tomate, 1))
+        unites = self._unites()
+
+        call_command('reconstruire_meilleures_ventes', stdout=StringIO())
+        self.assertEqual(self._unites(), unites)
+
+
 # Commande pour exécuter les tests
 # python manage.py test agri_market
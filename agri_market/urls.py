@@ -27,19 +27,31 @@ urlpatterns = [
     path('panier/vider/', views.vider_panier, name='vider_panier'),
     path('panier/valider/', views.valider_commande, name='valider_commande'),
     path('mes-commandes/', views.mes_commandes, name='mes_commandes'),
+    path('mes-commandes/payer/<int:commande_id>/', views.payer_commande, name='payer_commande'),
+    
+    # Notifications des passerelles de paiement (sans session ni jeton CSRF, signées)
+    path('paiements/notification/<slug:mode>/', views.notification_paiement, name='notification_paiement'),
     
     # URLs vendeur
     path('vendeur/mes-produits/', views.mes_produits, name='mes_produits'),
     path('vendeur/ajouter-produit/', views.ajouter_produit, name='ajouter_produit'),
+    path('vendeur/importer-produits/', views.importer_produits, name='importer_produits'),
     path('vendeur/modifier-produit/<int:produit_id>/', views.modifier_produit, name='modifier_produit'),
     path('vendeur/supprimer-produit/<int:produit_id>/', views.supprimer_produit, name='supprimer_produit'),
     # URLs vendeur - Commandes
     path('vendeur/commandes/', views.commandes_vendeur, name='commandes_vendeur'),
+    path('vendeur/commandes/export/', views.exporter_commandes_vendeur, name='exporter_commandes_vendeur'),
+    path('vendeur/statistiques/', views.statistiques_vendeur, name='statistiques_vendeur'),
     path('vendeur/commande/statut/<int:commande_id>/', views.changer_statut_commande, name='changer_statut_commande'),
     
      # Dashboard admin
     path('admin-dashboard/', views.dashboard_admin, name='dashboard_admin'),
     
+    # Métriques (format Prometheus)
+    path('metrics', views.metriques_prometheus, name='metriques'),
+    
     # API AJAX (optionnel)
     path('api/ajuster-stock/<int:produit_id>/', views.ajuster_stock_ajax, name='ajuster_stock_ajax'),
+    path('api/ajuster-stocks/', views.ajuster_stocks_ajax, name='ajuster_stocks_ajax'),
+    path('api/vendeur/statistiques/', views.statistiques_vendeur_json, name='statistiques_vendeur_json'),
 ]
@@ -0,0 +1,15 @@
+"""
+URLs servies par les vues asynchrones (cf. views_async)
+
+Incluses avant agri_market.urls par e_agri.urls_async : les mêmes chemins et
+noms d'URL pointent alors vers les versions async.
+"""
+
+from django.urls import path
+from . import views_async
+
+urlpatterns = [
+    path('produits/', views_async.liste_produits, name='liste_produits'),
+    path('produit/<int:produit_id>/', views_async.detail_produit, name='detail_produit'),
+    path('api/vendeur/statistiques/', views_async.statistiques_vendeur_json, name='statistiques_vendeur_json'),
+]
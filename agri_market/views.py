@@ -2,27 +2,45 @@
 Vues pour la gestion des produits et du panier
 """
 
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.exceptions import ValidationError, PermissionDenied
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.dateparse import parse_date
 
-from .models import Produit, Categorie, Utilisateur, Commande, LigneCommande
+from .models import Produit, Categorie, Utilisateur, Commande, LigneCommande, Paiement
 from .services_produit import ServiceProduit, ServiceCategorie
-from .services_panier import ServicePanier
+from .services_panier import ServicePanier, ServiceCommande
+from .services_paiement import ServicePaiement
+from .passerelles_paiement import modes_en_ligne
+from . import compteur_vues, metriques
+from .services_export import ServiceExport
+from .services_import import ServiceImport
+from .services_statistiques import ServiceStatistiques, ServiceMeilleuresVentes, FENETRES_ANALYSE
 from django.views.decorators.csrf import csrf_exempt
 
+# Nombre de lignes par page dans les listes du dashboard admin
+TAILLE_PAGE_DASHBOARD = 25
+
 # =========================
 # PAGE D'ACCUEIL
 # =========================
 
 def home(request):
     """Page d'accueil du site"""
-    return render(request, 'agri_market/home.html')
+    context = {
+        'produits_populaires': ServiceProduit.produits_populaires(),
+        'meilleures_ventes': ServiceMeilleuresVentes.meilleures_ventes(),
+    }
+    return render(request, 'agri_market/home.html', context)
 
 
 # =========================
@@ -133,9 +151,13 @@ def liste_produits(request):
     
     categories = ServiceCategorie.lister_categories()
     
+    # Classement servi par le cache (aucun classement sur une recherche)
+    meilleures_ventes = [] if terme_recherche else ServiceMeilleuresVentes.meilleures_ventes(categorie_id)
+    
     context = {
         'produits': produits,
         'categories': categories,
+        'meilleures_ventes': meilleures_ventes,
         'terme_recherche': terme_recherche,
         'categorie_selectionnee': categorie_id
     }
@@ -151,16 +173,17 @@ def detail_produit(request, produit_id):
         produit = ServiceProduit.obtenir_produit(produit_id)
         
         # Produits similaires (même catégorie)
-        produits_similaires = Produit.objects.filter(
-            categorie=produit.categorie
-        ).exclude(id=produit_id)[:4]
+        produits_similaires = ServiceProduit.produits_similaires(produit_id)
         
         context = {
             'produit': produit,
             'produits_similaires': produits_similaires
         }
         
-        return render(request, 'agri_market/produits/detail.html', context)
+        reponse = render(request, 'agri_market/produits/detail.html', context)
+        # En mémoire ; écrit en base par lots (cf. compteur_vues)
+        compteur_vues.compter_vue(produit.id)
+        return reponse
         
     except ValidationError as e:
         messages.error(request, str(e))
@@ -209,14 +232,15 @@ def ajouter_produit(request):
             quantite = int(request.POST.get('quantite'))
             categorie_id = int(request.POST.get('categorie'))
             
-            # Créer le produit via le service
+            # Créer le produit via le service (photo redimensionnée en arrière-plan)
             produit = ServiceProduit.creer_produit(
                 vendeur_id=request.user.id,
                 nom=nom,
                 prix=prix,
                 quantite=quantite,
                 categorie_id=categorie_id,
-                description=description
+                description=description,
+                image=request.FILES.get('image')
             )
             
             messages.success(request, f"Produit '{produit.nom}' ajouté avec succès !")
@@ -237,6 +261,37 @@ def ajouter_produit(request):
     return render(request, 'agri_market/vendeur/ajouter_produit.html', context)
 
 
+@login_required
+def importer_produits(request):
+    """
+    Importer ou mettre à jour des produits en masse depuis un fichier CSV
+    """
+    if request.user.role != 'VENDEUR':
+        messages.error(request, "Accès réservé aux vendeurs")
+        return redirect('liste_produits')
+    
+    rapport = None
+    if request.method == 'POST':
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            messages.error(request, "Veuillez choisir un fichier CSV")
+        else:
+            rapport = ServiceImport.importer_csv(request.user.id, fichier)
+            if rapport['crees'] or rapport['mis_a_jour']:
+                messages.success(
+                    request,
+                    f"{rapport['crees']} produit(s) créé(s), {rapport['mis_a_jour']} mis à jour"
+                )
+    
+    context = {
+        'rapport': rapport,
+        'colonnes': ServiceImport.COLONNES,
+        'categories': ServiceCategorie.lister_categories(),
+    }
+    
+    return render(request, 'agri_market/vendeur/importer_produits.html', context)
+
+
 @login_required
 def modifier_produit(request, produit_id):
     """
@@ -261,7 +316,8 @@ def modifier_produit(request, produit_id):
                 'description': request.POST.get('description', ''),
                 'prix': float(request.POST.get('prix')),
                 'quantite': int(request.POST.get('quantite')),
-                'categorie_id': int(request.POST.get('categorie'))
+                'categorie_id': int(request.POST.get('categorie')),
+                'image': request.FILES.get('image')
             }
             
             # Modifier le produit
@@ -347,16 +403,6 @@ def voir_panier(request):
 @login_required
 def ajouter_au_panier(request, produit_id):
     """Ajouter un produit au panier"""
-    from decimal import Decimal
-    
-    print(f"\n{'='*60}")
-    print(f"🛒 REQUÊTE REÇUE!")
-    print(f"   Méthode: {request.method}")
-    print(f"   User: {request.user.username}")
-    print(f"   Produit ID: {produit_id}")
-    print(f"   POST data: {request.POST}")
-    print(f"{'='*60}\n")
-    
     # Vérifier la méthode
     if request.method != 'POST':
         messages.error(request, "Méthode non autorisée")
@@ -368,76 +414,20 @@ def ajouter_au_panier(request, produit_id):
         return redirect('detail_produit', produit_id=produit_id)
     
     try:
-        # Récupérer le produit
-        produit = Produit.objects.get(id=produit_id)
-        print(f"✅ Produit trouvé: {produit.nom}")
-        
-        # Récupérer la quantité
         quantite = int(request.POST.get('quantite', 1))
-        print(f"✅ Quantité: {quantite}")
-        
-        # Vérifier le stock
-        if produit.quantite < quantite:
-            messages.error(request, f"Stock insuffisant. Disponible: {produit.quantite}")
-            return redirect('detail_produit', produit_id=produit_id)
-        
-        # Obtenir ou créer le panier
-        panier, created = Commande.objects.get_or_create(
-            client=request.user,
-            statut='PANIER',
-            defaults={'montant_total': Decimal('0')}
-        )
-        print(f"✅ Panier: ID={panier.id} (nouveau={created})")
-        
-        # Vérifier si le produit est déjà dans le panier
-        ligne_existante = LigneCommande.objects.filter(
-            commande=panier,
-            produit=produit
-        ).first()
-        
-        if ligne_existante:
-            print(f"📝 Mise à jour ligne existante")
-            ligne_existante.quantite += quantite
-            ligne_existante.save()
-            ligne = ligne_existante
-        else:
-            print(f"➕ Création nouvelle ligne")
-            ligne = LigneCommande.objects.create(
-                commande=panier,
-                produit=produit,
-                quantite=quantite,
-                prix_unitaire=produit.prix
-            )
-        
-        print(f"✅ Ligne sauvegardée: ID={ligne.id}")
-        
-        # Recalculer le total
-        total = Decimal('0')
-        for l in panier.lignes.all():
-            total += l.prix_unitaire * l.quantite
-        panier.montant_total = total
-        panier.save()
-        
-        print(f"✅ Total recalculé: {total} FCFA")
-        print(f"✅ SUCCÈS COMPLET!\n")
+        ligne = ServicePanier.ajouter_au_panier(request.user.id, produit_id, quantite)
         
-        messages.success(request, f"✅ {produit.nom} ajouté au panier !")
+        messages.success(request, f"✅ {ligne.produit.nom} ajouté au panier !")
         return redirect('voir_panier')
         
-    except Produit.DoesNotExist:
-        print(f"❌ Produit introuvable")
-        messages.error(request, "Produit introuvable")
-        return redirect('liste_produits')
-    except ValueError as e:
-        print(f"❌ Erreur de valeur: {e}")
+    except ValueError:
         messages.error(request, "Quantité invalide")
         return redirect('detail_produit', produit_id=produit_id)
-    except Exception as e:
-        print(f"❌ Erreur: {e}")
-        import traceback
-        traceback.print_exc()
-        messages.error(request, f"Erreur : {str(e)}")
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
         return redirect('detail_produit', produit_id=produit_id)
+
+
 @login_required
 @require_http_methods(["POST"])
 def modifier_quantite_panier(request, ligne_id):
@@ -529,10 +519,14 @@ def mes_commandes(request):
         client=request.user
     ).exclude(
         statut='PANIER'
-    ).prefetch_related('lignes__produit__vendeur').order_by('-date_commande')
+    ).select_related('paiement').prefetch_related('lignes__produit__vendeur').order_by('-date_commande')
     
     context = {
-        'commandes': commandes
+        'commandes': commandes,
+        'modes_paiement': [
+            (mode, libelle) for mode, libelle in Paiement.MODE_PAIEMENT_CHOICES
+            if mode in modes_en_ligne()
+        ],
     }
     
     return render(request, 'agri_market/client/mes_commandes.html', context)
@@ -549,17 +543,24 @@ def commandes_vendeur(request):
         messages.error(request, "Accès réservé aux vendeurs")
         return redirect('liste_produits')
     
-    from django.db.models import Sum, F
+    from django.db.models import Count, Prefetch, Q
     
     # Filtrer par statut si demandé
     statut_filtre = request.GET.get('statut', '')
     
-    # Récupérer toutes les commandes qui contiennent mes produits
+    # Récupérer toutes les commandes qui contiennent mes produits,
+    # avec seulement mes lignes préchargées (une requête pour toutes les commandes)
     mes_produits_ids = Produit.objects.filter(vendeur=request.user).values_list('id', flat=True)
     
     commandes_query = Commande.objects.filter(
         lignes__produit_id__in=mes_produits_ids
-    ).exclude(statut='PANIER').distinct().select_related('client').prefetch_related('lignes__produit')
+    ).exclude(statut='PANIER').distinct().select_related('client').prefetch_related(
+        Prefetch(
+            'lignes',
+            queryset=LigneCommande.objects.filter(produit__vendeur=request.user).select_related('produit'),
+            to_attr='mes_lignes'
+        )
+    )
     
     if statut_filtre:
         commandes_query = commandes_query.filter(statut=statut_filtre)
@@ -569,43 +570,100 @@ def commandes_vendeur(request):
     # Préparer les données avec seulement mes lignes
     commandes_data = []
     for commande in commandes_query:
-        mes_lignes = commande.lignes.filter(produit__vendeur=request.user)
-        mon_total = sum(ligne.prix_unitaire * ligne.quantite for ligne in mes_lignes)
+        mon_total = sum(ligne.prix_unitaire * ligne.quantite for ligne in commande.mes_lignes)
         
         commandes_data.append({
             'commande': commande,
-            'mes_lignes': mes_lignes,
+            'mes_lignes': commande.mes_lignes,
             'mon_total': mon_total
         })
     
-    # Statistiques
-    stats = {
-        'en_attente': Commande.objects.filter(
-            lignes__produit__vendeur=request.user,
-            statut='EN_ATTENTE'
-        ).distinct().count(),
-        'payees': Commande.objects.filter(
-            lignes__produit__vendeur=request.user,
-            statut='PAYEE'
-        ).distinct().count(),
-        'expediees': Commande.objects.filter(
-            lignes__produit__vendeur=request.user,
-            statut='EXPEDIEE'
-        ).distinct().count(),
-        'livrees': Commande.objects.filter(
-            lignes__produit__vendeur=request.user,
-            statut='LIVREE'
-        ).distinct().count(),
-    }
+    # Statistiques (une seule agrégation conditionnelle)
+    stats = Commande.objects.filter(
+        lignes__produit__vendeur=request.user
+    ).aggregate(
+        en_attente=Count('id', filter=Q(statut='EN_ATTENTE'), distinct=True),
+        payees=Count('id', filter=Q(statut='PAYEE'), distinct=True),
+        expediees=Count('id', filter=Q(statut='EXPEDIEE'), distinct=True),
+        livrees=Count('id', filter=Q(statut='LIVREE'), distinct=True),
+    )
+    
+    # Ventes (lues dans les agrégats journaliers, cf. agreger_ventes)
+    ventes = ServiceStatistiques.totaux_ventes(vendeur_id=request.user.id)
+    serie_ventes = ServiceStatistiques.ventes_par_jour(jours=30, vendeur_id=request.user.id)
     
     context = {
         'commandes': commandes_data,
         'stats': stats,
+        'ventes': ventes,
+        'serie_ventes': serie_ventes,
     }
     
     return render(request, 'agri_market/vendeur/commandes_recues.html', context)
 
 
+@login_required
+def exporter_commandes_vendeur(request):
+    """Exporter en CSV les lignes de commande du vendeur (téléchargement en flux)"""
+    if request.user.role != 'VENDEUR':
+        messages.error(request, "Accès réservé aux vendeurs")
+        return redirect('liste_produits')
+    
+    try:
+        date_debut = parse_date(request.GET.get('du', ''))
+        date_fin = parse_date(request.GET.get('au', ''))
+    except ValueError:
+        messages.error(request, "Dates invalides")
+        return redirect('commandes_vendeur')
+    
+    if date_debut and date_fin and date_debut > date_fin:
+        messages.error(request, "La date de début doit précéder la date de fin")
+        return redirect('commandes_vendeur')
+    
+    response = StreamingHttpResponse(
+        ServiceExport.exporter_csv(request.user.id, date_debut, date_fin),
+        content_type='text/csv; charset=utf-8'
+    )
+    nom_fichier = f"commandes_{request.user.username}_{date_debut or 'debut'}_{date_fin or 'fin'}.csv"
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+def _lire_fenetre(request):
+    """Lire la fenêtre d'analyse (en jours) depuis la requête"""
+    try:
+        return int(request.GET.get('fenetre', 30))
+    except ValueError:
+        return 30
+
+
+@login_required
+def statistiques_vendeur(request):
+    """Analyse des ventes du vendeur (par produit et par statut)"""
+    if request.user.role != 'VENDEUR':
+        messages.error(request, "Accès réservé aux vendeurs")
+        return redirect('liste_produits')
+    
+    analyse = ServiceStatistiques.analyse_vendeur(request.user.id, _lire_fenetre(request))
+    
+    context = {
+        'analyse': analyse,
+        'fenetres': FENETRES_ANALYSE,
+    }
+    
+    return render(request, 'agri_market/vendeur/statistiques.html', context)
+
+
+@login_required
+def statistiques_vendeur_json(request):
+    """Séries de ventes du vendeur au format JSON"""
+    if request.user.role != 'VENDEUR':
+        return JsonResponse({'success': False, 'message': 'Accès réservé aux vendeurs'}, status=403)
+    
+    analyse = ServiceStatistiques.analyse_vendeur(request.user.id, _lire_fenetre(request))
+    return JsonResponse(analyse)
+
+
 @login_required
 @require_http_methods(["POST"])
 def changer_statut_commande(request, commande_id):
@@ -615,37 +673,79 @@ def changer_statut_commande(request, commande_id):
         return redirect('liste_produits')
     
     try:
-        commande = Commande.objects.get(id=commande_id)
-        nouveau_statut = request.POST.get('statut')
-        
-        # Vérifier que cette commande contient mes produits
-        if not commande.lignes.filter(produit__vendeur=request.user).exists():
-            messages.error(request, "Cette commande ne vous concerne pas")
-            return redirect('commandes_vendeur')
-        
-        # Valider la transition de statut
-        transitions_valides = {
-            'EN_ATTENTE': ['PAYEE', 'ANNULEE'],
-            'PAYEE': ['EXPEDIEE', 'ANNULEE'],
-            'EXPEDIEE': ['LIVREE'],
-        }
-        
-        if commande.statut in transitions_valides:
-            if nouveau_statut in transitions_valides[commande.statut]:
-                commande.statut = nouveau_statut
-                commande.save()
-                messages.success(request, f"Statut mis à jour: {commande.get_statut_display()}")
-            else:
-                messages.error(request, "Transition de statut invalide")
-        else:
-            messages.error(request, "Impossible de modifier ce statut")
-            
-    except Commande.DoesNotExist:
-        messages.error(request, "Commande introuvable")
+        commande = ServiceCommande.changer_statut(
+            commande_id,
+            request.user.id,
+            request.POST.get('statut')
+        )
+        messages.success(request, f"Statut mis à jour: {commande.get_statut_display()}")
+    except PermissionDenied as e:
+        messages.error(request, str(e))
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
     
     return redirect('commandes_vendeur')
 
 
+# =========================
+# PAIEMENTS EN LIGNE
+# =========================
+
+@login_required
+@require_http_methods(["POST"])
+def payer_commande(request, commande_id):
+    """Initier le paiement en ligne d'une commande (client)"""
+    if request.user.role != 'CLIENT':
+        messages.error(request, "Accès réservé aux clients")
+        return redirect('liste_produits')
+    
+    try:
+        paiement, url_redirection = ServicePaiement.initier_paiement(
+            commande_id,
+            request.user.id,
+            request.POST.get('mode_paiement')
+        )
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
+        return redirect('mes_commandes')
+    
+    if url_redirection:
+        return redirect(url_redirection)
+    
+    messages.info(
+        request,
+        f"Paiement {paiement.reference} en cours : confirmez-le auprès de votre opérateur"
+    )
+    return redirect('mes_commandes')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def notification_paiement(request, mode):
+    """
+    Notification signée d'une passerelle de paiement
+    
+    Toute réponse 2xx met fin aux renvois de la passerelle : un doublon, une
+    notification hors séquence ou une référence inconnue sont acquittés
+    (et journalisés) ; seules une signature invalide ou une erreur serveur
+    provoquent un nouvel envoi.
+    """
+    mode_paiement = mode.upper().replace('-', '_')
+    
+    try:
+        resultat = ServicePaiement.traiter_notification(
+            mode_paiement,
+            request.body,
+            request.headers.get('X-Signature', '')
+        )
+    except PermissionDenied as e:
+        return JsonResponse({'erreur': str(e)}, status=403)
+    except ValidationError as e:
+        return JsonResponse({'erreur': " ".join(e.messages)}, status=400)
+    
+    return JsonResponse({'resultat': resultat})
+
+
 # =========================
 # DASHBOARD ADMIN
 # =========================
@@ -653,35 +753,61 @@ def changer_statut_commande(request, commande_id):
 @staff_member_required
 def dashboard_admin(request):
     """Dashboard administrateur - accessible uniquement aux superusers"""
-    from django.db.models import Count, Q
+    recherche = request.GET.get('q', '').strip()
+    onglet = request.GET.get('onglet', 'vendeurs')
     
     # Statistiques
-    stats = {
-        'total_users': Utilisateur.objects.count(),
-        'total_vendeurs': Utilisateur.objects.filter(role='VENDEUR').count(),
-        'total_clients': Utilisateur.objects.filter(role='CLIENT').count(),
-        'total_produits': Produit.objects.count(),
-        'total_commandes': Commande.objects.exclude(statut='PANIER').count(),
-        'commandes_attente': Commande.objects.filter(statut='EN_ATTENTE').count(),
-        'commandes_payees': Commande.objects.filter(statut='PAYEE').count(),
-        'commandes_livrees': Commande.objects.filter(statut='LIVREE').count(),
-    }
-    
-    # Listes
-    vendeurs = Utilisateur.objects.filter(role='VENDEUR').prefetch_related('produits').order_by('-date_joined')
-    clients = Utilisateur.objects.filter(role='CLIENT').prefetch_related('commandes').order_by('-date_joined')
-    commandes_recentes = Commande.objects.exclude(statut='PANIER').select_related('client').prefetch_related('lignes').order_by('-date_commande')[:20]
+    stats = ServiceStatistiques.statistiques_plateforme()
+    
+    # Ventes (lues dans les agrégats journaliers, cf. agreger_ventes)
+    ventes = ServiceStatistiques.totaux_ventes()
+    serie_ventes = ServiceStatistiques.ventes_par_jour(jours=30)
+    
+    # Listes paginées, puis compteurs calculés pour la seule page affichée
+    vendeurs = Paginator(
+        ServiceStatistiques.lister_vendeurs(recherche), TAILLE_PAGE_DASHBOARD
+    ).get_page(request.GET.get('page_vendeurs'))
+    ServiceStatistiques.compter_produits(vendeurs)
+    clients = Paginator(
+        ServiceStatistiques.lister_clients(recherche), TAILLE_PAGE_DASHBOARD
+    ).get_page(request.GET.get('page_clients'))
+    ServiceStatistiques.compter_commandes(clients)
+    commandes_recentes = ServiceStatistiques.commandes_recentes()
     
     context = {
         'stats': stats,
+        'ventes': ventes,
+        'serie_ventes': serie_ventes,
         'vendeurs': vendeurs,
         'clients': clients,
         'commandes_recentes': commandes_recentes,
+        'recherche': recherche,
+        'onglet': onglet,
     }
     
     return render(request, 'agri_market/admin/dashboard.html', context)
 
 
+# =========================
+# MÉTRIQUES
+# =========================
+
+def metriques_prometheus(request):
+    """Exposer les métriques de tous les processus (format texte Prometheus)"""
+    jeton = getattr(settings, 'METRIQUES_JETON', '')
+    if jeton:
+        if request.headers.get('Authorization') != f'Bearer {jeton}':
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        # Sans jeton configuré, réservé au personnel connecté
+        return HttpResponse(status=403)
+    
+    return HttpResponse(
+        metriques.exporter_texte(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 # =========================
 # API AJAX (Optionnel)
 # =========================
@@ -713,3 +839,43 @@ def ajuster_stock_ajax(request, produit_id):
             }, status=400)
     
     return JsonResponse({'success': False, 'message': 'Méthode non autorisée'}, status=405)
+
+
+@login_required
+@require_http_methods(["POST"])
+def ajuster_stocks_ajax(request):
+    """
+    Ajuster le stock de plusieurs produits en une requête (inventaire)
+    
+    Corps JSON : {"ajustements": [{"produit_id": 12, "delta": -3}, ...]}
+    """
+    if request.user.role != 'VENDEUR':
+        return JsonResponse({'success': False, 'message': 'Accès réservé aux vendeurs'}, status=403)
+    
+    try:
+        donnees = json.loads(request.body)
+        ajustements = [
+            (int(ajustement['produit_id']), ajustement['delta'])
+            for ajustement in donnees['ajustements']
+        ]
+        # Un delta flottant ou booléen serait tronqué en silence
+        if any(not isinstance(delta, int) or isinstance(delta, bool) for _, delta in ajustements):
+            raise TypeError
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Format attendu : {"ajustements": [{"produit_id": ..., "delta": ...}]}'
+        }, status=400)
+    
+    try:
+        quantites = ServiceProduit.ajuster_stocks(request.user.id, ajustements)
+    except PermissionDenied as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=403)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'message': " ".join(e.messages)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'quantites': {str(produit_id): quantite for produit_id, quantite in quantites.items()},
+        'message': f'{len(quantites)} stock(s) mis à jour'
+    })
@@ -0,0 +1,125 @@
+"""
+Vues asynchrones du catalogue et de l'API de lecture (déploiement ASGI)
+
+Mêmes URL, gabarits et réponses que leurs équivalents de views.py : elles
+les remplacent quand ROOT_URLCONF vaut e_agri.urls_async (réglage
+VUES_ASYNC, activé par asgi.py).
+
+Les requêtes indépendantes d'une page sont lancées ensemble avec
+asyncio.gather. Avec Django 4.2, l'ORM async exécute encore le SQL dans le
+thread synchrone de la requête : les requêtes s'y enchaînent, mais la boucle
+d'événements reste libre pour les autres requêtes pendant l'attente.
+Le rendu des gabarits (context processors, request.user) reste synchrone et
+passe par sync_to_async.
+"""
+
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+
+from . import compteur_vues
+from .services_produit import ServiceProduit, ServiceCategorie
+from .services_statistiques import ServiceStatistiques, ServiceMeilleuresVentes
+from .views import _lire_fenetre
+
+
+def connexion_requise(vue):
+    """login_required pour une vue async (celui de Django 4.2 ne les prend pas en charge)"""
+    @functools.wraps(vue)
+    async def enveloppe(request, *args, **kwargs):
+        # request.user est chargé paresseusement (session, base) : hors de la boucle
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await vue(request, *args, **kwargs)
+    return enveloppe
+
+
+async def _lister(queryset):
+    return [objet async for objet in queryset]
+
+
+async def _aucun():
+    return []
+
+
+# =========================
+# VUES PUBLIQUES (Catalogue)
+# =========================
+
+async def liste_produits(request):
+    """
+    Afficher tous les produits disponibles (page publique)
+    """
+    terme_recherche = request.GET.get('recherche', '')
+    categorie_id = request.GET.get('categorie', '')
+    
+    if terme_recherche:
+        produits = ServiceProduit.rechercher_produits(terme_recherche)
+    elif categorie_id:
+        produits = ServiceProduit.filtrer_par_categorie(categorie_id)
+    else:
+        produits = ServiceProduit.lister_tous_produits()
+    
+    # Produits, catégories et meilleures ventes (souvent servies par le cache) en parallèle
+    produits, categories, meilleures_ventes = await asyncio.gather(
+        _lister(produits),
+        sync_to_async(ServiceCategorie.lister_categories)(),
+        # Aucun classement sur une recherche
+        _aucun() if terme_recherche else sync_to_async(ServiceMeilleuresVentes.meilleures_ventes)(categorie_id),
+    )
+    
+    context = {
+        'produits': produits,
+        'categories': categories,
+        'meilleures_ventes': meilleures_ventes,
+        'terme_recherche': terme_recherche,
+        'categorie_selectionnee': categorie_id
+    }
+    
+    return await sync_to_async(render)(request, 'agri_market/produits/liste.html', context)
+
+
+async def detail_produit(request, produit_id):
+    """
+    Afficher les détails d'un produit
+    """
+    try:
+        # Les produits similaires ne dépendent que de l'ID : pas d'attente du produit
+        produit, produits_similaires = await asyncio.gather(
+            ServiceProduit.aobtenir_produit(produit_id),
+            _lister(ServiceProduit.produits_similaires(produit_id)),
+        )
+    except ValidationError as e:
+        await sync_to_async(messages.error)(request, str(e))
+        return redirect('liste_produits')
+    
+    context = {
+        'produit': produit,
+        'produits_similaires': produits_similaires
+    }
+    
+    reponse = await sync_to_async(render)(request, 'agri_market/produits/detail.html', context)
+    await compteur_vues.acompter_vue(produit.id)
+    return reponse
+
+
+# =========================
+# API (lecture)
+# =========================
+
+@connexion_requise
+async def statistiques_vendeur_json(request):
+    """Séries de ventes du vendeur au format JSON"""
+    if request.user.role != 'VENDEUR':
+        return JsonResponse({'success': False, 'message': 'Accès réservé aux vendeurs'}, status=403)
+    
+    analyse = await sync_to_async(ServiceStatistiques.analyse_vendeur)(
+        request.user.id, _lire_fenetre(request)
+    )
+    return JsonResponse(analyse)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'e_agri.settings')
+# Sous ASGI, le catalogue est servi par les vues asynchrones (agri_market/views_async.py)
+os.environ.setdefault('VUES_ASYNC', 'true')
 
 application = get_asgi_application()
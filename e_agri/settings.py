@@ -10,12 +10,29 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import copy
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Variables locales (.env) si python-dotenv est installé ; l'environnement reste prioritaire
+try:
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+except ImportError:
+    pass
+
+
+def _env_bool(nom, defaut):
+    # Variable absente ou vide (cf. .env.example) : valeur par défaut
+    valeur = os.environ.get(nom, '').strip().lower()
+    if not valeur:
+        return defaut
+    return valeur in ('1', 'true', 'oui', 'yes', 'on')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
@@ -44,6 +61,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'agri_market.middleware.StatiquesMiddleware',
+    'agri_market.middleware.RoutageBddMiddleware',
+    'agri_market.middleware.MetriquesMiddleware',
+    'agri_market.middleware.BudgetRequetesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,7 +74,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'e_agri.urls'
+# VUES_ASYNC : catalogue servi par les vues asynchrones (défini par asgi.py)
+ROOT_URLCONF = 'e_agri.urls_async' if _env_bool('VUES_ASYNC', False) else 'e_agri.urls'
 
 TEMPLATES = [
     {
@@ -78,18 +100,109 @@ WSGI_APPLICATION = 'e_agri.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# Connexion configurée par variables d'environnement (cf. .env.example)
+# DB_CONN_MAX_AGE : durée de vie (s) d'une connexion persistante, 0 = une connexion par requête
+# DB_CONN_HEALTH_CHECKS : vérifier une connexion persistante avant de la réutiliser
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'e_agri'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
+            # Derrière PgBouncer en mode transaction, les curseurs serveur sont à désactiver
+            'DISABLE_SERVER_SIDE_CURSORS': _env_bool('DB_DISABLE_SERVER_SIDE_CURSORS', False),
+        }
+    }
+    if os.environ.get('DB_STATEMENT_TIMEOUT'):
+        # Millisecondes ; protège les workers contre les requêtes SQL incontrôlées
+        DATABASES['default']['OPTIONS']['options'] = f"-c statement_timeout={os.environ['DB_STATEMENT_TIMEOUT']}"
+
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = _env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+# Répliques en lecture (cf. agri_market/routage_bdd.py)
+# DB_REPLICAS : hôtes PostgreSQL (hote[:port]) séparés par des virgules ; en SQLite,
+# chemins de fichiers (le fichier principal lui-même pour essayer le routage en local)
+# DB_REPLICA_DELAI : secondes de lecture sur la base principale après une écriture
+
+DATABASE_REPLICAS = []
+for _numero, _cible in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _replique = copy.deepcopy(DATABASES['default'])
+    if DB_ENGINE == 'sqlite':
+        _replique['NAME'] = _cible.strip()
+    else:
+        _hote, _, _port = _cible.strip().partition(':')
+        _replique.update(HOST=_hote, PORT=_port or _replique['PORT'])
+    # Les tests n'ont pas de réplique : ses lectures utilisent la base de test principale
+    _replique['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{_numero}'] = _replique
+    DATABASE_REPLICAS.append(f'replica_{_numero}')
+
+DATABASE_ROUTERS = ['agri_market.routage_bdd.RouteurRepliques'] if DATABASE_REPLICAS else []
+DB_REPLICA_DELAI = int(os.environ.get('DB_REPLICA_DELAI', '5'))
+
+
+# Cache (cf. agri_market/mise_en_cache.py)
+# CACHE_BACKEND : 'locmem' (défaut, propre à chaque processus), 'fichier' (partagé
+# entre les workers d'une machine) ou 'redis' (partagé entre machines, nécessite redis-py)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    _cache_defaut = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL') or 'redis://127.0.0.1:6379/1',
+    }
+elif CACHE_BACKEND == 'fichier':
+    _cache_defaut = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_REPERTOIRE') or str(BASE_DIR / 'var' / 'cache'),
+    }
+else:
+    _cache_defaut = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'e_agri',
+    }
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'e_agri',
-        'USER': 'duford',
-        'PASSWORD': 'JUBRinal',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        **_cache_defaut,
+        'KEY_PREFIX': 'e_agri',
+        'TIMEOUT': 300,
     }
 }
 
 
+# Sessions
+# SESSION_BACKEND : 'cached_db' (défaut : lue dans le cache, écrite aussi en base),
+# 'cache' (cache seul, à réserver à un cache partagé et persistant), 'signed_cookies'
+# (aucun stockage serveur, session limitée à ~4 Ko) ou 'db' (une requête SQL par page)
+# Les sessions expirées des modes 'db' et 'cached_db' sont purgées par nettoyer_sessions
+
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_BACKEND]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -125,3 +238,74 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = os.environ.get('STATIC_ROOT') or str(BASE_DIR / 'staticfiles')
+
+# Fichiers envoyés par les utilisateurs (photos des produits)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT') or str(BASE_DIR / 'media')
+
+# STATIC_MANIFESTE : collectstatic produit des noms hachés (styles.3f2a9c1b7e4d.css),
+# leurs variantes .gz/.br et le manifeste utilisé par {% static %} (défaut hors DEBUG)
+# STATIC_SERVIR : Django sert lui-même STATIC_ROOT (sans nginx), cf. StatiquesMiddleware
+STATIC_MANIFESTE = _env_bool('STATIC_MANIFESTE', not DEBUG)
+STATIC_SERVIR = _env_bool('STATIC_SERVIR', False)
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'agri_market.stockage_statique.StockageStatiqueCompresse' if STATIC_MANIFESTE
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+
+# Métriques applicatives (endpoint /metrics)
+# Chaque processus écrit ses métriques dans ce répertoire, partagé par tous les workers
+
+METRIQUES_REPERTOIRE = os.environ.get(
+    'METRIQUES_REPERTOIRE',
+    os.path.join(tempfile.gettempdir(), 'e_agri_metriques')
+)
+METRIQUES_INTERVALLE_ECRITURE = 5  # secondes
+# Jeton Bearer du collecteur ; vide, /metrics n'est servi qu'au personnel connecté
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON', '')
+
+# Les tests écrivent leurs métriques dans un répertoire temporaire (jamais METRIQUES_REPERTOIRE)
+TEST_RUNNER = 'agri_market.lanceur_tests.LanceurTests'
+
+
+# Compteurs de vues des produits (cf. agri_market/compteur_vues.py) : écrits par lots,
+# au plus tard après VUES_INTERVALLE_VIDAGE secondes ou VUES_TAMPON_MAX produits distincts
+
+VUES_INTERVALLE_VIDAGE = int(os.environ.get('VUES_INTERVALLE_VIDAGE', 10))
+VUES_TAMPON_MAX = 1000
+
+# Passerelles de paiement en ligne (cf. agri_market/passerelles_paiement.py)
+# Mode de paiement -> classe de la passerelle et options ; le secret authentifie
+# les notifications reçues sur /paiements/notification/<mode>/
+
+PASSERELLES_PAIEMENT = {
+    'MOBILE_MONEY': {
+        'CLASSE': os.environ.get(
+            'PASSERELLE_MOBILE_MONEY', 'agri_market.passerelles_paiement.PasserelleSimulee'
+        ),
+        'OPTIONS': {'secret': os.environ.get('PASSERELLE_MOBILE_MONEY_SECRET', '')},
+    },
+    'CARTE': {
+        'CLASSE': os.environ.get(
+            'PASSERELLE_CARTE', 'agri_market.passerelles_paiement.PasserelleSimulee'
+        ),
+        'OPTIONS': {'secret': os.environ.get('PASSERELLE_CARTE_SECRET', '')},
+    },
+}
+
+
+# Budgets de requêtes SQL par vue (cf. agri_market/budget_requetes.py)
+# '' : désactivé, 'log' : avertissement, 'raise' : exception
+
+BUDGET_REQUETES_MODE = os.environ.get('BUDGET_REQUETES_MODE', 'log' if DEBUG else '')
+BUDGETS_REQUETES = {}
@@ -0,0 +1,15 @@
+"""
+Configuration des URLs du déploiement ASGI (réglage VUES_ASYNC)
+
+Les routes du catalogue pointent vers les vues asynchrones ; toutes les
+autres restent celles de e_agri.urls.
+"""
+
+from django.urls import path, include
+
+from .urls import urlpatterns as urlpatterns_synchrones
+
+urlpatterns = [
+    path('', include('agri_market.urls_async')),
+    *urlpatterns_synchrones,
+]